@@ -1,16 +1,26 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, session
+from werkzeug.local import LocalProxy
 import json
 from datetime import datetime, timedelta, date
 import uuid
+from collections import OrderedDict
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 import sys
 import os
 import pytz
 import math
+import bisect
 import xmlrpc.client
 import ssl
 import logging
+import threading
+import time
+import select
+import functools
+import queue
+from concurrent.futures import ThreadPoolExecutor
 
 # # Configuration du chemin Odoo
 # ODOO_PATH = '/opt/odoo14'
@@ -28,24 +38,65 @@ try:
 except ImportError:
     sys.exit(1)
 
+# Taille des pools de connexions et délai d'inactivité avant vérification (optionnels)
+try:
+    from config import DB_POOL_MINCONN, DB_POOL_MAXCONN, DB_POOL_CHECK_IDLE_SECONDS
+except ImportError:
+    DB_POOL_MINCONN = 1
+    DB_POOL_MAXCONN = 10
+    DB_POOL_CHECK_IDLE_SECONDS = 30
+
+# Attente maximale d'une connexion libre quand le pool est épuisé (optionnel)
+try:
+    from config import DB_POOL_WAIT_SECONDS
+except ImportError:
+    DB_POOL_WAIT_SECONDS = 5
+DB_POOL_WAIT_INTERVAL_SECONDS = 0.05
+
+# Cache des plannings chargés, partagé entre les sessions (optionnel)
+try:
+    from config import PLANNING_CACHE_MAX_PLANNINGS, PLANNING_CACHE_MAX_TASKS
+except ImportError:
+    PLANNING_CACHE_MAX_PLANNINGS = 8
+    PLANNING_CACHE_MAX_TASKS = 200000
+
+# Rechargements (/api/reload-data) exécutés en arrière-plan en parallèle (optionnel)
+try:
+    from config import RELOAD_JOB_WORKERS
+except ImportError:
+    RELOAD_JOB_WORKERS = 2
+
 app = Flask(__name__)
 
+# Clé de signature des cookies de session (base et planning choisis par chaque utilisateur).
+# Doit être identique pour tous les workers : à définir dans config.py
+try:
+    from config import SECRET_KEY
+except ImportError:
+    SECRET_KEY = None
+
 # Configuration du logging
 gunicorn_logger = logging.getLogger('gunicorn.error')
 app.logger.handlers = gunicorn_logger.handlers
 app.logger.setLevel(gunicorn_logger.level)
 logger = app.logger
 
-# Configuration de base de données actuelle
-CURRENT_DATABASE_CONFIG = DATABASE_CONFIG.copy()
-CURRENT_DATABASE_NAME = ""
-CURRENT_DATABASE_URL_ODOO = ""
-CURRENT_DATABASE_URL_TACHE_ODOO = ""
-CURRENT_XMLRPC_LOGIN = ""
-CURRENT_XMLRPC_PASSWORD = ""
-CURRENT_XMLRPC_URL = ""
-CURRENT_PLANNING_ID = None
-CURRENT_PLANNING_END_DATE = None  # Date fin planning (date)
+if SECRET_KEY:
+    app.secret_key = SECRET_KEY
+else:
+    app.secret_key = os.urandom(32)
+    logger.warning("SECRET_KEY non défini dans config.py : les sessions ne sont valables que pour ce processus")
+
+PLANNING_META_CHECK_SECONDS = 30  # Intervalle minimum entre deux contrôles de write_date
+# Canal des notifications PostgreSQL émises par les triggers de is_gestion_tache (module Odoo) :
+# chaque processus (worker gunicorn) recharge les tâches modifiées par les autres
+PLANNING_NOTIFY_CHANNEL = 'is_gestion_tache'
+PLANNING_LISTENERS = {}  # database_id -> thread d'écoute des notifications de cette base
+PLANNING_LISTENERS_LOCK = threading.Lock()
+PLANNING_LISTENER_RETRY_SECONDS = 5  # Délai avant reconnexion après une erreur
+PLANNING_EVENT_QUEUE_SIZE = 100  # Événements en attente par navigateur avant de lui demander un rechargement
+PLANNING_EVENT_HEARTBEAT_SECONDS = 15  # Commentaire envoyé sur un flux inactif (proxies, déconnexions)
+RELOAD_JOB_RETENTION_SECONDS = 600  # Durée de conservation de l'état d'un rechargement terminé
 
 # Sérialiseur personnalisé pour les dates
 class DateTimeEncoder(json.JSONEncoder):
@@ -59,60 +110,212 @@ app.json_encoder = DateTimeEncoder
 SLOT_WIDTH = 25  # Largeur d'un créneau en pixels (divisé par 3 : 60 -> 20)
 ROW_HEIGHT = 55  # Hauteur d'une ligne d'opérateur
 HEADER_HEIGHT = 80  # Hauteur de l'en-tête
-NUM_SLOTS = 90  # Par défaut, sera recalculé après sélection d'un planning
+DEFAULT_NUM_SLOTS = 90  # Par défaut, sera recalculé après sélection d'un planning
 
 # Nouveaux paramètres
-#START_DATE =  (datetime.now() - timedelta(days=30)).date() # datetime.now().date()  # Date de début du planning (date du jour par défaut)
-START_DATE =  datetime.now().date()  # Date de début du planning (date du jour par défaut)
 DAY_DURATION_HOURS = 7  # Durée d'une journée en heures
 HALF_DAY_HOURS = DAY_DURATION_HOURS / 2  # Durée d'une demi-journée (AM ou PM)
 
 
+# Code des Fault XML-RPC d'Odoo pour AccessDenied (uid/mot de passe refusé)
+ODOO_XMLRPC_ACCESS_DENIED = 3
+
+
+class OdooXmlRpcClient:
+    """Client XML-RPC d'une base Odoo : l'uid est mis en cache après la première
+    authentification et la connexion HTTP(S) est gardée ouverte entre les appels (keep-alive,
+    une seule négociation TLS). Le transport n'étant pas thread-safe, les appels d'un même
+    client sont sérialisés."""
+
+    def __init__(self, url, db_name, login, password):
+        self.url = url
+        self.db_name = db_name
+        self.login = login
+        self.password = password
+        self.uid = None
+        self.lock = threading.Lock()
+        if url.startswith('https'):
+            # Contexte SSL sans vérification de certificat (redirection HTTP→HTTPS)
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+            transport = xmlrpc.client.SafeTransport(context=ssl_context)
+        else:
+            transport = xmlrpc.client.Transport()
+        # Un seul transport (donc une seule connexion) pour les deux points d'entrée
+        self.common = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/common', transport=transport)
+        self.models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object', transport=transport)
+
+    def _authenticate(self):
+        uid = self.common.authenticate(self.db_name, self.login, self.password, {})
+        if not uid:
+            raise PermissionError(f"échec d'authentification (db={self.db_name}, login={self.login})")
+        logger.info("XML-RPC : authentifié uid=%s", uid)
+        self.uid = uid
+
+    def execute_kw(self, model, method, args=None, kwargs=None):
+        """Appelle model.method ; s'authentifie au premier appel, et à nouveau si Odoo refuse
+        l'uid mis en cache (session invalidée, mot de passe changé...)"""
+        with self.lock:
+            for attempt in (0, 1):
+                if self.uid is None:
+                    self._authenticate()
+                try:
+                    return self.models.execute_kw(self.db_name, self.uid, self.password,
+                                                  model, method, args or [], kwargs or {})
+                except xmlrpc.client.Fault as e:
+                    if e.faultCode != ODOO_XMLRPC_ACCESS_DENIED or attempt:
+                        raise
+                    self.uid = None
+
+
+# Clients XML-RPC par base : id de la base -> OdooXmlRpcClient
+XMLRPC_CLIENTS = {}
+XMLRPC_CLIENTS_LOCK = threading.Lock()
+
+
+def get_odoo_client():
+    """Client XML-RPC de la base de la session (créé au premier appel, recréé si les paramètres
+    de connexion ont changé). None si les identifiants ne sont pas configurés"""
+    if not DATABASE.xmlrpc_url or not DATABASE.xmlrpc_login or not DATABASE.xmlrpc_password:
+        return None
+    url = DATABASE.xmlrpc_url.rstrip('/')
+    settings = (url, DATABASE.config.get('database', ''), DATABASE.xmlrpc_login, DATABASE.xmlrpc_password)
+    with XMLRPC_CLIENTS_LOCK:
+        client = XMLRPC_CLIENTS.get(DATABASE.id)
+        if client is None or (client.url, client.db_name, client.login, client.password) != settings:
+            client = OdooXmlRpcClient(*settings)
+            XMLRPC_CLIENTS[DATABASE.id] = client
+    return client
+
+def execute_odoo_xmlrpc(model, method, args=None, kwargs=None):
+    """Comme call_odoo_xmlrpc, mais les erreurs (xmlrpc.client.Fault, transport, identifiants
+    non configurés) sont levées"""
+    client = get_odoo_client()
+    if client is None:
+        raise RuntimeError("identifiants XML-RPC non configurés")
+    logger.info("XML-RPC : appel %s.%s(%s) sur %s (db=%s, login=%s)", model, method, args, client.url, client.db_name, client.login)
+    result = client.execute_kw(model, method, args, kwargs)
+    logger.info("XML-RPC : résultat = %s", result)
+    return result
+
 def call_odoo_xmlrpc(model, method, args=None, kwargs=None):
-    """Appelle une méthode sur un modèle Odoo via XML-RPC.
+    """Appelle une méthode sur un modèle Odoo via XML-RPC (client de la base de la session).
     Retourne le résultat ou None en cas d'erreur."""
-    if not CURRENT_XMLRPC_URL or not CURRENT_XMLRPC_LOGIN or not CURRENT_XMLRPC_PASSWORD:
+    if get_odoo_client() is None:
         logger.warning("XML-RPC : identifiants non configurés")
         return None
-    url = CURRENT_XMLRPC_URL.rstrip('/')
-    db_name = CURRENT_DATABASE_CONFIG.get('database', '')
-    logger.info("XML-RPC : appel %s.%s(%s) sur %s (db=%s, login=%s)", model, method, args, url, db_name, CURRENT_XMLRPC_LOGIN)
     try:
-        # Contexte SSL sans vérification de certificat (redirection HTTP→HTTPS)
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        common = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/common', context=ssl_context)
-        uid = common.authenticate(db_name, CURRENT_XMLRPC_LOGIN, CURRENT_XMLRPC_PASSWORD, {})
-        if not uid:
-            logger.error("XML-RPC : échec d'authentification (db=%s, login=%s)", db_name, CURRENT_XMLRPC_LOGIN)
-            return None
-        logger.info("XML-RPC : authentifié uid=%s", uid)
-        models_proxy = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object', context=ssl_context)
-        result = models_proxy.execute_kw(
-            db_name, uid, CURRENT_XMLRPC_PASSWORD,
-            model, method,
-            args or [],
-            kwargs or {}
-        )
-        logger.info("XML-RPC : résultat = %s", result)
-        return result
+        return execute_odoo_xmlrpc(model, method, args, kwargs)
     except Exception as e:
         logger.exception("XML-RPC erreur : %s", e)
         return None
 
+def is_odoo_missing_method_fault(error, method):
+    """Vrai si l'erreur est le Fault renvoyé par Odoo pour une méthode inexistante sur le
+    modèle (module Odoo pas à jour)"""
+    return (isinstance(error, xmlrpc.client.Fault) and "AttributeError" in error.faultString
+            and method in error.faultString)
+
+
+# Pools de connexions PostgreSQL : un pool par base de DATABASES (clé = id de la base,
+# None pour DATABASE_CONFIG), créé à la première utilisation
+DB_POOLS = {}
+DB_POOLS_LOCK = threading.Lock()
+# Connexions empruntées : id(conn) -> pool d'origine
+DB_BORROWED_CONNECTIONS = {}
+# Dernière restitution au pool : id(conn) -> time.monotonic()
+DB_CONNECTION_LAST_USED = {}
+
 
 # Fonctions de base de données
+def get_db_pool():
+    """Retourne le pool de connexions de la base courante (créé si nécessaire)"""
+    with DB_POOLS_LOCK:
+        pool = DB_POOLS.get(DATABASE.id)
+        if pool is None or pool.closed:
+            pool = ThreadedConnectionPool(DB_POOL_MINCONN, DB_POOL_MAXCONN, **DATABASE.config)
+            DB_POOLS[DATABASE.id] = pool
+        return pool
+
+def is_db_connection_alive(conn):
+    """Vérifie qu'une connexion du pool est encore utilisable.
+    Les connexions restées inactives plus de DB_POOL_CHECK_IDLE_SECONDS sont testées par un SELECT 1"""
+    if conn.closed:
+        return False
+    last_used = DB_CONNECTION_LAST_USED.get(id(conn))
+    if last_used is not None and time.monotonic() - last_used < DB_POOL_CHECK_IDLE_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def get_pool_connection(pool):
+    """Emprunte une connexion au pool ; s'il est épuisé (toutes les connexions empruntées),
+    attend qu'une connexion soit restituée, au plus DB_POOL_WAIT_SECONDS (PoolError ensuite)"""
+    deadline = time.monotonic() + DB_POOL_WAIT_SECONDS
+    while True:
+        try:
+            return pool.getconn()
+        except PoolError:
+            if pool.closed or time.monotonic() >= deadline:
+                raise
+            time.sleep(DB_POOL_WAIT_INTERVAL_SECONDS)
+
 def get_db_connection():
-    """Établit une connexion à la base PostgreSQL"""
+    """Emprunte une connexion à la base PostgreSQL depuis le pool de la base courante.
+    La connexion doit être restituée avec release_db_connection(). Retourne None (erreur
+    journalisée) si la base est injoignable ou si le pool reste épuisé"""
     try:
-        conn = psycopg2.connect(**CURRENT_DATABASE_CONFIG)
-        return conn
+        pool = get_db_pool()
+        # Les connexions mortes (serveur redémarré, timeout réseau...) sont écartées du pool
+        for _ in range(DB_POOL_MAXCONN + 1):
+            conn = get_pool_connection(pool)
+            if is_db_connection_alive(conn):
+                DB_BORROWED_CONNECTIONS[id(conn)] = pool
+                return conn
+            DB_CONNECTION_LAST_USED.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        logger.error("Base %s : aucune connexion utilisable dans le pool", DATABASE.id)
+        return None
+    except PoolError as e:
+        logger.error("Base %s : pool de connexions épuisé (%s connexions) après %ss d'attente : %s",
+                     DATABASE.id, DB_POOL_MAXCONN, DB_POOL_WAIT_SECONDS, e)
+        return None
     except psycopg2.Error as e:
+        logger.error("Base %s : connexion PostgreSQL impossible : %s", DATABASE.id, e)
         return None
 
+def release_db_connection(conn):
+    """Restitue une connexion au pool (sans effet si elle a déjà été restituée).
+    Une transaction restée ouverte est annulée avant restitution"""
+    if conn is None:
+        return
+    pool = DB_BORROWED_CONNECTIONS.pop(id(conn), None)
+    if pool is None:
+        return
+    discard = bool(conn.closed)
+    if not discard and conn.status != psycopg2.extensions.STATUS_READY:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            discard = True
+    if discard:
+        DB_CONNECTION_LAST_USED.pop(id(conn), None)
+    else:
+        DB_CONNECTION_LAST_USED[id(conn)] = time.monotonic()
+    try:
+        pool.putconn(conn, close=discard)
+    except psycopg2.Error:
+        pass
+
 def load_plannings_from_db():
     """Charge les plannings depuis la base PostgreSQL avec le nombre de tâches et d'affaires"""
+    conn = None
     try:
         conn = get_db_connection()
         if not conn:
@@ -142,14 +345,16 @@ def load_plannings_from_db():
                     "affaire_count": row['affaire_count'] or 0
                 })
             
-            conn.close()
             return plannings
             
     except Exception as e:
         raise Exception(f"Erreur lors du chargement des plannings depuis la base de données: {str(e)}")
+    finally:
+        release_db_connection(conn)
 
 def load_affaires_from_db(planning_id=None):
     """Charge les affaires depuis la base PostgreSQL"""
+    conn = None
     try:
         conn = get_db_connection()
         if not conn:
@@ -175,20 +380,83 @@ def load_affaires_from_db(planning_id=None):
                         "color": row['color'] if row['color'] else "#808080"  # Couleur par défaut si NULL
                     })
                 
-            conn.close()
             return affaires
             
     except Exception as e:
         raise Exception(f"Erreur lors du chargement des affaires depuis la base de données: {str(e)}")
+    finally:
+        release_db_connection(conn)
 
 
-def get_type_donnees(cr,planning_id=None):
-    type_donnees = False
-    cr.execute("SELECT id,type_donnees FROM is_gestion_tache_planning WHERE id=%s"%planning_id)
-    rows= cr.fetchall()
-    for  row in rows:
-        type_donnees = row['type_donnees']
-    return type_donnees
+def load_planning_meta(planning_id):
+    """Charge (ou recharge) en mémoire les métadonnées du planning : nom, type de données,
+    poste de charge, date de fin, maj_of_auto et write_date.
+    Met aussi à jour end_date du planning"""
+    meta = None
+    if planning_id:
+        conn = get_db_connection()
+        if not conn:
+            raise Exception("Impossible de se connecter à la base de données PostgreSQL")
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute("""
+                    SELECT id, name, type_donnees, workcenter_id, date_fin_planning, maj_of_auto, write_date
+                    FROM is_gestion_tache_planning
+                    WHERE id = %s
+                """, (planning_id,))
+                row = cursor.fetchone()
+        finally:
+            release_db_connection(conn)
+        if row:
+            meta = dict(row)
+    return set_planning_meta(meta)
+
+def set_planning_meta(meta):
+    """Enregistre les métadonnées du planning en mémoire (et end_date)"""
+    # S'assurer d'avoir un objet date
+    if meta and isinstance(meta.get('date_fin_planning'), datetime):
+        meta['date_fin_planning'] = meta['date_fin_planning'].date()
+    # Métadonnées tenues par le contexte (pas par les instantanés) : simples affectations
+    planning = get_planning_context()
+    planning.meta = meta
+    planning.meta_checked_at = time.monotonic()
+    planning.end_date = meta.get('date_fin_planning') if meta else None
+    return meta
+
+def get_planning_meta(planning_id=None):
+    """Retourne les métadonnées en cache du planning (courant par défaut).
+    Le cache est rechargé si le planning demandé n'est pas celui en cache, ou si write_date
+    a changé en base (contrôle au plus une fois toutes les PLANNING_META_CHECK_SECONDS)"""
+    planning = get_planning_context()
+    planning_id = planning_id or planning.planning_id
+    if not planning_id:
+        return None
+    meta = planning.meta
+    if not meta or meta['id'] != planning_id:
+        return load_planning_meta(planning_id)
+    if time.monotonic() - planning.meta_checked_at >= PLANNING_META_CHECK_SECONDS:
+        planning.meta_checked_at = time.monotonic()
+        changed = False
+        conn = None
+        try:
+            conn = get_db_connection()
+            if conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT write_date FROM is_gestion_tache_planning WHERE id = %s", (planning_id,))
+                    row = cursor.fetchone()
+                changed = not row or row[0] != meta['write_date']
+        except Exception:
+            pass  # En cas d'erreur, garder les métadonnées en cache
+        finally:
+            release_db_connection(conn)
+        if changed:
+            return load_planning_meta(planning_id)
+    return meta
+
+def get_type_donnees(planning_id=None):
+    """Type de données du planning ('operation' ou 'of'), lu depuis le cache des métadonnées"""
+    meta = get_planning_meta(planning_id)
+    return meta['type_donnees'] if meta else False
 
 
 def load_operators_from_db(planning_id=None):
@@ -198,166 +466,273 @@ def load_operators_from_db(planning_id=None):
         cnx = get_db_connection()
         if not cnx:
             raise Exception("Impossible de se connecter à la base de données PostgreSQL")
-        cr = cnx.cursor(cursor_factory=RealDictCursor)
-        type_donnees = get_type_donnees(cr,planning_id)
-        # cr.execute("SELECT id,type_donnees FROM is_gestion_tache_planning WHERE id=%s"%planning_id)
-        # rows= cr.fetchall()
-        # type_donnees = False
-        # for  row in rows:
-        #     type_donnees = row['type_donnees']
-        if type_donnees:
-            if type_donnees=='operation':
-                cr.execute("""
-                    SELECT op.operator_id, he.name
-                    FROM is_gestion_tache_operateur op join hr_employee he on op.operator_id=he.id 
-                    WHERE planning_id = %s
-                    ORDER BY name
-                """, (planning_id,))
-                rows = cr.fetchall()
-                for i, row in enumerate(rows):
-                    operators.append({
-                        "id": row['operator_id'],
-                        "name": row['name'],
-                        "absences": []
-                    })
-            if type_donnees=='of':
-                cr.execute("""
-                    SELECT w.workcenter_id,mw.name
-                    FROM is_gestion_tache_workcenter w join mrp_workcenter mw on w.workcenter_id=mw.id 
-                    WHERE planning_id = %s
-                    ORDER BY name
-                """, (planning_id,))
-                rows = cr.fetchall()
-                for i, row in enumerate(rows):
-                    operators.append({
-                        "id": row['workcenter_id'],
-                        "name": row['name'],
-                        "absences": []
-                    })
-    cnx.close()
+        try:
+            cr = cnx.cursor(cursor_factory=RealDictCursor)
+            type_donnees = get_type_donnees(planning_id)
+            # cr.execute("SELECT id,type_donnees FROM is_gestion_tache_planning WHERE id=%s"%planning_id)
+            # rows= cr.fetchall()
+            # type_donnees = False
+            # for  row in rows:
+            #     type_donnees = row['type_donnees']
+            if type_donnees:
+                if type_donnees=='operation':
+                    cr.execute("""
+                        SELECT op.operator_id, he.name
+                        FROM is_gestion_tache_operateur op join hr_employee he on op.operator_id=he.id 
+                        WHERE planning_id = %s
+                        ORDER BY name
+                    """, (planning_id,))
+                    rows = cr.fetchall()
+                    for i, row in enumerate(rows):
+                        operators.append({
+                            "id": row['operator_id'],
+                            "name": row['name'],
+                            "absences": []
+                        })
+                if type_donnees=='of':
+                    cr.execute("""
+                        SELECT w.workcenter_id,mw.name
+                        FROM is_gestion_tache_workcenter w join mrp_workcenter mw on w.workcenter_id=mw.id 
+                        WHERE planning_id = %s
+                        ORDER BY name
+                    """, (planning_id,))
+                    rows = cr.fetchall()
+                    for i, row in enumerate(rows):
+                        operators.append({
+                            "id": row['workcenter_id'],
+                            "name": row['name'],
+                            "absences": []
+                        })
+        finally:
+            release_db_connection(cnx)
     return operators
 
 
 
 
 
-def load_tasks_from_db(planning_id=None):
-    """Charge les tâches depuis la base PostgreSQL"""
+# Dates des tâches converties par PostgreSQL : les colonnes Odoo sont en UTC (timestamp sans
+# fuseau) ; start_date est ramenée à l'heure de Paris puis recalée sur le début de son slot
+# (avant 12H = AM à 8H, après 12H = PM à 14H), end_date est convertie en heure de Paris
+TASK_LOCAL_DATES_SQL = """
+    date_trunc('day', tz.start_local) + CASE WHEN extract(hour FROM tz.start_local) < 12
+        THEN interval '8 hours' ELSE interval '14 hours' END AS start_date,
+    tz.end_local AS end_date
+"""
+TASK_LOCAL_DATES_JOIN_SQL = """
+    CROSS JOIN LATERAL (
+        SELECT (t.start_date AT TIME ZONE 'UTC') AT TIME ZONE 'Europe/Paris' AS start_local,
+               (t.end_date AT TIME ZONE 'UTC') AT TIME ZONE 'Europe/Paris' AS end_local
+    ) tz
+"""
+
+def load_tasks_from_db(planning_id=None, task_ids=None):
+    """Charge les tâches depuis la base PostgreSQL (seulement les tâches task_ids si précisé).
+    Les dates sont converties en heure de Paris et recalées sur les slots dans la requête"""
     tasks = []
     if planning_id:
+        task_filter = ""
+        params = (planning_id,)
+        if task_ids is not None:
+            task_filter = "AND t.id = ANY(%s)"
+            params = (planning_id, [int(task_id) for task_id in task_ids])
         cnx = get_db_connection()
         if not cnx:
             raise Exception("Impossible de se connecter à la base de données PostgreSQL")
-        utc_tz = pytz.UTC
-        paris_tz = pytz.timezone('Europe/Paris')
-        cr = cnx.cursor(cursor_factory=RealDictCursor)
-        type_donnees = get_type_donnees(cr,planning_id)
-        rows=False
-        if type_donnees=='operation':
-            cr.execute("""
-                SELECT 
-                    t.id, t.name, t.operator_id, t.affaire_id, t.start_date, t.duration_hours, t.end_date,
-                    t.operation_id, t.product_qty, t.production_id, t.is_derniere_date_prevue,
-                    l.name AS operation_name,
-                    mp.is_employe_ids_txt,
-                    mp.is_composants_non_disponibles,
-                    mp.name AS production_name,
-                    mp.is_date_prevue
-                FROM is_gestion_tache t
-                LEFT JOIN is_ordre_travail_line l ON l.id = t.operation_id
-                LEFT JOIN mrp_production mp ON mp.id = t.production_id
-                WHERE t.planning_id = %s
-                ORDER BY t.start_date, t.operator_id
-            """, (planning_id,))
-            rows = cr.fetchall()
-
-
-        if type_donnees=='of':
-            cr.execute("""
-                SELECT 
-                    t.id, t.name, 
-                    t.workcenter_id as operator_id, 
-                    t.affaire_id, t.start_date, t.duration_hours, t.end_date,
-                    t.operation_id, t.product_qty, t.production_id, t.is_derniere_date_prevue,
-                    null AS operation_name,
-                    mp.is_employe_ids_txt,
-                    mp.is_composants_non_disponibles,
-                    mp.name AS production_name,
-                    mp.is_date_prevue,
-                    mp.is_couleur_of
-                FROM is_gestion_tache t
-                LEFT JOIN mrp_production mp ON mp.id = t.production_id
-                WHERE t.planning_id = %s
-                ORDER BY t.start_date, t.operator_id
-            """, (planning_id,))
-            rows = cr.fetchall()
-
-
+        try:
+            cr = cnx.cursor(cursor_factory=RealDictCursor)
+            type_donnees = get_type_donnees(planning_id)
+            rows=False
+            if type_donnees=='operation':
+                cr.execute("""
+                    SELECT 
+                        t.id, t.name, t.operator_id, t.affaire_id, t.duration_hours,
+                        t.operation_id, t.product_qty, t.production_id, t.is_derniere_date_prevue,
+                        l.name AS operation_name,
+                        mp.is_employe_ids_txt,
+                        mp.is_composants_non_disponibles,
+                        mp.name AS production_name,
+                        mp.is_date_prevue,
+                        {local_dates}
+                    FROM is_gestion_tache t
+                    {local_dates_join}
+                    LEFT JOIN is_ordre_travail_line l ON l.id = t.operation_id
+                    LEFT JOIN mrp_production mp ON mp.id = t.production_id
+                    WHERE t.planning_id = %s {task_filter}
+                    ORDER BY t.start_date, t.operator_id, t.id
+                """.format(task_filter=task_filter, local_dates=TASK_LOCAL_DATES_SQL,
+                           local_dates_join=TASK_LOCAL_DATES_JOIN_SQL), params)
+                rows = cr.fetchall()
 
 
+            if type_donnees=='of':
+                cr.execute("""
+                    SELECT 
+                        t.id, t.name, 
+                        t.workcenter_id as operator_id, 
+                        t.affaire_id, t.duration_hours,
+                        t.operation_id, t.product_qty, t.production_id, t.is_derniere_date_prevue,
+                        null AS operation_name,
+                        mp.is_employe_ids_txt,
+                        mp.is_composants_non_disponibles,
+                        mp.name AS production_name,
+                        mp.is_date_prevue,
+                        mp.is_couleur_of,
+                        {local_dates}
+                    FROM is_gestion_tache t
+                    {local_dates_join}
+                    LEFT JOIN mrp_production mp ON mp.id = t.production_id
+                    WHERE t.planning_id = %s {task_filter}
+                    ORDER BY t.start_date, t.operator_id, t.id
+                """.format(task_filter=task_filter, local_dates=TASK_LOCAL_DATES_SQL,
+                           local_dates_join=TASK_LOCAL_DATES_JOIN_SQL), params)
+                rows = cr.fetchall()
+        finally:
+            release_db_connection(cnx)
 
         if type_donnees and rows:
 
-            for i, row in enumerate(rows):
-
-                # Convertir l'heure UTC en heure de Paris
-                start_date_utc = row['start_date']
-                if start_date_utc.tzinfo is None:
-                    # Si pas de timezone, on assume que c'est UTC
-                    start_date_utc = utc_tz.localize(start_date_utc)
-                elif start_date_utc.tzinfo != utc_tz:
-                    # Convertir vers UTC si ce n'est pas déjà le cas
-                    start_date_utc = start_date_utc.astimezone(utc_tz)
-                
-                # Convertir vers l'heure de Paris
-                start_date_paris = start_date_utc.astimezone(paris_tz)
-                
-                # Déterminer le slot selon la logique : avant 12H = AM, après 12H = PM
-                paris_hour = start_date_paris.hour
-                if paris_hour < 12:
-                    # Slot AM (8H)
-                    adjusted_start_date = start_date_paris.replace(hour=8, minute=0, second=0, microsecond=0)
-                else:
-                    # Slot PM (14H)
-                    adjusted_start_date = start_date_paris.replace(hour=14, minute=0, second=0, microsecond=0)
-                
-                # Convertir en datetime naïf (sans timezone) pour compatibilité avec le reste du code
-                adjusted_start_date = adjusted_start_date.replace(tzinfo=None)
-                
-                # Traiter end_date de la même manière
-                end_date_converted = None
-                if row.get('end_date'):
-                    end_date_utc = row['end_date']
-                    if end_date_utc.tzinfo is None:
-                        end_date_utc = utc_tz.localize(end_date_utc)
-                    elif end_date_utc.tzinfo != utc_tz:
-                        end_date_utc = end_date_utc.astimezone(utc_tz)
-                    end_date_paris = end_date_utc.astimezone(paris_tz)
-                    end_date_converted = end_date_paris.replace(tzinfo=None)
-                
-                # Convertir les données de la base vers le format attendu par l'application
-                task = {
-                    "id": str(row['id']),  # Convertir en string pour compatibilité
-                    "operator_id": row['operator_id'],
-                    "affaire_id": row['affaire_id'],
-                    "start_date": adjusted_start_date,  # Utiliser la date ajustée
-                    "duration_hours": float(row['duration_hours']),  # S'assurer que c'est un float
-                    "name": row['name'],
-                    "operation_id": row.get('operation_id'),
-                    "operation_name": row.get('operation_name'),
-                    "product_qty": row.get('product_qty'),
-                    "is_employe_ids_txt": row.get('is_employe_ids_txt'),
-                    "is_derniere_date_prevue": row.get('is_derniere_date_prevue'),
-                    "is_composants_non_disponibles": row.get('is_composants_non_disponibles'),
-                    "production_name": row.get('production_name'),
-                    "is_date_prevue": row.get('is_date_prevue'),
-                    "end_date": end_date_converted,
-                    "color": row.get('is_couleur_of') if type_donnees == 'of' else None
-                }
-                tasks.append(task)
+            for row in rows:
+                tasks.append(build_task_from_row(row, type_donnees))
             
             cr.close()
         return tasks
+
+def build_task_from_row(row, type_donnees):
+    """Convertit une ligne de tâche de la base vers le format attendu par l'application"""
+    return Task(**{
+        "id": str(row['id']),  # Convertir en string pour compatibilité
+        "operator_id": row['operator_id'],
+        "affaire_id": row['affaire_id'],
+        "start_date": row['start_date'],  # Heure de Paris, recalée sur le slot
+        "duration_hours": float(row['duration_hours']),  # S'assurer que c'est un float
+        "name": row['name'],
+        "operation_id": row.get('operation_id'),
+        "operation_name": row.get('operation_name'),
+        "product_qty": float(row['product_qty']) if row.get('product_qty') is not None else None,
+        "is_employe_ids_txt": row.get('is_employe_ids_txt'),
+        "is_derniere_date_prevue": row.get('is_derniere_date_prevue'),
+        "is_composants_non_disponibles": row.get('is_composants_non_disponibles'),
+        "production_id": row.get('production_id'),
+        "production_name": row.get('production_name'),
+        "is_date_prevue": row.get('is_date_prevue'),
+        "end_date": row['end_date'],
+        "color": row.get('is_couleur_of') if type_donnees == 'of' else None
+    })
+
+# Planning complet (métadonnées, opérateurs/postes, affaires, tâches, fermetures) en un seul
+# document JSON : une requête, donc un aller-retour et un seul instantané de la base.
+# Les tâches et opérateurs des deux types de planning ('operation' / 'of') sont lus par les mêmes
+# sous-requêtes, filtrées sur p.type_donnees
+PLANNING_DATA_SQL = """
+    WITH p AS (
+        SELECT id, name, type_donnees, workcenter_id, date_fin_planning, maj_of_auto, write_date
+        FROM is_gestion_tache_planning
+        WHERE id = %(planning_id)s
+    )
+    SELECT json_build_object(
+        'meta', (SELECT row_to_json(p) FROM p),
+        'operators', (
+            SELECT coalesce(json_agg(o ORDER BY o.name), '[]')
+            FROM (
+                SELECT op.operator_id AS id, he.name
+                FROM p
+                JOIN is_gestion_tache_operateur op ON op.planning_id = p.id
+                JOIN hr_employee he ON he.id = op.operator_id
+                WHERE p.type_donnees = 'operation'
+                UNION ALL
+                SELECT w.workcenter_id AS id, mw.name
+                FROM p
+                JOIN is_gestion_tache_workcenter w ON w.planning_id = p.id
+                JOIN mrp_workcenter mw ON mw.id = w.workcenter_id
+                WHERE p.type_donnees = 'of'
+            ) o
+        ),
+        'affairs', (
+            SELECT coalesce(json_agg(a ORDER BY a.name), '[]')
+            FROM (
+                SELECT id, name, coalesce(nullif(color, ''), '#808080') AS color
+                FROM is_gestion_tache_affaire
+                WHERE planning_id = %(planning_id)s
+            ) a
+        ),
+        'tasks', (
+            -- Même ordre que load_tasks_from_db : dates brutes (avant recalage sur les slots)
+            SELECT coalesce(json_agg(x ORDER BY t.start_date, t.operator_id, t.id), '[]')
+            FROM p
+            JOIN is_gestion_tache t ON t.planning_id = p.id
+            {local_dates_join}
+            LEFT JOIN is_ordre_travail_line l ON l.id = t.operation_id AND p.type_donnees = 'operation'
+            LEFT JOIN mrp_production mp ON mp.id = t.production_id
+            CROSS JOIN LATERAL (
+                SELECT
+                    t.id, t.name,
+                    CASE WHEN p.type_donnees = 'of' THEN t.workcenter_id ELSE t.operator_id END AS operator_id,
+                    t.affaire_id, t.duration_hours,
+                    t.operation_id, t.product_qty, t.production_id, t.is_derniere_date_prevue,
+                    l.name AS operation_name,
+                    mp.is_employe_ids_txt,
+                    mp.is_composants_non_disponibles,
+                    mp.name AS production_name,
+                    mp.is_date_prevue,
+                    mp.is_couleur_of,
+                    {local_dates}
+            ) x
+            WHERE p.type_donnees IN ('operation', 'of')
+        ),
+        'fermetures', (
+            SELECT coalesce(json_agg(c), '[]')
+            FROM (
+                SELECT f.date_fermeture, f.operator_id, f.workcenter_id, f.periode
+                FROM p
+                JOIN is_gestion_tache_fermeture f ON f.planning_id = p.id
+                -- Plannings OF : seulement les fermetures du poste de charge ou générales
+                WHERE p.type_donnees IS DISTINCT FROM 'of' OR p.workcenter_id IS NULL
+                   OR f.workcenter_id = p.workcenter_id OR f.workcenter_id IS NULL
+            ) c
+        )
+    )::text
+""".format(local_dates=TASK_LOCAL_DATES_SQL, local_dates_join=TASK_LOCAL_DATES_JOIN_SQL)
+
+def _parse_json_date(value):
+    """Date ('2025-03-03') ou date/heure ('2025-03-03T08:00:00') d'un document JSON PostgreSQL"""
+    if value is None:
+        return None
+    if 'T' in value:
+        return datetime.fromisoformat(value)
+    return date.fromisoformat(value)
+
+def load_planning_from_db(planning_id):
+    """Charge tout le planning en une requête (PLANNING_DATA_SQL).
+    Retourne (meta, opérateurs, affaires, tâches, lignes de fermetures), meta = None si le
+    planning n'existe pas"""
+    conn = get_db_connection()
+    if not conn:
+        raise Exception("Impossible de se connecter à la base de données PostgreSQL")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(PLANNING_DATA_SQL, {'planning_id': planning_id})
+            data = json.loads(cursor.fetchone()[0])
+    finally:
+        release_db_connection(conn)
+
+    meta = data['meta']
+    if meta:
+        meta['date_fin_planning'] = _parse_json_date(meta['date_fin_planning'])
+        meta['write_date'] = _parse_json_date(meta['write_date'])
+    type_donnees = meta['type_donnees'] if meta else None
+
+    operators = [{"id": op['id'], "name": op['name'], "absences": []} for op in data['operators']]
+    affairs = data['affairs']
+    tasks = []
+    for row in data['tasks']:
+        for field in ('start_date', 'end_date', 'is_derniere_date_prevue', 'is_date_prevue'):
+            row[field] = _parse_json_date(row[field])
+        tasks.append(build_task_from_row(row, type_donnees))
+    fermetures = data['fermetures']
+    for row in fermetures:
+        row['date_fermeture'] = _parse_json_date(row['date_fermeture'])
+    return meta, operators, affairs, tasks, fermetures
             
 
 
@@ -436,151 +811,890 @@ def load_tasks_from_db(planning_id=None):
 
 def get_current_planning_type_donnees():
     """Récupère le type de données du planning actuel"""
-    if not CURRENT_PLANNING_ID:
-        return None
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return None
-        
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("SELECT type_donnees FROM is_gestion_tache_planning WHERE id = %s", (CURRENT_PLANNING_ID,))
-            result = cursor.fetchone()
-            conn.close()
-            return result['type_donnees'] if result else None
-    except Exception:
+    if not PLANNING.planning_id:
         return None
+    return get_type_donnees(PLANNING.planning_id) or None
+
+PARIS_TZ = pytz.timezone('Europe/Paris')
+
+@functools.lru_cache(maxsize=4096)
+def get_paris_utc_offset(day):
+    """Décalage UTC de l'heure de Paris pour une journée, calculé une fois par jour. Pris à
+    midi : les slots commencent à 8H ou 14H, après le changement d'heure de la nuit"""
+    return PARIS_TZ.utcoffset(datetime.combine(day, datetime.min.time().replace(hour=12)))
+
+def paris_to_utc(start_date):
+    """Convertit une date de l'application (naïve, heure de Paris) en UTC naïf, comme les
+    colonnes Odoo ; une date avec fuseau est convertie directement"""
+    if start_date.tzinfo is not None:
+        return start_date.astimezone(pytz.UTC).replace(tzinfo=None)
+    return start_date - get_paris_utc_offset(start_date.date())
+
+def utc_to_paris(date_utc):
+    """Convertit une date UTC naïve (colonnes Odoo) en heure de Paris naïve, comme
+    TASK_LOCAL_DATES_SQL"""
+    return pytz.UTC.localize(date_utc).astimezone(PARIS_TZ).replace(tzinfo=None)
+
+def get_task_end_date_utc(start_date, duration_hours):
+    """end_date enregistrée en base (UTC naïf) : fin calendaire des slots de la tâche
+    (1 journée = 24 heures calendaires = 2 slots, 1 slot = 12 heures calendaires)"""
+    return paris_to_utc(start_date) + timedelta(hours=hours_to_slots(duration_hours) * 12.0)
+
+def persist_task_changes():
+    """Enregistre en base uniquement les tâches modifiées en mémoire depuis le dernier
+    enregistrement (déplacements, poussées, redimensionnements).
+    Retourne la liste des tâches enregistrées, ou None en cas d'échec (les modifications
+    sont alors annulées en mémoire)."""
+    changed_tasks = PLANNING.store.changed_tasks()
+    if not changed_tasks:
+        return PLANNING.store.commit_changes()
+    tasks_to_update = [
+        {
+            'id': t['id'],
+            'operator_id': t['operator_id'],
+            'start_date': t['start_date'],
+            'duration_hours': t['duration_hours']
+        }
+        for t in changed_tasks
+    ]
+    if update_multiple_tasks_in_database(tasks_to_update):
+        for task in changed_tasks:
+            # end_date telle que relue en base : l'écho de l'enregistrement (notification) n'est
+            # pas une modification
+            task["end_date"] = utc_to_paris(get_task_end_date_utc(task["start_date"], task["duration_hours"]))
+        committed_tasks = PLANNING.store.commit_changes()
+        if committed_tasks:
+            publish_planning_changes(PLANNING.store.version, tasks=committed_tasks)
+        return committed_tasks
+    PLANNING.store.rollback_changes()
+    return None
+
+def build_task_changes(tasks):
+    """Nouvelle position des tâches modifiées par une opération (tâche déplacée et tâches
+    poussées), pour que le navigateur mette à jour le DOM sans nouvelle requête"""
+    changes = []
+    for task in tasks:
+        start_slot = get_task_start_slot(task)
+        changes.append({
+            "id": task["id"],
+            "operator_id": task["operator_id"],
+            "start_slot": start_slot,
+            "duration": get_task_span_slots(task, start_slot),
+        })
+    return changes
 
-def update_task_in_database(task_id, operator_id, start_date, duration_hours):
-    """Met à jour une tâche dans la base de données PostgreSQL"""
+def update_multiple_tasks_in_database(tasks_data):
+    """Met à jour plusieurs tâches dans la base de données en une seule requête
+    (UPDATE ... FROM (VALUES ...)) et une transaction"""
+    conn = None
     try:
         conn = get_db_connection()
         if not conn:
             return False
         
-        # Définir les fuseaux horaires
-        paris_tz = pytz.timezone('Europe/Paris')
-        utc_tz = pytz.UTC
-        
-        # Convertir la date de l'application vers UTC pour stockage en base
-        # start_date dans l'application est naive et représente l'heure locale (Paris)
-        if start_date.tzinfo is None:
-            # Utiliser localize() avec normalize() pour gérer correctement l'heure d'été
-            start_date_paris = paris_tz.normalize(paris_tz.localize(start_date))
-        else:
-            # Si elle a déjà une timezone, la convertir vers Paris
-            start_date_paris = start_date.astimezone(paris_tz)
-        
-        # Convertir vers UTC pour stockage en base
-        start_date_utc = start_date_paris.astimezone(utc_tz)
-        
-        # Calculer end_date basé sur les slots (fin calendaire)
-        # Convertir duration_hours en slots, puis calculer la date de fin du dernier slot
-        # 1 journée = 24 heures calendaires = 2 slots
-        # 1 slot = 12 heures calendaires
-        duration_slots = hours_to_slots(duration_hours)
-        SLOT_CALENDAR_HOURS = 12.0  # Heures calendaires par slot (24h / 2 slots)
-        
-        # Calculer la fin calendaire en ajoutant le nombre de slots en heures calendaires
-        end_date_utc = start_date_utc + timedelta(hours=duration_slots * SLOT_CALENDAR_HOURS)
-        
         # Déterminer le champ à mettre à jour selon le type de données
         type_donnees = get_current_planning_type_donnees()
         operator_field = "workcenter_id" if type_donnees == 'of' else "operator_id"
         
-        with conn.cursor() as cursor:
-            cursor.execute(f"""
-                UPDATE is_gestion_tache 
-                SET {operator_field} = %s, start_date = %s, duration_hours = %s, end_date = %s
-                WHERE id = %s
-            """, (operator_id, start_date_utc, duration_hours, end_date_utc, int(task_id)))
-            
-            rows_affected = cursor.rowcount
-            conn.commit()
-            conn.close()
+        values = []
+        for task_data in tasks_data:
+            start_date = task_data['start_date']
+            duration_hours = task_data['duration_hours']
             
-            return rows_affected > 0
+            # Convertir la date de l'application (heure de Paris) vers UTC (naïf, comme les
+            # colonnes Odoo) pour stockage en base, end_date basé sur les slots (fin calendaire)
+            start_date_utc = paris_to_utc(start_date)
+            end_date_utc = get_task_end_date_utc(start_date, duration_hours)
             
-    except Exception as e:
-        if conn:
-            conn.rollback()
-            conn.close()
-        return False
-
-def update_multiple_tasks_in_database(tasks_data):
-    """Met à jour plusieurs tâches dans la base de données en une transaction"""
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return False
+            values.append((int(task_data['id']), task_data['operator_id'], start_date_utc, duration_hours, end_date_utc))
         
-        # Définir les fuseaux horaires
-        paris_tz = pytz.timezone('Europe/Paris')
-        utc_tz = pytz.UTC
-        
-        # Déterminer le champ à mettre à jour selon le type de données
-        type_donnees = get_current_planning_type_donnees()
-        operator_field = "workcenter_id" if type_donnees == 'of' else "operator_id"
+        if not values:
+            return True
         
         with conn.cursor() as cursor:
-            for task_data in tasks_data:
-                task_id = task_data['id']
-                operator_id = task_data['operator_id']
-                start_date = task_data['start_date']
-                duration_hours = task_data['duration_hours']
-                
-                # Convertir la date de l'application vers UTC pour stockage en base
-                # start_date dans l'application est naive et représente l'heure locale (Paris)
-                if start_date.tzinfo is None:
-                    # Utiliser localize() avec normalize() pour gérer correctement l'heure d'été
-                    start_date_paris = paris_tz.normalize(paris_tz.localize(start_date))
-                else:
-                    # Si elle a déjà une timezone, la convertir vers Paris
-                    start_date_paris = start_date.astimezone(paris_tz)
-                
-                # Convertir vers UTC pour stockage en base
-                start_date_utc = start_date_paris.astimezone(utc_tz)
-                
-                # Calculer end_date basé sur les slots (fin calendaire)
-                # Convertir duration_hours en slots, puis calculer la date de fin du dernier slot
-                # 1 journée = 24 heures calendaires = 2 slots
-                # 1 slot = 12 heures calendaires
-                duration_slots = hours_to_slots(duration_hours)
-                SLOT_CALENDAR_HOURS = 12.0  # Heures calendaires par slot (24h / 2 slots)
-                
-                # Calculer la fin calendaire en ajoutant le nombre de slots en heures calendaires
-                end_date_utc = start_date_utc + timedelta(hours=duration_slots * SLOT_CALENDAR_HOURS)
-                
-                cursor.execute(f"""
-                    UPDATE is_gestion_tache 
-                    SET {operator_field} = %s, start_date = %s, duration_hours = %s, end_date = %s
-                    WHERE id = %s
-                """, (operator_id, start_date_utc, duration_hours, end_date_utc, int(task_id)))
+            # Une seule requête pour toutes les tâches (page_size = nombre de lignes)
+            execute_values(cursor, f"""
+                UPDATE is_gestion_tache AS t
+                SET {operator_field} = v.operator_id, start_date = v.start_date,
+                    duration_hours = v.duration_hours, end_date = v.end_date
+                FROM (VALUES %s) AS v(id, operator_id, start_date, duration_hours, end_date)
+                WHERE t.id = v.id
+            """, values, template="(%s, %s, %s::timestamp, %s, %s::timestamp)", page_size=len(values))
             
             conn.commit()
-            conn.close()
             return True
             
     except Exception as e:
         if conn:
             conn.rollback()
-            conn.close()
         return False
-
-# Dates de congés (orange clair) - format datetime
-# VACATION_DATES = [
-#     datetime(2025, 8, 15, 8, 0),   # 15 août AM
-#     datetime(2025, 8, 15, 14, 0),  # 15 août PM
-#     datetime(2025, 8, 25, 8, 0),   # 25 août AM
-#     datetime(2025, 8, 25, 14, 0),  # 25 août PM
-# ]
-VACATION_DATES = []
+    finally:
+        release_db_connection(conn)
 
 # Chargement dynamique des opérateurs depuis la base de données
 # Les données seront chargées lors de la sélection de la base de données
-OPERATORS = []
-AFFAIRES = []
-TASKS = []
+TASK_FIELDS = (
+    "id", "operator_id", "affaire_id", "start_date", "duration_hours", "name",
+    "operation_id", "operation_name", "product_qty", "is_employe_ids_txt",
+    "is_derniere_date_prevue", "is_composants_non_disponibles", "production_id", "production_name",
+    "is_date_prevue", "end_date", "color",
+)
+
+
+class Task:
+    """Tâche du planning en mémoire. Accessible comme un dict (task["start_date"]) pour rester
+    compatible avec le reste du code, mais avec __slots__ pour limiter la mémoire sur les gros
+    plannings. Met en cache start_slot / durée réelle / span, invalidés dès que start_date,
+    duration_hours ou operator_id changent, ou que les index de fermetures sont reconstruits."""
+    __slots__ = TASK_FIELDS + ("_slot_epoch", "_start_slot", "_real_duration_slots", "_span_slots")
+
+    def __init__(self, **values):
+        for field in TASK_FIELDS:
+            setattr(self, field, values.get(field))
+        self.invalidate()
+
+    def __getitem__(self, key):
+        if key not in TASK_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in TASK_FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+        if key in ("start_date", "duration_hours", "operator_id"):
+            self.invalidate()
+
+    def __contains__(self, key):
+        return key in TASK_FIELDS
+
+    def get(self, key, default=None):
+        if key not in TASK_FIELDS:
+            return default
+        return getattr(self, key)
+
+    def invalidate(self):
+        """Vide le cache des valeurs en slots"""
+        self._slot_epoch = None
+        self._start_slot = None
+        self._real_duration_slots = None
+        self._span_slots = None
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in TASK_FIELDS}
+
+    def freeze(self, version, position):
+        """Copie figée (TaskSnapshot) de la tâche pour un instantané du planning, avec les
+        valeurs en slots calculées d'avance : les lectures concurrentes n'écrivent pas dans la copie"""
+        get_task_span_slots(self)
+        frozen = TaskSnapshot.__new__(TaskSnapshot)
+        for name in Task.__slots__:
+            setattr(frozen, name, getattr(self, name))
+        frozen.version = version
+        frozen.position = position
+        return frozen
+
+
+class TaskSnapshot(Task):
+    """Tâche d'un instantané du planning (PlanningSnapshot) : en lecture seule, avec sa version
+    (dernière modification) et son rang de chargement"""
+    __slots__ = ("version", "position")
+
+    def __setitem__(self, key, value):
+        raise TypeError("Tâche d'un instantané du planning : lecture seule")
+
+
+class RowIntervalIndex:
+    """Intervalles [début, fin) (span, fermetures comprises) des tâches d'un opérateur, triés
+    par slot de début, avec le maximum cumulé des fins (max_ends[i] = max(ends[0..i])) pour
+    répondre aux requêtes de chevauchement en O(log n + k). Mis à jour à chaque déplacement ou
+    redimensionnement ; le maximum cumulé est recalculé paresseusement à partir du premier
+    rang modifié."""
+    __slots__ = ("starts", "ends", "tasks", "max_ends", "dirty_from", "entries")
+
+    def __init__(self, tasks):
+        entries = sorted(
+            ((get_task_start_slot(task), get_task_span_slots(task), task) for task in tasks),
+            key=lambda entry: entry[0],
+        )
+        self.starts = [start for start, _span, _task in entries]
+        self.ends = [start + span for start, span, _task in entries]
+        self.tasks = [task for _start, _span, task in entries]
+        self.entries = {task["id"]: start for start, _span, task in entries}
+        self.max_ends = []
+        self.dirty_from = 0
+
+    def _refresh_max_ends(self):
+        i = self.dirty_from
+        if i is None:
+            return
+        ends = self.ends
+        max_ends = self.max_ends
+        del max_ends[i:]
+        current = max_ends[-1] if max_ends else None
+        for end in ends[i:]:
+            current = end if current is None or end > current else current
+            max_ends.append(current)
+        self.dirty_from = None
+
+    def _mark_dirty(self, i):
+        if self.dirty_from is None or i < self.dirty_from:
+            self.dirty_from = i
+
+    def insert(self, task):
+        start = get_task_start_slot(task)
+        end = start + get_task_span_slots(task)
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.tasks.insert(i, task)
+        self.entries[task["id"]] = start
+        self._mark_dirty(i)
+
+    def remove(self, task):
+        start = self.entries.pop(task["id"], None)
+        if start is None:
+            return
+        i = bisect.bisect_left(self.starts, start)
+        while self.tasks[i] is not task:
+            i += 1
+        del self.starts[i]
+        del self.ends[i]
+        del self.tasks[i]
+        self._mark_dirty(i)
+
+    def overlapping(self, start_slot, span, exclude_task_id=None):
+        """Tâches dont l'intervalle chevauche [start_slot, start_slot + span), par ordre de début"""
+        self._refresh_max_ends()
+        end_slot = start_slot + span
+        result = []
+        # Seules les tâches qui commencent avant end_slot peuvent chevaucher ; on remonte tant
+        # qu'au moins une tâche précédente se termine après start_slot
+        i = bisect.bisect_left(self.starts, end_slot) - 1
+        while i >= 0 and self.max_ends[i] > start_slot:
+            if self.ends[i] > start_slot:
+                task = self.tasks[i]
+                if not (exclude_task_id and task["id"] == exclude_task_id):
+                    result.append(task)
+            i -= 1
+        result.reverse()
+        return result
+
+
+class PlanningStore:
+    """Données du planning chargé : opérateurs, affaires et tâches, indexés par id
+    (et tâches par opérateur) pour éviter les parcours linéaires de listes.
+    Chaque opérateur dispose en plus d'un RowIntervalIndex (construit à la demande) pour les
+    requêtes de collision.
+    Les tâches sont versionnées : version est incrémentée à chaque validation de modifications
+    (commit_changes) ou rechargement (set_tasks), et task_versions / deleted_task_versions
+    donnent la version de la dernière modification / suppression de chaque tâche. Un nouveau
+    store reprend la version de l'ancien (version croissante pour les clients).
+    token identifie l'historique de versions (un par planning chargé dans un processus) : deux
+    versions ne sont comparables que si elles ont le même token."""
+
+    def __init__(self, operators=None, affairs=None, tasks=None, version=0, token=None):
+        self.version = version
+        self.token = token or uuid.uuid4().hex[:12]
+        self.task_versions = {}
+        self.deleted_task_versions = {}
+        # Ids des tâches modifiées depuis le dernier instantané publié (snapshot_reset : tout
+        # l'instantané est à reconstruire)
+        self.snapshot_dirty = set()
+        self.snapshot_reset = True
+        self.set_operators(operators or [])
+        self.set_affairs(affairs or [])
+        self.set_tasks(tasks or [])
+        # Les suppressions antérieures à ce store ne sont pas connues : base_version est la plus
+        # ancienne version à partir de laquelle un delta peut être calculé
+        self.base_version = self.version
+
+    def set_operators(self, operators):
+        self.operators = operators  # Ordre de la requête SQL (ordre d'affichage)
+        self.operators_by_id = {op["id"]: op for op in operators}
+        self.snapshot_reset = True
+
+    def set_affairs(self, affairs):
+        self.affairs = affairs
+        self.affairs_by_id = {affair["id"]: affair for affair in affairs}
+        self.snapshot_reset = True
+
+    def set_tasks(self, tasks):
+        previous_tasks_by_id = getattr(self, "tasks_by_id", {})
+        self.version += 1
+        self.task_versions = {task["id"]: self.version for task in tasks}
+        self.tasks = tasks
+        self.tasks_by_id = {task["id"]: task for task in tasks}
+        for task_id in previous_tasks_by_id:
+            if task_id not in self.tasks_by_id:
+                self.deleted_task_versions[task_id] = self.version
+        # Rang de chargement : les listes par opérateur restent dans l'ordre de self.tasks
+        self.task_positions = {task["id"]: i for i, task in enumerate(tasks)}
+        self.next_position = len(tasks)
+        self.row_indexes = {}
+        self.row_index_epoch = None
+        # Valeurs d'origine (opérateur, début, durée) des tâches modifiées depuis le dernier enregistrement
+        self.pending_changes = {}
+        self.tasks_by_operator = {}
+        for task in tasks:
+            self.tasks_by_operator.setdefault(task["operator_id"], []).append(task)
+        self.snapshot_reset = True
+
+    def get_task(self, task_id):
+        return self.tasks_by_id.get(task_id)
+
+    def get_operator(self, operator_id):
+        return self.operators_by_id.get(operator_id)
+
+    def get_affair(self, affaire_id):
+        return self.affairs_by_id.get(affaire_id)
+
+    def get_operator_tasks(self, operator_id):
+        """Copie de la liste des tâches de l'opérateur (l'appelant peut la trier librement)"""
+        return list(self.tasks_by_operator.get(operator_id, ()))
+
+    def get_row_index(self, operator_id):
+        """Index d'intervalles de l'opérateur, reconstruit si l'horizon/les fermetures ont changé"""
+        epoch = get_slot_epoch()
+        if self.row_index_epoch != epoch:
+            self.row_indexes = {}
+            self.row_index_epoch = epoch
+        index = self.row_indexes.get(operator_id)
+        if index is None:
+            index = RowIntervalIndex(self.tasks_by_operator.get(operator_id, ()))
+            self.row_indexes[operator_id] = index
+        return index
+
+    def _existing_row_index(self, operator_id):
+        if self.row_index_epoch != get_slot_epoch():
+            return None
+        return self.row_indexes.get(operator_id)
+
+    def unindex_task(self, task):
+        """À appeler avant de modifier la position/durée d'une tâche"""
+        index = self._existing_row_index(task["operator_id"])
+        if index is not None:
+            index.remove(task)
+
+    def reindex_task(self, task):
+        """À appeler après avoir modifié la position/durée d'une tâche"""
+        index = self._existing_row_index(task["operator_id"])
+        if index is not None:
+            index.insert(task)
+
+    def track_task(self, task):
+        """Mémorise les valeurs d'origine d'une tâche avant sa première modification"""
+        if task["id"] not in self.pending_changes:
+            self.pending_changes[task["id"]] = (task["operator_id"], task["start_date"], task["duration_hours"])
+        self.snapshot_dirty.add(task["id"])
+
+    def changed_tasks(self):
+        """Tâches réellement modifiées depuis le dernier enregistrement (une tâche revenue à sa
+        position d'origine n'est pas retournée)"""
+        changed = []
+        for task_id, original in self.pending_changes.items():
+            task = self.tasks_by_id.get(task_id)
+            if task and (task["operator_id"], task["start_date"], task["duration_hours"]) != original:
+                changed.append(task)
+        return changed
+
+    def commit_changes(self):
+        """Valide les modifications en attente : les tâches réellement modifiées reçoivent une
+        nouvelle version. Retourne ces tâches"""
+        changed = self.changed_tasks()
+        if changed:
+            self.version += 1
+            for task in changed:
+                self.task_versions[task["id"]] = self.version
+        self.pending_changes = {}
+        return changed
+
+    def changes_since(self, since_version, token):
+        """(tâches modifiées, ids supprimés) depuis since_version, ou None si cette version est
+        antérieure au store ou d'un autre historique (token) : le client doit alors tout
+        recharger"""
+        if token != self.token or since_version < self.base_version or since_version > self.version:
+            return None
+        changed = [self.tasks_by_id[task_id] for task_id, version in self.task_versions.items()
+                   if version > since_version]
+        deleted = [task_id for task_id, version in self.deleted_task_versions.items()
+                   if version > since_version]
+        return changed, deleted
+
+    def rollback_changes(self):
+        """Remet en mémoire les valeurs d'origine des tâches modifiées"""
+        pending = self.pending_changes
+        for task_id, (operator_id, start_date, duration_hours) in pending.items():
+            task = self.tasks_by_id.get(task_id)
+            if not task:
+                continue
+            self.set_task_operator(task, operator_id)
+            self.unindex_task(task)
+            task["start_date"] = start_date
+            task["duration_hours"] = duration_hours
+            self.reindex_task(task)
+        self.pending_changes = {}
+
+    def set_task_operator(self, task, operator_id):
+        """Change l'opérateur d'une tâche en maintenant les index par opérateur"""
+        if task["operator_id"] == operator_id:
+            return
+        self.track_task(task)
+        self.unindex_task(task)
+        self._move_task_row(task, operator_id)
+        self.reindex_task(task)
+
+    def _move_task_row(self, task, operator_id):
+        old_tasks = self.tasks_by_operator.get(task["operator_id"])
+        if old_tasks is not None:
+            old_tasks.remove(task)
+        positions = self.task_positions
+        bisect.insort(self.tasks_by_operator.setdefault(operator_id, []), task,
+                      key=lambda t: positions[t["id"]])
+        task["operator_id"] = operator_id
+
+    def refresh_tasks(self, task_ids, tasks):
+        """Remplace en mémoire les tâches task_ids par leur version relue en base (tasks) après
+        une écriture d'un autre processus : tâches modifiées, créées, ou supprimées (ids absents
+        de tasks). Une seule nouvelle version pour l'ensemble.
+        Retourne (ids modifiés ou créés, ids supprimés)"""
+        loaded = {task["id"]: task for task in tasks}
+        changed_ids = []
+        deleted_ids = []
+        for task_id in task_ids:
+            task = self.tasks_by_id.get(task_id)
+            new_task = loaded.get(task_id)
+            self.pending_changes.pop(task_id, None)
+            self.snapshot_dirty.add(task_id)
+            if new_task is None:
+                if task is not None:
+                    self._remove_task(task)
+                    deleted_ids.append(task_id)
+            elif task is None:
+                self._add_task(new_task)
+                changed_ids.append(task_id)
+            elif self._update_task(task, new_task):
+                changed_ids.append(task_id)
+        if changed_ids or deleted_ids:
+            self.version += 1
+            for task_id in changed_ids:
+                self.task_versions[task_id] = self.version
+                self.deleted_task_versions.pop(task_id, None)
+            for task_id in deleted_ids:
+                self.task_versions.pop(task_id, None)
+                self.deleted_task_versions[task_id] = self.version
+        return changed_ids, deleted_ids
+
+    def _add_task(self, task):
+        self.tasks.append(task)
+        self.tasks_by_id[task["id"]] = task
+        self.task_positions[task["id"]] = self.next_position
+        self.next_position += 1
+        positions = self.task_positions
+        bisect.insort(self.tasks_by_operator.setdefault(task["operator_id"], []), task,
+                      key=lambda t: positions[t["id"]])
+        self.reindex_task(task)
+
+    def _remove_task(self, task):
+        self.unindex_task(task)
+        self.tasks.remove(task)
+        del self.tasks_by_id[task["id"]]
+        operator_tasks = self.tasks_by_operator.get(task["operator_id"])
+        if operator_tasks is not None:
+            operator_tasks.remove(task)
+        del self.task_positions[task["id"]]
+
+    def _update_task(self, task, new_task):
+        """Recopie new_task dans task ; retourne False si rien n'a changé (écho de nos propres
+        enregistrements : persist_task_changes tient end_date à jour en mémoire)"""
+        if all(task[field] == new_task[field] for field in TASK_FIELDS):
+            return False
+        self.unindex_task(task)
+        if new_task["operator_id"] != task["operator_id"]:
+            self._move_task_row(task, new_task["operator_id"])
+        for field in TASK_FIELDS:
+            task[field] = new_task[field]
+        self.reindex_task(task)
+        return True
+
+
+class PlanningStoreSnapshot:
+    """Instantané immuable du PlanningStore à une version donnée, lu sans verrou par les requêtes
+    de lecture pendant que les modifications se font dans le store.
+    Les tâches sont des copies figées (TaskSnapshot, avec leur version et leur rang) ; un nouvel
+    instantané reprend celles de l'instantané précédent et ne recopie que les tâches modifiées
+    (dirty_ids) et les lignes des opérateurs concernés. Les index d'intervalles des lignes sont
+    construits à la demande."""
+
+    def __init__(self, store, previous=None, dirty_ids=()):
+        self.source = store
+        self.version = store.version
+        self.token = store.token
+        self.base_version = store.base_version
+        self.operators = list(store.operators)
+        self.operators_by_id = store.operators_by_id.copy()
+        self.affairs = list(store.affairs)
+        self.affairs_by_id = store.affairs_by_id.copy()
+        self.deleted_task_versions = store.deleted_task_versions.copy()
+        self._tasks = None
+        task_versions = store.task_versions
+        positions = store.task_positions
+        if previous is None:
+            self.tasks_by_id = {task["id"]: task.freeze(task_versions[task["id"]], positions[task["id"]])
+                                for task in store.tasks}
+            self.rows = {
+                operator_id: tuple(self.tasks_by_id[task["id"]] for task in tasks)
+                for operator_id, tasks in store.tasks_by_operator.items()
+            }
+            self.row_indexes = {}
+            return
+        self.tasks_by_id = previous.tasks_by_id.copy()
+        touched_operators = set()
+        for task_id in dirty_ids:
+            old_task = self.tasks_by_id.pop(task_id, None)
+            if old_task is not None:
+                touched_operators.add(old_task["operator_id"])
+            task = store.tasks_by_id.get(task_id)
+            if task is not None:
+                self.tasks_by_id[task_id] = task.freeze(task_versions[task_id], positions[task_id])
+                touched_operators.add(task["operator_id"])
+        self.rows = previous.rows.copy()
+        for operator_id in touched_operators:
+            self.rows[operator_id] = tuple(self.tasks_by_id[task["id"]]
+                                           for task in store.tasks_by_operator.get(operator_id, ()))
+        # Copie (atomique) avant de filtrer : des lectures peuvent encore compléter l'ancien dict
+        row_indexes = previous.row_indexes.copy()
+        for operator_id in touched_operators:
+            row_indexes.pop(operator_id, None)
+        self.row_indexes = row_indexes
+
+    @property
+    def tasks(self):
+        """Tâches dans l'ordre de chargement (liste construite à la première lecture)"""
+        tasks = self._tasks
+        if tasks is None:
+            tasks = sorted(self.tasks_by_id.values(), key=lambda task: task.position)
+            self._tasks = tasks
+        return tasks
+
+    def get_task(self, task_id):
+        return self.tasks_by_id.get(task_id)
+
+    def get_operator(self, operator_id):
+        return self.operators_by_id.get(operator_id)
+
+    def get_affair(self, affaire_id):
+        return self.affairs_by_id.get(affaire_id)
+
+    def get_operator_tasks(self, operator_id):
+        return list(self.rows.get(operator_id, ()))
+
+    def get_row_index(self, operator_id):
+        index = self.row_indexes.get(operator_id)
+        if index is None:
+            index = RowIntervalIndex(self.rows.get(operator_id, ()))
+            # Maximum cumulé calculé avant publication : overlapping() ne modifie plus l'index
+            index._refresh_max_ends()
+            self.row_indexes[operator_id] = index
+        return index
+
+    def changes_since(self, since_version, token):
+        """Comme PlanningStore.changes_since, à partir des versions des tâches figées"""
+        if token != self.token or since_version < self.base_version or since_version > self.version:
+            return None
+        changed = [task for task in self.tasks_by_id.values() if task.version > since_version]
+        deleted = [task_id for task_id, version in self.deleted_task_versions.items()
+                   if version > since_version]
+        return changed, deleted
+
+
+# === CONTEXTES DE SESSION ===
+
+class DatabaseSettings:
+    """Paramètres d'une base de DATABASES : connexion PostgreSQL, URLs Odoo et identifiants XML-RPC"""
+    __slots__ = ("id", "name", "config", "url_odoo", "url_tache_odoo",
+                 "xmlrpc_login", "xmlrpc_password", "xmlrpc_url")
+
+    def __init__(self, database=None):
+        database = database or {}
+        self.id = database.get('id')
+        self.name = database.get('name', '')
+        if database:
+            self.config = {**DATABASE_BASE_CONFIG, 'database': database['database']}
+        else:
+            self.config = DATABASE_CONFIG.copy()
+        self.url_odoo = database.get('url_odoo', '')
+        self.url_tache_odoo = database.get('url_tache_odoo', '')
+        self.xmlrpc_login = database.get('xmlrpc_login', '')
+        self.xmlrpc_password = database.get('xmlrpc_password', '')
+        self.xmlrpc_url = database.get('xmlrpc_url', '')
+
+
+DATABASE_SETTINGS = {db['id']: DatabaseSettings(db) for db in DATABASES}
+DEFAULT_DATABASE_SETTINGS = DatabaseSettings()
+
+
+class PlanningContext:
+    """Planning chargé en mémoire pour une base : métadonnées, horizon (start_date, num_slots),
+    tâches (store), fermetures et index de slots fermés.
+    Partagé par toutes les sessions qui affichent ce planning (PLANNING_CACHE) ; refcount compte
+    les requêtes et flux SSE en cours, qui empêchent son éviction.
+    Les modifications se font sous write_lock, puis un nouvel instantané (snapshot) est publié
+    par une simple affectation ; les requêtes de lecture travaillent sur l'instantané, sans verrou."""
+
+    def __init__(self, database_id, planning_id):
+        self.database_id = database_id
+        self.planning_id = planning_id
+        self.loaded = planning_id is None  # Un contexte sans planning n'a rien à charger
+        self.refcount = 0
+        # Sérialise les modifications du planning en mémoire (requêtes et thread d'écoute)
+        self.write_lock = threading.RLock()
+        self.snapshot = None  # Dernier PlanningSnapshot publié
+        self.subscribers = set()  # Files des flux SSE abonnés (queue.Queue)
+        self.subscribers_lock = threading.Lock()
+        # Événements SSE en attente : envoyés à la publication de l'instantané qui les contient
+        self.pending_events = []
+        # Métadonnées (ligne is_gestion_tache_planning)
+        self.meta = None
+        self.meta_checked_at = 0.0  # time.monotonic() du dernier contrôle de write_date
+        self.end_date = None  # Date fin planning (date)
+        # Horizon affiché
+        self.start_date = datetime.now().date()  # Date de début du planning (date du jour par défaut)
+        self.num_slots = DEFAULT_NUM_SLOTS
+        self.slot_calendar = None  # SlotCalendar de l'horizon (start_date, num_slots) courant
+        self.store = PlanningStore()
+        # Dates de congés (orange clair) - format datetime
+        self.vacation_dates = []
+        # Index des slots fermés (week-ends, fermetures globales, absences) par opérateur/poste,
+        # reconstruits par build_closure_indexes() au chargement des fermetures
+        self.closure_indexes = {}  # operator_id -> ClosedSlotIndex
+        self.default_closure_index = None  # Week-ends + fermetures globales (opérateur inconnu)
+        self.closure_index_key = None  # (start_date, num_slots) ayant servi à construire les index
+        self.slot_epoch = 0  # Incrémenté à chaque reconstruction : invalide les slots mis en cache dans les tâches
+        self.vacation_slot_keys = set()  # {(date, heure)} des demi-journées de fermeture globale
+        self.absence_slot_keys = {}  # operator_id -> {(date, heure)} des demi-journées d'absence
+        self.vacation_slot_flags = bytearray()  # Bitmap des slots de fermeture globale sur [0, num_slots)
+
+    @property
+    def key(self):
+        return (self.database_id, self.planning_id)
+
+
+class PlanningSnapshot:
+    """Vue figée d'un PlanningContext à une version : horizon, fermetures et store
+    (PlanningStoreSnapshot). Même attributs que PlanningContext pour les fonctions de calcul en
+    slots ; les objets partagés (calendrier, index de fermetures) sont remplacés, jamais modifiés,
+    par les écritures."""
+    __slots__ = ('database_id', 'planning_id', 'start_date', 'num_slots', 'slot_calendar', 'store',
+                 'vacation_dates', 'closure_indexes', 'default_closure_index', 'closure_index_key',
+                 'slot_epoch', 'vacation_slot_keys', 'absence_slot_keys', 'vacation_slot_flags')
+
+    def __init__(self, planning, previous=None):
+        for name in PlanningSnapshot.__slots__:
+            if name != 'store':
+                setattr(self, name, getattr(planning, name))
+        store = planning.store
+        if (previous is None or previous.store.source is not store or store.snapshot_reset
+                or previous.slot_epoch != planning.slot_epoch):
+            # Nouveau store, opérateurs/affaires rechargés ou slots recalculés : tout recopier
+            self.store = PlanningStoreSnapshot(store)
+        else:
+            self.store = PlanningStoreSnapshot(store, previous.store, store.snapshot_dirty)
+
+    @property
+    def key(self):
+        return (self.database_id, self.planning_id)
+
+
+# Plannings chargés, du moins récemment utilisé au plus récent : (database_id, planning_id) -> PlanningContext
+PLANNING_CACHE = OrderedDict()
+PLANNING_CACHE_LOCK = threading.Lock()
+
+# Base et planning de la requête en cours (session), liés au thread qui la traite
+REQUEST_CONTEXT = threading.local()
+
+
+def bind_request_context(database_id, planning_id):
+    """Lie au thread courant la base et le planning choisis (le planning n'est chargé qu'à la
+    première utilisation). Libère le planning précédemment lié"""
+    unbind_request_context()
+    REQUEST_CONTEXT.database_id = database_id
+    REQUEST_CONTEXT.planning_id = planning_id
+    REQUEST_CONTEXT.planning = None
+    REQUEST_CONTEXT.snapshot = None
+
+def unbind_request_context():
+    planning = getattr(REQUEST_CONTEXT, 'planning', None)
+    if planning is not None and planning.planning_id is not None:
+        release_planning_context(planning)
+    REQUEST_CONTEXT.database_id = None
+    REQUEST_CONTEXT.planning_id = None
+    REQUEST_CONTEXT.planning = None
+    REQUEST_CONTEXT.snapshot = None
+
+def get_current_database():
+    """Paramètres de la base choisie pour la requête en cours"""
+    return DATABASE_SETTINGS.get(getattr(REQUEST_CONTEXT, 'database_id', None), DEFAULT_DATABASE_SETTINGS)
+
+def get_current_planning():
+    """Planning vu par la requête en cours : l'instantané lié par with_planning_snapshot pour
+    les lectures, sinon le contexte modifiable (get_planning_context)"""
+    snapshot = getattr(REQUEST_CONTEXT, 'snapshot', None)
+    if snapshot is not None:
+        return snapshot
+    return get_planning_context()
+
+def get_planning_context():
+    """Planning de la requête en cours, pris dans PLANNING_CACHE (chargé depuis la base s'il
+    n'y est pas). Sans planning choisi, un contexte vide propre à la requête"""
+    planning = getattr(REQUEST_CONTEXT, 'planning', None)
+    if planning is not None:
+        return planning
+    database_id = getattr(REQUEST_CONTEXT, 'database_id', None)
+    planning_id = getattr(REQUEST_CONTEXT, 'planning_id', None)
+    if planning_id is None:
+        planning = PlanningContext(database_id, None)
+        REQUEST_CONTEXT.planning = planning
+        return planning
+    planning = acquire_planning_context(database_id, planning_id)
+    REQUEST_CONTEXT.planning = planning
+    if not planning.loaded:
+        with planning.write_lock:
+            if not planning.loaded:
+                try:
+                    load_planning_context()
+                except Exception:
+                    discard_planning_context(planning)
+                    raise
+                publish_planning_snapshot()
+                planning.loaded = True
+    return planning
+
+def publish_planning_snapshot():
+    """Publie un nouvel instantané du planning de la requête (à appeler sous write_lock, en fin
+    de modification), puis envoie aux navigateurs les événements SSE en attente : un navigateur
+    qui relit le planning après un événement voit toujours ces modifications"""
+    planning = get_planning_context()
+    if planning.planning_id is None:
+        return
+    # Index de fermetures et calendrier à jour avant copie (l'instantané ne les reconstruit pas)
+    get_slot_epoch()
+    get_slot_calendar()
+    planning.snapshot = PlanningSnapshot(planning, planning.snapshot)
+    planning.store.snapshot_dirty = set()
+    planning.store.snapshot_reset = False
+    events, planning.pending_events = planning.pending_events, []
+    for event_id, data in events:
+        send_planning_event(planning, event_id, data)
+
+def get_planning_snapshot(planning):
+    """Dernier instantané publié du planning (publié ici s'il n'y en a pas encore)"""
+    snapshot = planning.snapshot
+    if snapshot is None:
+        with planning.write_lock:
+            if planning.snapshot is None:
+                publish_planning_snapshot()
+            snapshot = planning.snapshot
+    return snapshot
+
+def acquire_planning_context(database_id, planning_id):
+    """Contexte du planning (créé vide si absent du cache), marqué comme le plus récemment
+    utilisé ; à libérer par release_planning_context()"""
+    key = (database_id, planning_id)
+    with PLANNING_CACHE_LOCK:
+        planning = PLANNING_CACHE.get(key)
+        if planning is None:
+            planning = PlanningContext(database_id, planning_id)
+            PLANNING_CACHE[key] = planning
+        else:
+            PLANNING_CACHE.move_to_end(key)
+        planning.refcount += 1
+    return planning
+
+def retain_planning_context(planning):
+    """Référence supplémentaire sur un contexte déjà acquis (flux SSE)"""
+    with PLANNING_CACHE_LOCK:
+        planning.refcount += 1
+
+def release_planning_context(planning):
+    with PLANNING_CACHE_LOCK:
+        planning.refcount -= 1
+    evict_planning_contexts()
+
+def discard_planning_context(planning):
+    """Retire un contexte du cache (chargement en échec) : les requêtes suivantes le rechargent"""
+    with PLANNING_CACHE_LOCK:
+        if PLANNING_CACHE.get(planning.key) is planning:
+            del PLANNING_CACHE[planning.key]
+
+def evict_planning_contexts():
+    """Évince les plannings les moins récemment utilisés et sans référence tant que le cache
+    dépasse PLANNING_CACHE_MAX_PLANNINGS plannings ou PLANNING_CACHE_MAX_TASKS tâches
+    (plafond mémoire)"""
+    with PLANNING_CACHE_LOCK:
+        total_tasks = sum(len(planning.store.tasks) for planning in PLANNING_CACHE.values())
+        for key, planning in list(PLANNING_CACHE.items()):
+            if len(PLANNING_CACHE) <= PLANNING_CACHE_MAX_PLANNINGS and total_tasks <= PLANNING_CACHE_MAX_TASKS:
+                break
+            if planning.refcount > 0:
+                continue
+            del PLANNING_CACHE[key]
+            total_tasks -= len(planning.store.tasks)
+            logger.info("Cache des plannings : planning %s (base %s) évincé", planning.planning_id, planning.database_id)
+
+def load_planning_context():
+    """Charge le planning de la requête en cours : métadonnées, horizon, opérateurs, affaires,
+    tâches et fermetures"""
+    planning_id = PLANNING.planning_id
+
+    # Écouter les notifications de la base avant la lecture : un processus qui n'est pas passé
+    # par la sélection de base (démarré ou redémarré après) reçoit aussi les modifications
+    start_planning_listener()
+
+    # Tout le planning en une requête
+    meta, operators, affairs, tasks, fermetures = load_planning_from_db(planning_id)
+
+    # Métadonnées du planning (dont la date de fin)
+    set_planning_meta(meta)
+
+    # Calculer num_slots en fonction de la date du jour et de la date fin planning (2 slots/jour), min 60
+    today = date.today()
+    if PLANNING.end_date:
+        days_inclusive = (PLANNING.end_date - today).days + 1
+        required_slots = max(0, days_inclusive) * 2
+        PLANNING.num_slots = max(required_slots, 60)
+    else:
+        PLANNING.num_slots = max(60, PLANNING.num_slots)
+    
+    # Construire le store du planning en une fois
+    PLANNING.store = PlanningStore(operators=operators, affairs=affairs, tasks=tasks,
+                                   version=PLANNING.store.version, token=PLANNING.store.token)
+    
+    # Calculer la date de début du planning basée sur la première tâche
+    PLANNING.start_date = calculate_planning_start_date(PLANNING.store.tasks)
+    
+    # Recalculer num_slots en fonction de la nouvelle date de début
+    calculate_num_slots()
+    
+    # Fermetures (met à jour vacation_dates et les absences opérateurs)
+    try:
+        set_fermetures(fermetures)
+    finally:
+        build_closure_indexes()
+
+
+# Base et planning de la requête en cours (voir get_current_database / get_current_planning)
+DATABASE = LocalProxy(get_current_database)
+PLANNING = LocalProxy(get_current_planning)
+
+
+@app.before_request
+def bind_session_context():
+    bind_request_context(session.get('database_id'), session.get('planning_id'))
+
+@app.teardown_request
+def unbind_session_context(exc=None):
+    unbind_request_context()
 
 # Utilitaire: générer les datetimes AM/PM pour une date, selon la période fermée
 # (naïf, heure locale affichage)
@@ -594,33 +1708,31 @@ def _halfday_datetimes(d: date, periode='journee'):
 
 def load_fermetures_from_db(planning_id=None):
     """Charge les fermetures (is_gestion_tache_fermeture) et met à jour:
-    - VACATION_DATES: jours fermés globalement (tous les opérateurs ou enregistrements sans opérateur)
-    - OPERATORS[i]['absences']: demi-journées d'absence pour chaque opérateur
+    - vacation_dates: jours fermés globalement (tous les opérateurs ou enregistrements sans opérateur)
+    - store.operators[i]['absences']: demi-journées d'absence pour chaque opérateur
     """
-    global VACATION_DATES, OPERATORS
-    VACATION_DATES = []
+    try:
+        set_fermetures(_load_fermetures_from_db(planning_id))
+    finally:
+        # Les index de slots fermés sont reconstruits dans tous les cas (week-ends a minima)
+        build_closure_indexes()
+
+def _load_fermetures_from_db(planning_id):
+    """Lignes de is_gestion_tache_fermeture du planning ([] en cas d'erreur)"""
     if not planning_id:
-        return
+        return []
 
+    conn = None
+    rows = []
     try:
         conn = get_db_connection()
         if not conn:
-            return
+            return []
+        # Informations du planning (cache des métadonnées) pour filtrer selon le type
+        planning_info = get_planning_meta(planning_id)
+        if not planning_info:
+            return []
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            # Récupérer les informations du planning pour filtrer selon le type
-            cursor.execute(
-                """
-                SELECT type_donnees, workcenter_id 
-                FROM is_gestion_tache_planning 
-                WHERE id = %s
-                """,
-                (planning_id,),
-            )
-            planning_info = cursor.fetchone()
-            
-            if not planning_info:
-                return
-            
             type_donnees = planning_info.get('type_donnees')
             planning_workcenter_id = planning_info.get('workcenter_id')
             
@@ -649,22 +1761,33 @@ def load_fermetures_from_db(planning_id=None):
                 )
             
             rows = cursor.fetchall()
-
-        conn.close()
-
-        if not rows:
-            return
+    except Exception:
+        # En cas d'erreur, ne rien bloquer: pas de fermetures
+        rows = []
+    finally:
+        release_db_connection(conn)
+    return rows
+
+def set_fermetures(rows):
+    """Met à jour vacation_dates et les absences des opérateurs à partir des lignes de
+    fermetures. Les index de slots fermés sont à reconstruire ensuite (build_closure_indexes)"""
+    PLANNING.vacation_dates = []
+    if not rows:
+        return
+    try:
+        planning_info = get_planning_meta() or {}
+        type_donnees = planning_info.get('type_donnees')
 
         # Indexer opérateurs/workcenters pour set absences
         if type_donnees == 'of':
             # Pour les plannings OF, les "opérateurs" sont en fait des workcenters
-            operator_ids = [op['id'] for op in OPERATORS] if OPERATORS else []
+            operator_ids = [op['id'] for op in PLANNING.store.operators]
             operator_set = set(operator_ids)
             # Pour les plannings OF, les fermetures s'appliquent aux workcenters
             absences_by_operator = {op_id: set() for op_id in operator_ids}
         else:
             # Pour les plannings d'opérations, traitement classique avec les employés
-            operator_ids = [op['id'] for op in OPERATORS] if OPERATORS else []
+            operator_ids = [op['id'] for op in PLANNING.store.operators]
             operator_set = set(operator_ids)
             absences_by_operator = {op_id: set() for op_id in operator_ids}
         
@@ -705,8 +1828,8 @@ def load_fermetures_from_db(planning_id=None):
                     if effective_id in absences_by_operator:
                         absences_by_operator[effective_id].add(key)
 
-        # Renseigner absences sur OPERATORS en AM/PM
-        for op in OPERATORS:
+        # Renseigner absences sur les opérateurs en AM/PM
+        for op in PLANNING.store.operators:
             keys_for_op = absences_by_operator.get(op['id'], set())
             abs_halfdays = []
             for day, p in sorted(keys_for_op):
@@ -724,11 +1847,11 @@ def load_fermetures_from_db(planning_id=None):
                 if ops.issuperset(operator_set):
                     global_vacation_dates.extend(_halfday_datetimes(d, p))
 
-        VACATION_DATES = global_vacation_dates
+        PLANNING.vacation_dates = global_vacation_dates
 
     except Exception:
         # En cas d'erreur, ne rien bloquer: garder listes vides
-        VACATION_DATES = []
+        PLANNING.vacation_dates = []
 
 
 
@@ -758,19 +1881,18 @@ def calculate_planning_start_date(tasks):
     return earliest_date if earliest_date else datetime.now().date()
 
 def calculate_num_slots():
-    """Calcule NUM_SLOTS en fonction de START_DATE, CURRENT_PLANNING_END_DATE et TASKS"""
-    global START_DATE, NUM_SLOTS
+    """Calcule num_slots du planning en fonction de start_date, end_date et des tâches"""
     
-    if CURRENT_PLANNING_END_DATE:
-        days_inclusive = (CURRENT_PLANNING_END_DATE - START_DATE).days + 1
+    if PLANNING.end_date:
+        days_inclusive = (PLANNING.end_date - PLANNING.start_date).days + 1
         required_slots = max(0, days_inclusive) * 2
-        NUM_SLOTS = max(required_slots, 60)
+        PLANNING.num_slots = max(required_slots, 60)
     else:
         # Si pas de date de fin, calculer en fonction des tâches
-        if TASKS:
+        if PLANNING.store.tasks:
             # Trouver la dernière tâche
-            latest_date = START_DATE
-            for task in TASKS:
+            latest_date = PLANNING.start_date
+            for task in PLANNING.store.tasks:
                 task_date = task.get('start_date')
                 if task_date:
                     if isinstance(task_date, datetime):
@@ -783,11 +1905,85 @@ def calculate_num_slots():
                         latest_date = task_date_only
             
             # Ajouter quelques jours de marge après la dernière tâche
-            days_inclusive = (latest_date - START_DATE).days + 1 + 7  # +7 jours de marge
+            days_inclusive = (latest_date - PLANNING.start_date).days + 1 + 7  # +7 jours de marge
             required_slots = days_inclusive * 2
-            NUM_SLOTS = max(required_slots, 60)
+            PLANNING.num_slots = max(required_slots, 60)
         else:
-            NUM_SLOTS = max(60, NUM_SLOTS)
+            PLANNING.num_slots = max(60, PLANNING.num_slots)
+
+DAY_NAMES_FR = ('Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche')
+
+class SlotCalendar:
+    """Calendrier des slots de l'horizon [0, num_slots) à partir de start_date, construit une
+    fois par (start_date, num_slots) :
+    - datetimes[i] : date/heure du slot (8H pour AM, 14H pour PM), comme slot_to_date
+    - weekdays[i], iso_weeks[i] (année ISO, semaine ISO), periods[i] ('AM'/'PM'), weekend[i]
+    - day_offsets : date -> nombre de jours depuis start_date
+    - months / weeks / days / time_slots : en-têtes du planning (spans pré-calculés)"""
+    __slots__ = ('start_date', 'num_slots', 'datetimes', 'weekdays', 'iso_weeks', 'periods', 'weekend',
+                 'day_offsets', 'months', 'weeks', 'days', 'time_slots')
+
+    def __init__(self, start_date, num_slots):
+        self.start_date = start_date
+        self.num_slots = num_slots
+        self.datetimes = []
+        self.weekdays = []
+        self.iso_weeks = []
+        self.periods = []
+        self.weekend = bytearray(num_slots)
+        self.day_offsets = {}
+        self.months = []
+        self.weeks = []
+        self.days = []
+        self.time_slots = []
+
+        am_time = datetime.min.time().replace(hour=8)
+        pm_time = datetime.min.time().replace(hour=14)
+        for day_offset in range((num_slots + 1) // 2):
+            day = start_date + timedelta(days=day_offset)
+            self.day_offsets[day] = day_offset
+            weekday = day.weekday()
+            iso_year, iso_week, _ = day.isocalendar()
+            day_label = day.strftime("%d/%m")
+            day_name = DAY_NAMES_FR[weekday]
+            is_weekend = weekday in (5, 6)
+            first_slot = day_offset * 2
+
+            # Mois et semaines ISO (avec année) : nouvelle cellule quand la clé change
+            month_name = day.strftime("%m/%Y")
+            if not self.months or self.months[-1]["name"] != month_name:
+                self.months.append({"name": month_name, "start_slot": first_slot, "span": 0})
+            week_name = f"S{iso_week:02d}/{iso_year}"
+            if not self.weeks or self.weeks[-1]["name"] != week_name:
+                self.weeks.append({"name": week_name, "start_slot": first_slot, "span": 0})
+            self.days.append({"date": day_label, "start_slot": first_slot, "day_name": day_name})
+
+            for slot, slot_time, period in ((first_slot, am_time, "AM"), (first_slot + 1, pm_time, "PM")):
+                if slot >= num_slots:
+                    break
+                self.datetimes.append(datetime.combine(day, slot_time))
+                self.weekdays.append(weekday)
+                self.iso_weeks.append((iso_year, iso_week))
+                self.periods.append(period)
+                self.weekend[slot] = is_weekend
+                self.months[-1]["span"] += 1
+                self.weeks[-1]["span"] += 1
+                self.time_slots.append({
+                    "slot": slot,
+                    "date": day_label,
+                    "period": period,
+                    "day_name": day_name,  # Nom du jour en français
+                    "is_weekend": is_weekend,
+                })
+
+def get_slot_calendar():
+    """Calendrier des slots de l'horizon courant (reconstruit si start_date ou num_slots ont changé)"""
+    planning = get_current_planning()
+    calendar = planning.slot_calendar
+    if calendar is None or calendar.start_date != planning.start_date or calendar.num_slots != planning.num_slots:
+        calendar = SlotCalendar(planning.start_date, planning.num_slots)
+        planning.slot_calendar = calendar
+    return calendar
 
 def date_to_slot(task_date):
     """Convertit une date/datetime en numéro de slot"""
@@ -805,7 +2001,10 @@ def date_to_slot(task_date):
         task_datetime = datetime.combine(task_date, datetime.min.time().replace(hour=8))
     
     task_date_only = task_datetime.date()
-    days_diff = (task_date_only - START_DATE).days
+    calendar = get_slot_calendar()
+    days_diff = calendar.day_offsets.get(task_date_only)
+    if days_diff is None:
+        days_diff = (task_date_only - calendar.start_date).days
     
     hour = task_datetime.hour
     # Logique modifiée : avant 12H = AM (slot 0), après 12H = PM (slot 1)
@@ -816,7 +2015,6 @@ def date_to_slot(task_date):
 
 def hours_to_slots(hours):
     """Convertit un nombre d'heures en nombre de slots (arrondi à l'entier supérieur)"""
-    import math
     return int(math.ceil(hours / HALF_DAY_HOURS))
 
 def slots_to_hours(slots):
@@ -825,10 +2023,13 @@ def slots_to_hours(slots):
 
 def slot_to_date(slot):
     """Convertit un numéro de slot en date et heure"""
+    calendar = get_slot_calendar()
+    if 0 <= slot < calendar.num_slots:
+        return calendar.datetimes[slot]
     days_offset = slot // 2
     is_pm = slot % 2 == 1
     
-    result_date = START_DATE + timedelta(days=days_offset)
+    result_date = calendar.start_date + timedelta(days=days_offset)
     
     # Ajuster selon la nouvelle logique : AM = 8H, PM = 14H (mais basé sur 12H)
     if is_pm:
@@ -840,24 +2041,160 @@ def slot_to_date(slot):
 
 def get_task_start_slot(task):
     """Récupère le slot de début d'une tâche"""
-    return date_to_slot(task["start_date"])
+    _check_task_cache(task)
+    if task._start_slot is None:
+        task._start_slot = date_to_slot(task["start_date"])
+    return task._start_slot
 
 def get_task_duration_slots(task):
     """Récupère la durée réelle (travaillée) en slots d'une tâche, fermetures exclues"""
-    return hours_to_slots(task["duration_hours"])
+    _check_task_cache(task)
+    if task._real_duration_slots is None:
+        task._real_duration_slots = hours_to_slots(task["duration_hours"])
+    return task._real_duration_slots
+
+class ClosedSlotIndex:
+    """Slots fermés d'un opérateur/poste sur l'horizon [0, num_slots), pré-calculés une fois :
+    - closed : bitmap des slots fermés (week-end, fermeture globale, absence)
+    - absent : bitmap des seules absences de l'opérateur (affichage)
+    - open_prefix[i] : nombre de slots ouverts dans [0, i)
+    - open_positions[k] : k-ième slot ouvert (rang -> slot)
+    - next_open[i] / prev_open[i] : premier slot ouvert >= i / dernier slot ouvert <= i
+      (num_slots / -1 s'il n'y en a pas, comme la boucle de next_open_start_slot)
+    Les méthodes retournent None quand le calcul sort de l'horizon : l'appelant retombe
+    alors sur le parcours slot par slot."""
+    __slots__ = ('num_slots', 'closed', 'absent', 'open_prefix', 'open_positions', 'next_open', 'prev_open')
+
+    def __init__(self, closed, absent=None):
+        num_slots = len(closed)
+        self.num_slots = num_slots
+        self.closed = closed
+        self.absent = absent if absent is not None else bytearray(num_slots)
+        open_prefix = [0] * (num_slots + 1)
+        open_positions = []
+        for s in range(num_slots):
+            if closed[s]:
+                open_prefix[s + 1] = open_prefix[s]
+            else:
+                open_prefix[s + 1] = open_prefix[s] + 1
+                open_positions.append(s)
+        next_open = [num_slots] * num_slots
+        nxt = num_slots
+        for s in range(num_slots - 1, -1, -1):
+            if not closed[s]:
+                nxt = s
+            next_open[s] = nxt
+        prev_open = [-1] * num_slots
+        prv = -1
+        for s in range(num_slots):
+            if not closed[s]:
+                prv = s
+            prev_open[s] = prv
+        self.open_prefix = open_prefix
+        self.open_positions = open_positions
+        self.next_open = next_open
+        self.prev_open = prev_open
+
+    def span_slots(self, start_slot, real_duration_slots):
+        """Span pour `real_duration_slots` slots ouverts à partir de start_slot (O(1))"""
+        if not 0 <= start_slot < self.num_slots:
+            return None
+        k = self.open_prefix[start_slot] + real_duration_slots - 1
+        if k >= len(self.open_positions):
+            return None
+        return self.open_positions[k] + 1 - start_slot
+
+    def start_for_end(self, end_slot, real_duration_slots):
+        """Slot de départ pour finir à end_slot (exclu) avec `real_duration_slots` slots ouverts (O(1))"""
+        if not 0 <= end_slot <= self.num_slots:
+            return None
+        k = self.open_prefix[end_slot] - real_duration_slots
+        if k < 0:
+            return None
+        return self.open_positions[k]
+
+
+def build_closure_indexes():
+    """(Re)construit les index de slots fermés pour l'horizon (start_date, num_slots) courant à
+    partir de vacation_dates et des absences des opérateurs. Appelé par load_fermetures_from_db,
+    et de façon paresseuse si start_date ou num_slots ont changé depuis la dernière construction."""
+    planning = get_current_planning()
+    num_slots = planning.num_slots
+    planning.vacation_slot_keys = {(d.date(), d.hour) for d in planning.vacation_dates}
+    planning.absence_slot_keys = {
+        op['id']: {(d.date(), d.hour) for d in op.get('absences') or []}
+        for op in planning.store.operators
+    }
+
+    # Week-ends : même jour de semaine tous les 7 jours, inutile de passer par les dates
+    base = bytearray(get_slot_calendar().weekend)
+    vacation = bytearray(num_slots)
+    for vacation_date in planning.vacation_dates:
+        s = date_to_slot(vacation_date)
+        if 0 <= s < num_slots:
+            base[s] = 1
+            vacation[s] = 1
+
+    indexes = {}
+    for op in planning.store.operators:
+        closed = bytearray(base)
+        absent = bytearray(num_slots)
+        for absence_date in op.get('absences') or []:
+            s = date_to_slot(absence_date)
+            if 0 <= s < num_slots:
+                closed[s] = 1
+                absent[s] = 1
+        indexes[op['id']] = ClosedSlotIndex(closed, absent)
+
+    planning.closure_indexes = indexes
+    planning.vacation_slot_flags = vacation
+    planning.default_closure_index = ClosedSlotIndex(base)
+    planning.closure_index_key = (planning.start_date, num_slots)
+    planning.slot_epoch += 1
+
+def get_closure_index(operator_id):
+    """Index des slots fermés de l'opérateur (reconstruit si l'horizon a changé)"""
+    planning = get_current_planning()
+    if planning.closure_index_key != (planning.start_date, planning.num_slots):
+        build_closure_indexes()
+    return planning.closure_indexes.get(operator_id) or planning.default_closure_index
+
+def get_slot_epoch():
+    """Époque courante des calculs en slots (reconstruit les index si l'horizon a changé)"""
+    planning = get_current_planning()
+    if planning.closure_index_key != (planning.start_date, planning.num_slots):
+        build_closure_indexes()
+    return planning.slot_epoch
+
+def _check_task_cache(task):
+    """Vide le cache de la tâche s'il a été calculé avec un autre horizon/d'autres fermetures"""
+    epoch = get_slot_epoch()
+    if task._slot_epoch != epoch:
+        task.invalidate()
+        task._slot_epoch = epoch
 
 def is_closed_slot(slot, operator_id):
     """Vrai si le slot est fermé (week-end, fermeture globale/poste ou absence de l'opérateur)"""
+    index = get_closure_index(operator_id)
+    if 0 <= slot < index.num_slots:
+        return index.closed[slot] == 1
+    # Hors horizon : calcul à partir des dates
     return is_weekend_slot(slot) or is_vacation_slot(slot) or is_absence_slot(operator_id, slot)
 
 def compute_span_slots(start_slot, real_duration_slots, operator_id):
     """Nombre de slots occupés à l'écran pour réaliser `real_duration_slots` slots de travail
     réel à partir de start_slot : les slots fermés rencontrés en cours de route allongent
     le bloc (ils restent affichés, grisés, à l'intérieur) sans compter comme du travail."""
+    if real_duration_slots <= 0:
+        return 0
+    span = get_closure_index(operator_id).span_slots(start_slot, real_duration_slots)
+    if span is not None:
+        return span
+    # La tâche déborde de l'horizon : parcours slot par slot
     remaining = real_duration_slots
     slot = start_slot
     safety = 0
-    max_safety = (NUM_SLOTS + real_duration_slots) * 2 + 10
+    max_safety = (PLANNING.num_slots + real_duration_slots) * 2 + 10
     while remaining > 0 and safety < max_safety:
         if not is_closed_slot(slot, operator_id):
             remaining -= 1
@@ -867,7 +2204,19 @@ def compute_span_slots(start_slot, real_duration_slots, operator_id):
 
 def count_open_slots(start_slot, span, operator_id):
     """Compte le nombre de slots ouverts (travail réel) dans [start_slot, start_slot+span)"""
-    return sum(1 for s in range(start_slot, start_slot + span) if not is_closed_slot(s, operator_id))
+    index = get_closure_index(operator_id)
+    end_slot = start_slot + span
+    low = max(start_slot, 0)
+    high = min(end_slot, index.num_slots)
+    count = index.open_prefix[high] - index.open_prefix[low] if low < high else 0
+    # Parties éventuelles hors horizon
+    for s in range(start_slot, min(end_slot, 0)):
+        if not is_closed_slot(s, operator_id):
+            count += 1
+    for s in range(max(start_slot, index.num_slots), end_slot):
+        if not is_closed_slot(s, operator_id):
+            count += 1
+    return count
 
 def compute_start_for_end(end_slot, real_duration_slots, operator_id):
     """Calcule le slot de départ nécessaire pour qu'une tâche de `real_duration_slots` slots de
@@ -876,10 +2225,16 @@ def compute_start_for_end(end_slot, real_duration_slots, operator_id):
     Symétrique de compute_span_slots, utilisé pour caler une poussée vers la gauche sur une
     fin calendaire donnée (sans quoi le calcul approximatif peut faire déborder la tâche au-delà
     de la limite demandée quand une fermeture se trouve entre le départ naïf et cette limite)."""
+    if real_duration_slots <= 0:
+        return end_slot
+    start_slot = get_closure_index(operator_id).start_for_end(end_slot, real_duration_slots)
+    if start_slot is not None:
+        return start_slot
+    # Le départ tombe hors de l'horizon : parcours slot par slot
     remaining = real_duration_slots
     slot = end_slot
     safety = 0
-    max_safety = (NUM_SLOTS + real_duration_slots) * 2 + 10
+    max_safety = (PLANNING.num_slots + real_duration_slots) * 2 + 10
     while remaining > 0 and safety < max_safety:
         slot -= 1
         if not is_closed_slot(slot, operator_id):
@@ -890,190 +2245,164 @@ def compute_start_for_end(end_slot, real_duration_slots, operator_id):
 def get_task_span_slots(task, start_slot=None):
     """Span calendaire (en slots) occupé par la tâche à l'écran, fermetures comprises.
     À utiliser pour toute la logique de collision/poussée/affichage (jamais la durée réelle seule)."""
-    if start_slot is None:
-        start_slot = get_task_start_slot(task)
-    real_duration_slots = get_task_duration_slots(task)
-    return compute_span_slots(start_slot, real_duration_slots, task["operator_id"])
+    current_start_slot = get_task_start_slot(task)
+    if start_slot is not None and start_slot != current_start_slot:
+        # Span à une autre position que la position actuelle : pas de cache
+        return compute_span_slots(start_slot, get_task_duration_slots(task), task["operator_id"])
+    if task._span_slots is None:
+        task._span_slots = compute_span_slots(current_start_slot, get_task_duration_slots(task), task["operator_id"])
+    return task._span_slots
 
 def update_task_from_slots(task, start_slot, duration_slots):
     """Met à jour une tâche avec des valeurs en slots"""
     start_datetime = slot_to_date(start_slot)
     duration_hours = slots_to_hours(duration_slots)
     
+    store = PLANNING.store
+    store.track_task(task)
+    store.unindex_task(task)
     task["start_date"] = start_datetime
     task["duration_hours"] = duration_hours
-
-def get_affair_by_id(affaire_id):
-    return next((affair for affair in AFFAIRES if affair["id"] == affaire_id), None)
-
-def get_operator_by_id(operator_id):
-    return next((operator for operator in OPERATORS if operator["id"] == operator_id), None)
+    # Les valeurs en slots sont connues : les remettre en cache directement
+    task._slot_epoch = get_slot_epoch()
+    task._start_slot = start_slot
+    task._real_duration_slots = duration_slots
+    store.reindex_task(task)
 
 def is_weekend_slot(slot):
     """Vérifie si un slot tombe un samedi ou un dimanche"""
+    calendar = get_slot_calendar()
+    if 0 <= slot < calendar.num_slots:
+        return bool(calendar.weekend[slot])
     slot_datetime = slot_to_date(slot)
     return slot_datetime.weekday() in (5, 6)
 
 def is_vacation_slot(slot):
     """Vérifie si un slot correspond à une date de congé"""
+    planning = get_current_planning()
+    if planning.closure_index_key != (planning.start_date, planning.num_slots):
+        build_closure_indexes()
+    if 0 <= slot < len(planning.vacation_slot_flags):
+        return bool(planning.vacation_slot_flags[slot])
     slot_datetime = slot_to_date(slot)
-    for vacation_date in VACATION_DATES:
-        if (slot_datetime.date() == vacation_date.date() and 
-            slot_datetime.hour == vacation_date.hour):
-            return True
-    return False
+    return (slot_datetime.date(), slot_datetime.hour) in planning.vacation_slot_keys
 
 def is_absence_slot(operator_id, slot):
     """Vérifie si un slot correspond à une absence pour un opérateur donné"""
-    operator = get_operator_by_id(operator_id)
-    if not operator or "absences" not in operator:
+    absence_keys = get_current_planning().absence_slot_keys.get(operator_id)
+    if not absence_keys:
         return False
-    
+    index = get_closure_index(operator_id)
+    if 0 <= slot < index.num_slots:
+        return bool(index.absent[slot])
     slot_datetime = slot_to_date(slot)
-    for absence_date in operator["absences"]:
-        if (slot_datetime.date() == absence_date.date() and 
-            slot_datetime.hour == absence_date.hour):
-            return True
-    return False
+    return (slot_datetime.date(), slot_datetime.hour) in absence_keys
 
 def next_open_start_slot(operator_id, slot, direction=1):
     """Avance (direction=1) ou recule (direction=-1) depuis `slot` jusqu'au premier slot
     qui n'est ni un jour/demi-journée de fermeture globale, ni une absence de l'opérateur.
-    Utilisé pour recaler automatiquement une tâche déplacée/redimensionnée sur une période fermée."""
-    safety = 0
-    while 0 <= slot < NUM_SLOTS and (is_weekend_slot(slot) or is_vacation_slot(slot) or is_absence_slot(operator_id, slot)) and safety < NUM_SLOTS:
-        slot += direction
-        safety += 1
-    return slot
-
-def get_tasks_for_operator(operator_id):
-    return [task for task in TASKS if task["operator_id"] == operator_id]
+    Utilisé pour recaler automatiquement une tâche déplacée/redimensionnée sur une période fermée.
+    Retourne num_slots (ou -1 vers la gauche) s'il n'y a plus de slot ouvert dans l'horizon."""
+    index = get_closure_index(operator_id)
+    if not 0 <= slot < index.num_slots:
+        return slot
+    return index.next_open[slot] if direction > 0 else index.prev_open[slot]
 
 def check_collision(operator_id, start_slot, duration, exclude_task_id=None):
-    """Vérifie s'il y a collision avec une autre tâche (retourne la première trouvée)
+    """Vérifie s'il y a collision avec une autre tâche (retourne la première trouvée, par ordre de début)
     `duration` doit être le span (occupation à l'écran, fermetures comprises) de la position testée"""
-    tasks = get_tasks_for_operator(operator_id)
-    for task in tasks:
-        if exclude_task_id and task["id"] == exclude_task_id:
-            continue
-        task_start_slot = get_task_start_slot(task)
-        task_duration_slots = get_task_span_slots(task)
-        task_end = task_start_slot + task_duration_slots
-        new_end = start_slot + duration
-        
-        # Vérification de collision
-        if not (new_end <= task_start_slot or start_slot >= task_end):
-            return task
-    return None
+    colliding_tasks = get_all_colliding_tasks(operator_id, start_slot, duration, exclude_task_id)
+    return colliding_tasks[0] if colliding_tasks else None
 
 def get_all_colliding_tasks(operator_id, start_slot, duration, exclude_task_id=None):
-    """Retourne toutes les tâches qui sont en collision avec la position donnée"""
-    tasks = get_tasks_for_operator(operator_id)
-    colliding_tasks = []
-    
-    for task in tasks:
-        if exclude_task_id and task["id"] == exclude_task_id:
-            continue
-        task_start_slot = get_task_start_slot(task)
-        task_duration_slots = get_task_span_slots(task)
-        task_end = task_start_slot + task_duration_slots
-        new_end = start_slot + duration
-        
-        # Vérification de collision
-        if not (new_end <= task_start_slot or start_slot >= task_end):
-            colliding_tasks.append(task)
-    
-    return colliding_tasks
+    """Retourne toutes les tâches qui sont en collision avec la position donnée, par ordre de début"""
+    return PLANNING.store.get_row_index(operator_id).overlapping(start_slot, duration, exclude_task_id)
+
+def plan_push(operator_id, start_slot, duration, exclude_task_id=None, direction="right"):
+    """Calcule, sans rien modifier, le décalage des tâches de l'opérateur nécessaire pour libérer
+    [start_slot, start_slot + duration). `duration` doit être le span (occupation à l'écran,
+    fermetures comprises) de la position testée.
 
-def push_all_colliding_tasks_right(operator_id, start_slot, duration, exclude_task_id=None):
-    """Pousse toutes les tâches en collision vers la droite, en cascade
-    `duration` doit être le span (occupation à l'écran, fermetures comprises) de la position testée
+    Les tâches sont parcourues une seule fois dans l'ordre de l'index de la ligne :
+    - direction="right" : par début croissant, chaque tâche qui commence avant la frontière
+      courante est recalée sur le premier slot ouvert à partir de cette frontière ;
+    - direction="left" : par début décroissant, chaque tâche qui finit après la frontière
+      courante est recalée pour se terminer exactement sur cette frontière.
+    Les spans sont recalculés à chaque nouvelle position (fermetures comprises).
 
     Returns:
-        bool: True si toutes les tâches ont pu être déplacées, False sinon
+        list: [(tâche, nouveau slot de début)] dans l'ordre de traitement, ou None si une tâche
+        sortirait du planning (aucune modification n'est faite dans ce cas)
     """
-    # Obtenir toutes les tâches de l'opérateur, exclure la tâche qu'on déplace
-    all_tasks = get_tasks_for_operator(operator_id)
-    if exclude_task_id:
-        all_tasks = [task for task in all_tasks if task["id"] != exclude_task_id]
-
-    # Trier par position de début
-    all_tasks.sort(key=lambda x: get_task_start_slot(x))
-
-    new_task_end = start_slot + duration
-
-    # Trouver toutes les tâches qui sont réellement en collision avec la nouvelle position
-    tasks_to_push = []
-    for task in all_tasks:
-        task_start = get_task_start_slot(task)
-        task_duration = get_task_span_slots(task)
-        task_end = task_start + task_duration
-
-        # Vérification de collision réelle : les deux tâches se chevauchent
-        if not (new_task_end <= task_start or start_slot >= task_end):
-            tasks_to_push.append(task)
-
-    if not tasks_to_push:
-        return True  # Aucune tâche à pousser
-
-    # Trier les tâches en collision par position (de gauche à droite)
-    tasks_to_push.sort(key=lambda x: get_task_start_slot(x))
-
-    # Phase 1 : Déplacer les tâches en collision directe
-    cascade_tasks = []
-    current_position = new_task_end
-
-    for task in tasks_to_push:
+    index = PLANNING.store.get_row_index(operator_id)
+    index._refresh_max_ends()
+    starts, ends, tasks, max_ends = index.starts, index.ends, index.tasks, index.max_ends
+    plan = []
+
+    if direction == "left":
+        frontier = start_slot
+        i = bisect.bisect_left(starts, start_slot + duration) - 1
+        # Tant qu'une tâche commençant avant i atteint encore la frontière
+        while i >= 0 and max_ends[i] > frontier:
+            task = tasks[i]
+            if ends[i] > frontier and not (exclude_task_id and task["id"] == exclude_task_id):
+                real_duration = get_task_duration_slots(task)
+                # Se terminer exactement sur la frontière, fermetures internes comprises
+                new_start_slot = compute_start_for_end(frontier, real_duration, operator_id)
+                if new_start_slot < 0:
+                    return None
+                plan.append((task, new_start_slot))
+                frontier = new_start_slot
+            i -= 1
+        return plan
+
+    frontier = start_slot + duration
+    # Premières tâches dont la fin peut dépasser start_slot (max_ends est croissant)
+    for i in range(bisect.bisect_right(max_ends, start_slot), len(tasks)):
+        task = tasks[i]
+        if exclude_task_id and task["id"] == exclude_task_id:
+            continue
+        if ends[i] <= start_slot:
+            continue  # Entièrement avant le bloc
+        if starts[i] >= frontier:
+            break  # Cette tâche et toutes les suivantes sont déjà après la frontière
         # Ne jamais faire démarrer une tâche poussée sur un slot fermé
-        new_position = next_open_start_slot(operator_id, current_position, direction=1)
+        new_start_slot = next_open_start_slot(operator_id, frontier, direction=1)
         real_duration = get_task_duration_slots(task)
-        span_duration = compute_span_slots(new_position, real_duration, operator_id)
-
-        # Vérifier si cette nouvelle position crée une collision avec d'autres tâches
-        potential_collision = check_collision(operator_id, new_position, span_duration, task["id"])
+        span_slots = compute_span_slots(new_start_slot, real_duration, operator_id)
+        if new_start_slot + span_slots > PLANNING.num_slots:
+            return None  # Pas assez d'espace
+        plan.append((task, new_start_slot))
+        frontier = new_start_slot + span_slots
+    return plan
+
+def apply_slot_plan(plan):
+    """Applique un plan [(tâche, nouveau slot de début)] (durée réelle conservée).
+    Retourne la liste des tâches effectivement déplacées."""
+    moved_tasks = []
+    for task, new_start_slot in plan:
+        if new_start_slot != get_task_start_slot(task):
+            update_task_from_slots(task, new_start_slot, get_task_duration_slots(task))
+            moved_tasks.append(task)
+    return moved_tasks
+
+def push_tasks(operator_id, start_slot, duration, exclude_task_id=None, direction="right"):
+    """Pousse vers la droite ou la gauche toutes les tâches qui gênent le placement de
+    [start_slot, start_slot + duration) sur l'opérateur (voir plan_push).
 
-        if potential_collision and potential_collision not in tasks_to_push:
-            # Il y a une nouvelle collision, ajouter cette tâche à la cascade
-            cascade_tasks.append(potential_collision)
-
-        # Mettre à jour la position de cette tâche (durée réelle conservée)
-        update_task_from_slots(task, new_position, real_duration)
-        current_position = new_position + span_duration
-
-    # Phase 2 : Gérer les tâches en cascade (récursivement)
-    while cascade_tasks:
-        next_cascade = []
-        cascade_tasks.sort(key=lambda x: get_task_start_slot(x))
-        
-        for task in cascade_tasks:
-            # Ne jamais faire démarrer une tâche poussée sur un slot fermé
-            new_position = next_open_start_slot(operator_id, current_position, direction=1)
-            real_duration = get_task_duration_slots(task)
-            span_duration = compute_span_slots(new_position, real_duration, operator_id)
-
-            # Vérifier si on dépasse la limite
-            if new_position + span_duration > NUM_SLOTS:
-                return False  # Pas assez d'espace
-
-            # Vérifier les nouvelles collisions
-            potential_collision = check_collision(operator_id, new_position, span_duration, task["id"])
-
-            if potential_collision and potential_collision not in tasks_to_push and potential_collision not in cascade_tasks:
-                next_cascade.append(potential_collision)
+    Returns:
+        list: tâches déplacées (éventuellement vide), ou None si le déplacement est impossible
+    """
+    plan = plan_push(operator_id, start_slot, duration, exclude_task_id, direction)
+    if plan is None:
+        return None
+    return apply_slot_plan(plan)
 
-            # Mettre à jour la position (durée réelle conservée)
-            update_task_from_slots(task, new_position, real_duration)
-            current_position = new_position + span_duration
-        
-        # Préparer la prochaine itération
-        cascade_tasks = next_cascade
-    
-    return True
 
 def handle_keyboard_push(task_id, direction):
     """Gère la poussée des tâches lors du déplacement au clavier"""
     try:
-        task = next((t for t in TASKS if t["id"] == task_id), None)
+        task = PLANNING.store.get_task(task_id)
         if not task:
             return {"success": False, "error": "Tâche non trouvée"}
         
@@ -1089,31 +2418,25 @@ def handle_keyboard_push(task_id, direction):
                 return {"success": True, "new_slot": current_slot, "blocked": True}
             if new_slot != current_slot:
                 span_at_new_slot = compute_span_slots(new_slot, real_duration, operator_id)
-                # Vérifier s'il y a collision avant de déplacer
-                collision = check_collision(operator_id, new_slot, span_at_new_slot, task_id)
-                if collision:
-                    # Essayer de pousser la tâche en collision vers la gauche
-                    push_success = push_task_cascade(collision, "left", new_slot)
-                    if not push_success:
-                        # Si impossible de pousser, la tâche reste à sa position actuelle
-                        return {"success": True, "new_slot": current_slot, "blocked": True}
+                # Pousser vers la gauche les tâches en collision éventuelles
+                pushed_tasks = push_tasks(operator_id, new_slot, span_at_new_slot, task_id, direction="left")
+                if pushed_tasks is None:
+                    # Si impossible de pousser, la tâche reste à sa position actuelle
+                    return {"success": True, "new_slot": current_slot, "blocked": True}
 
                 # Déplacer la tâche principale (durée réelle conservée)
                 update_task_from_slots(task, new_slot, real_duration)
 
         elif direction == "right":
-            new_slot = min(NUM_SLOTS - real_duration, current_slot + 1)
-            new_slot = min(NUM_SLOTS - real_duration, next_open_start_slot(operator_id, new_slot, direction=1))
+            new_slot = min(PLANNING.num_slots - real_duration, current_slot + 1)
+            new_slot = min(PLANNING.num_slots - real_duration, next_open_start_slot(operator_id, new_slot, direction=1))
             if new_slot != current_slot:
                 span_at_new_slot = compute_span_slots(new_slot, real_duration, operator_id)
-                # Vérifier s'il y a collision avant de déplacer
-                collision = check_collision(operator_id, new_slot, span_at_new_slot, task_id)
-                if collision:
-                    # Essayer de pousser la tâche en collision vers la droite
-                    push_success = push_task_cascade(collision, "right", new_slot + span_at_new_slot)
-                    if not push_success:
-                        # Si impossible de pousser, la tâche reste à sa position actuelle
-                        return {"success": True, "new_slot": current_slot, "blocked": True}
+                # Pousser vers la droite les tâches en collision éventuelles
+                pushed_tasks = push_tasks(operator_id, new_slot, span_at_new_slot, task_id, direction="right")
+                if pushed_tasks is None:
+                    # Si impossible de pousser, la tâche reste à sa position actuelle
+                    return {"success": True, "new_slot": current_slot, "blocked": True}
 
                 # Déplacer la tâche principale (durée réelle conservée)
                 update_task_from_slots(task, new_slot, real_duration)
@@ -1124,134 +2447,362 @@ def handle_keyboard_push(task_id, direction):
     except Exception as e:
         return {"success": False, "error": f"Erreur lors du déplacement: {str(e)}"}
 
-def push_task_cascade(task, direction, boundary_position):
-    """Pousse une tâche dans une direction en utilisant une approche itérative
-    
+def plan_resolve_collisions(operator_id, anchor_task_id=None):
+    """Calcule, sans rien modifier, les positions qui suppriment tous les chevauchements de
+    l'opérateur, en un seul passage par ordre de début (balayage) :
+    - chaque tâche qui commence avant la fin de la précédente est recalée sur le premier slot
+      ouvert après celle-ci (span recalculé, fermetures comprises) ;
+    - si des tâches débordent alors de l'horizon, elles sont tassées vers la gauche depuis
+      PLANNING.num_slots, en remontant seulement jusqu'à la première tâche qui tient.
+    À début égal, `anchor_task_id` (tâche que l'utilisateur vient de placer) passe en premier.
+
+    Returns:
+        list: [(tâche, nouveau slot de début)] pour toutes les tâches de l'opérateur
+    """
+    index = PLANNING.store.get_row_index(operator_id)
+    entries = list(zip(index.tasks, index.starts, index.ends))
+    if anchor_task_id:
+        i = next((k for k, entry in enumerate(entries) if entry[0]["id"] == anchor_task_id), None)
+        while i and entries[i - 1][1] == entries[i][1]:
+            entries[i - 1], entries[i] = entries[i], entries[i - 1]
+            i -= 1
+
+    # Balayage vers la droite
+    plan = []
+    frontier = None
+    for task, start_slot, end_slot in entries:
+        real_duration = get_task_duration_slots(task)
+        if frontier is not None and start_slot < frontier:
+            # Ne jamais faire démarrer une tâche poussée sur un slot fermé
+            start_slot = next_open_start_slot(operator_id, frontier, direction=1)
+            end_slot = start_slot + compute_span_slots(start_slot, real_duration, operator_id)
+        plan.append([task, start_slot, end_slot, real_duration])
+        frontier = end_slot
+
+    # Repli vers la gauche uniquement pour les tâches qui dépassent l'horizon
+    limit = PLANNING.num_slots
+    for entry in reversed(plan):
+        task, start_slot, end_slot, real_duration = entry
+        if end_slot <= limit:
+            break
+        # Se terminer exactement sur la limite, fermetures internes comprises
+        new_start_slot = compute_start_for_end(limit, real_duration, operator_id)
+        if new_start_slot < 0:
+            # Cas extrême : plus assez de slots ouverts sur tout l'horizon
+            new_start_slot = max(0, next_open_start_slot(operator_id, 0, direction=1))
+            entry[1] = new_start_slot
+            break
+        entry[1] = new_start_slot
+        limit = new_start_slot
+
+    return [(task, start_slot) for task, start_slot, _end_slot, _real_duration in plan]
+
+def resolve_all_collisions_on_operator(operator_id, anchor_task_id=None):
+    """Résout toutes les collisions sur un opérateur en poussant les tâches vers la droite
+    (voir plan_resolve_collisions).
+
+    Returns:
+        int: nombre de tâches déplacées
+    """
+    moved_tasks = apply_slot_plan(plan_resolve_collisions(operator_id, anchor_task_id))
+    return len(moved_tasks)
+
+def plan_group_placements(operator_id, placements):
+    """Calcule, sans rien modifier, les positions d'un groupe de tâches déplacées ensemble sur
+    l'opérateur : chaque tâche est recalée sur le premier slot ouvert de l'opérateur, puis après
+    la précédente du groupe si elles se chevauchent (tâches venant de plusieurs lignes).
+
     Args:
-        task: La tâche à pousser
-        direction: 'left' ou 'right'
-        boundary_position: Position de fin (pour left) ou de début (pour right) à respecter
-    
+        placements: [(tâche, slot de début souhaité)]
+
     Returns:
-        bool: True si le déplacement est possible, False sinon
+        list: [(tâche, nouveau slot de début)] par début croissant, ou None si une tâche
+        sortirait du planning
     """
-    operator_id = task["operator_id"]
-    tasks_to_move = []
-    
-    # Collecter toutes les tâches qui doivent être déplacées
-    current_task = task
-    current_boundary = boundary_position
-    
-    max_iterations = 20  # Protection contre les boucles infinies
-    iteration = 0
-    
-    while current_task and iteration < max_iterations:
-        iteration += 1
-        real_duration = get_task_duration_slots(current_task)
+    plan = []
+    frontier = 0
+    for task, start_slot in sorted(placements, key=lambda placement: placement[1]):
+        if start_slot < 0:
+            return None
+        new_start_slot = next_open_start_slot(operator_id, max(start_slot, frontier), direction=1)
+        span_slots = compute_span_slots(new_start_slot, get_task_duration_slots(task), operator_id)
+        if new_start_slot + span_slots > PLANNING.num_slots:
+            return None
+        plan.append((task, new_start_slot))
+        frontier = new_start_slot + span_slots
+    return plan
 
-        if direction == "left":
-            # Calculer la nouvelle position pour que la tâche se termine exactement à
-            # current_boundary, en tenant compte des fermetures éventuelles à l'intérieur
-            new_start_slot = compute_start_for_end(current_boundary, real_duration, operator_id)
-            span_duration = current_boundary - new_start_slot
-            # Vérifier si on dépasse le bord gauche
-            if new_start_slot < 0:
-                return False
-        else:  # direction == "right"
-            # Calculer la nouvelle position, jamais sur un slot fermé
-            new_start_slot = next_open_start_slot(operator_id, current_boundary, direction=1)
-            span_duration = compute_span_slots(new_start_slot, real_duration, operator_id)
-            # Vérifier si on dépasse le bord droit
-            if new_start_slot + span_duration > NUM_SLOTS:
-                return False
-
-        # Ajouter la tâche à la liste des tâches à déplacer
-        tasks_to_move.append({
-            "task": current_task,
-            "new_position": new_start_slot
-        })
+def plan_push_around(operator_id, blocks, group_ids):
+    """Calcule, sans rien modifier, le décalage vers la droite des autres tâches de l'opérateur
+    qui chevauchent les blocs [début, fin) du groupe déplacé (triés, disjoints), en un seul
+    balayage par ordre de début : une tâche en collision avec un bloc, ou avec une tâche déjà
+    poussée, est recalée sur le premier slot ouvert après celui-ci (comme plan_push).
 
-        # Chercher la prochaine collision
-        next_collision = check_collision(operator_id, new_start_slot, span_duration, current_task["id"])
+    Returns:
+        list: [(tâche, nouveau slot de début)] des tâches poussées, ou None si une tâche
+        sortirait du planning
+    """
+    index = PLANNING.store.get_row_index(operator_id)
+    plan = []
+    frontier = 0  # Fin de la dernière tâche poussée
+    b = 0
+    for task, start_slot, end_slot in zip(index.tasks, index.starts, index.ends):
+        if task["id"] in group_ids:
+            continue
+        new_start_slot, span_slots = start_slot, end_slot - start_slot
+        if new_start_slot < frontier:
+            new_start_slot = next_open_start_slot(operator_id, frontier, direction=1)
+            span_slots = compute_span_slots(new_start_slot, get_task_duration_slots(task), operator_id)
+        # Sauter les blocs du groupe (les débuts ne font que croître : b avance seulement)
+        while True:
+            while b < len(blocks) and blocks[b][1] <= new_start_slot:
+                b += 1
+            if b == len(blocks) or blocks[b][0] >= new_start_slot + span_slots:
+                break
+            new_start_slot = next_open_start_slot(operator_id, blocks[b][1], direction=1)
+            span_slots = compute_span_slots(new_start_slot, get_task_duration_slots(task), operator_id)
+        if new_start_slot != start_slot:
+            if new_start_slot + span_slots > PLANNING.num_slots:
+                return None  # Pas assez d'espace
+            plan.append((task, new_start_slot))
+            frontier = new_start_slot + span_slots
+    return plan
+
+def move_task_group(tasks, offset=0, operator_id=None):
+    """Déplace ensemble des tâches de `offset` slots, et sur l'opérateur `operator_id` s'il
+    est donné (sinon chacune reste sur le sien). Toutes les positions sont calculées avant la
+    moindre modification : les tâches du groupe sont placées, puis les autres tâches en
+    collision sont poussées vers la droite, en un seul balayage par opérateur cible.
 
-        if next_collision:
-            current_task = next_collision
-            if direction == "left":
-                current_boundary = new_start_slot
-            else:  # right
-                current_boundary = new_start_slot + span_duration
+    Returns:
+        list: tâches déplacées (groupe et tâches poussées), ou None si le déplacement est
+        impossible (aucune modification n'est faite dans ce cas)
+    """
+    placements_by_operator = {}
+    for task in tasks:
+        target_operator_id = task["operator_id"] if operator_id is None else operator_id
+        placements_by_operator.setdefault(target_operator_id, []).append(
+            (task, get_task_start_slot(task) + offset))
+
+    group_ids = {task["id"] for task in tasks}
+    plans = []
+    for target_operator_id, placements in placements_by_operator.items():
+        group_plan = plan_group_placements(target_operator_id, placements)
+        if group_plan is None:
+            return None
+        blocks = [(start_slot, start_slot + compute_span_slots(start_slot, get_task_duration_slots(task), target_operator_id))
+                  for task, start_slot in group_plan]
+        push_plan = plan_push_around(target_operator_id, blocks, group_ids)
+        if push_plan is None:
+            return None
+        plans.append((target_operator_id, group_plan, push_plan))
+
+    moved_tasks = []
+    for target_operator_id, group_plan, push_plan in plans:
+        moved_tasks.extend(apply_slot_plan(push_plan))
+        for task, start_slot in group_plan:
+            duration_slots = get_task_duration_slots(task)
+            PLANNING.store.set_task_operator(task, target_operator_id)
+            update_task_from_slots(task, start_slot, duration_slots)
+            moved_tasks.append(task)
+    return moved_tasks
+
+
+# === SYNCHRONISATION ENTRE PROCESSUS (LISTEN/NOTIFY) ===
+
+def with_write_lock(view):
+    """Exécute une vue qui modifie le planning de la session sous son write_lock (une seule
+    modification à la fois, requêtes et notifications), annule les modifications qu'elle n'a
+    pas enregistrées, puis publie le nouvel instantané"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        planning = get_planning_context()
+        with planning.write_lock:
+            try:
+                return view(*args, **kwargs)
+            finally:
+                # Modifications non enregistrées en base (erreur, même interceptée par la vue) :
+                # annulées en mémoire avant de publier l'instantané
+                planning.store.rollback_changes()
+                publish_planning_snapshot()
+    return wrapper
+
+def with_planning_snapshot(view):
+    """Exécute une vue de lecture sur le dernier instantané publié du planning de la session :
+    pas de verrou, et un état cohérent même si une modification est en cours"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        planning = get_planning_context()
+        if planning.planning_id is None:
+            return view(*args, **kwargs)
+        REQUEST_CONTEXT.snapshot = get_planning_snapshot(planning)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            REQUEST_CONTEXT.snapshot = None
+    return wrapper
+
+def refresh_notified_tasks(task_ids):
+    """Recharge depuis la base les tâches notifiées du planning lié au thread (task_ids = None :
+    toutes les tâches du planning)"""
+    planning_id = PLANNING.planning_id
+    with PLANNING.write_lock:
+        # Lecture sous le verrou : une ligne lue avant un de nos enregistrements en cours
+        # écraserait ce dernier en mémoire
+        tasks = load_tasks_from_db(planning_id, task_ids=task_ids)
+        if task_ids is None:
+            # L'horizon (start_date, num_slots) est conservé : les positions affichées restent valides
+            PLANNING.store.set_tasks(tasks)
+            logger.info("Notification : %s tâches rechargées (planning %s)", len(tasks), planning_id)
+            publish_planning_changes(PLANNING.store.version, full=True)
         else:
-            break
+            changed_ids, deleted_ids = PLANNING.store.refresh_tasks([str(task_id) for task_id in task_ids], tasks)
+            if changed_ids or deleted_ids:
+                logger.info("Notification : %s tâches modifiées, %s supprimées (planning %s)",
+                            len(changed_ids), len(deleted_ids), planning_id)
+                publish_planning_changes(PLANNING.store.version,
+                                         tasks=[PLANNING.store.get_task(task_id) for task_id in changed_ids],
+                                         deleted=deleted_ids)
+        publish_planning_snapshot()
+
+def refresh_cached_plannings(database_id, task_ids_by_planning):
+    """Applique les notifications aux plannings de la base présents dans PLANNING_CACHE
+    (task_ids_by_planning = None : recharger tous ces plannings)"""
+    with PLANNING_CACHE_LOCK:
+        plannings = [planning for planning in PLANNING_CACHE.values()
+                     if planning.database_id == database_id and planning.loaded
+                     and (task_ids_by_planning is None or planning.planning_id in task_ids_by_planning)]
+        for planning in plannings:
+            planning.refcount += 1
+    for planning in plannings:
+        task_ids = None if task_ids_by_planning is None else task_ids_by_planning[planning.planning_id]
+        try:
+            # Lier le planning au thread d'écoute le temps du rechargement
+            bind_request_context(database_id, planning.planning_id)
+            REQUEST_CONTEXT.planning = planning
+            refresh_notified_tasks(task_ids)
+        except Exception as e:
+            logger.warning("Rechargement des tâches notifiées du planning %s impossible : %s", planning.planning_id, e)
+        finally:
+            unbind_request_context()
+
+def _planning_listener_loop(database_id, db_config, stop_event):
+    """Boucle du thread d'écoute d'une base : connexion dédiée (hors pool) en autocommit,
+    LISTEN sur PLANNING_NOTIFY_CHANNEL, puis rechargement des tâches notifiées dans les
+    plannings chargés de cette base"""
+    conn = None
+    while not stop_event.is_set():
+        try:
+            if conn is None:
+                conn = psycopg2.connect(**db_config)
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {PLANNING_NOTIFY_CHANNEL}")
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                continue
+            conn.poll()
+            # Regrouper les notifications reçues (None = tout le planning)
+            task_ids_by_planning = {}
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    payload = json.loads(notify.payload)
+                    planning_id = payload['planning_id']
+                    task_ids = payload.get('task_ids')
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if planning_id in task_ids_by_planning and task_ids_by_planning[planning_id] is None:
+                    continue
+                if task_ids is None:
+                    task_ids_by_planning[planning_id] = None
+                else:
+                    task_ids_by_planning.setdefault(planning_id, set()).update(task_ids)
+            if task_ids_by_planning:
+                refresh_cached_plannings(database_id, task_ids_by_planning)
+        except Exception as e:
+            logger.warning("Écoute des notifications PostgreSQL interrompue : %s", e)
+            if conn is not None:
+                conn.close()
+                conn = None
+            stop_event.wait(PLANNING_LISTENER_RETRY_SECONDS)
+            # Des notifications ont pu être perdues : recharger les plannings chargés de la base
+            if not stop_event.is_set():
+                refresh_cached_plannings(database_id, None)
+    if conn is not None:
+        conn.close()
 
-    # Si on arrive ici, tous les déplacements sont possibles
-    # Déplacer toutes les tâches collectées (durée réelle conservée)
-    for move_info in tasks_to_move:
-        task_real_duration = get_task_duration_slots(move_info["task"])
-        update_task_from_slots(move_info["task"], move_info["new_position"], task_real_duration)
-    
-    if iteration >= max_iterations:
-        return False
-    
-    return True
+def start_planning_listener():
+    """Démarre le thread d'écoute des notifications de la base de la session (un par base et
+    par processus ; sans effet s'il tourne déjà)"""
+    database_id = DATABASE.id
+    with PLANNING_LISTENERS_LOCK:
+        listener = PLANNING_LISTENERS.get(database_id)
+        if listener is not None and listener.is_alive():
+            return
+        stop_event = threading.Event()
+        listener = threading.Thread(
+            target=_planning_listener_loop,
+            args=(database_id, dict(DATABASE.config), stop_event),
+            name=f'planning-listener-{database_id}',
+            daemon=True,
+        )
+        listener.stop_event = stop_event
+        listener.start()
+        PLANNING_LISTENERS[database_id] = listener
+
+
+# === ÉVÉNEMENTS TEMPS RÉEL (SSE) ===
+
+def build_planning_event(token, version, tasks=(), deleted=(), full=False):
+    """Événement de modification au format JSON : nouvelle position des tâches modifiées et
+    ids supprimés, ou full=True si le navigateur doit recharger sa fenêtre"""
+    if full:
+        return json.dumps({"token": token, "version": version, "full": True})
+    return json.dumps({
+        "token": token,
+        "version": version,
+        "full": False,
+        "changes": build_task_changes(tasks),
+        "deleted": list(deleted),
+    })
+
+def publish_planning_changes(version, tasks=(), deleted=(), full=False):
+    """Prépare un événement de modification pour les navigateurs abonnés au planning de la
+    session. À appeler sous write_lock, juste après la validation des modifications : il est
+    envoyé à la publication de l'instantané (publish_planning_snapshot)"""
+    planning = get_planning_context()
+    with planning.subscribers_lock:
+        if not planning.subscribers:
+            return
+    token = planning.store.token
+    planning.pending_events.append((get_planning_event_id(token, version),
+                                    build_planning_event(token, version, tasks, deleted, full)))
+
+def get_planning_event_id(token, version):
+    """Id SSE d'un événement ("token:version"), renvoyé par le navigateur dans Last-Event-ID"""
+    return f"{token}:{version}"
+
+def send_planning_event(planning, event_id, data):
+    """Envoie un événement aux navigateurs abonnés au planning (sous write_lock)"""
+    with planning.subscribers_lock:
+        subscribers = list(planning.subscribers)
+    for subscriber in subscribers:
+        try:
+            subscriber.put_nowait((event_id, data))
+        except queue.Full:
+            # Navigateur trop lent : abandonner son retard et lui demander de tout recharger
+            while not subscriber.empty():
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    break
+            store = planning.store
+            subscriber.put_nowait((get_planning_event_id(store.token, store.version),
+                                   build_planning_event(store.token, store.version, full=True)))
+
+def format_sse_event(event_id, data):
+    return f"id: {event_id}\nevent: changes\ndata: {data}\n\n"
 
-def resolve_all_collisions_on_operator(operator_id):
-    """Résout toutes les collisions sur un opérateur en poussant les tâches vers la droite"""
-    tasks = get_tasks_for_operator(operator_id)
-    
-    # Si moins de 2 tâches, pas de collision possible
-    if len(tasks) < 2:
-        return
-    
-    max_iterations = 50  # Éviter les boucles infinies
-    iteration = 0
-    
-    while iteration < max_iterations:
-        iteration += 1
-        collision_found = False
-        
-        # Trier les tâches par position de début
-        tasks.sort(key=lambda x: get_task_start_slot(x))
-        
-        # Vérifier chaque paire de tâches adjacentes
-        for i in range(len(tasks) - 1):
-            task1 = tasks[i]
-            task2 = tasks[i + 1]
-            
-            task1_start_slot = get_task_start_slot(task1)
-            task1_real_duration = get_task_duration_slots(task1)
-            task1_span_slots = get_task_span_slots(task1, task1_start_slot)
-            task2_start_slot = get_task_start_slot(task2)
-            task2_real_duration = get_task_duration_slots(task2)
-
-            task1_end = task1_start_slot + task1_span_slots
-
-            # Si les tâches se chevauchent (collision réelle)
-            if task1_end > task2_start_slot:
-                collision_found = True
-
-                # Calculer l'espace nécessaire pour déplacer task2 (jamais sur un slot fermé)
-                needed_slot = next_open_start_slot(task2["operator_id"], task1_end, direction=1)
-                task2_span_at_needed = compute_span_slots(needed_slot, task2_real_duration, task2["operator_id"])
-                max_possible_slot = NUM_SLOTS - task2_span_at_needed
-
-                # Déplacer task2 vers la droite (durée réelle conservée)
-                if needed_slot <= max_possible_slot:
-                    update_task_from_slots(task2, needed_slot, task2_real_duration)
-                else:
-                    # Si pas assez de place à droite, déplacer task1 vers la gauche pour qu'il se
-                    # termine exactement au début de task2 (fermetures internes prises en compte)
-                    needed_slot_left = compute_start_for_end(task2_start_slot, task1_real_duration, task1["operator_id"])
-                    if needed_slot_left >= 0:
-                        update_task_from_slots(task1, needed_slot_left, task1_real_duration)
-                    else:
-                        # Cas extrême : déplacer task2 le plus loin possible à droite
-                        update_task_from_slots(task2, max_possible_slot, task2_real_duration)
-                
-                break  # Recommencer la vérification depuis le début
-        
-        # Si aucune collision trouvée, on a terminé
-        if not collision_found:
-            break
 
 @app.route('/')
 def database_selection():
@@ -1261,8 +2812,6 @@ def database_selection():
 @app.route('/select_database/<database_id>')
 def select_database(database_id):
     """Sélectionne une base de données et redirige vers la sélection de planning"""
-    global CURRENT_DATABASE_CONFIG, CURRENT_DATABASE_NAME, CURRENT_DATABASE_URL_ODOO, CURRENT_DATABASE_URL_TACHE_ODOO
-    global CURRENT_XMLRPC_LOGIN, CURRENT_XMLRPC_PASSWORD, CURRENT_XMLRPC_URL
     
     # Trouver la configuration de la base de données
     selected_db = next((db for db in DATABASES if db['id'] == database_id), None)
@@ -1271,24 +2820,21 @@ def select_database(database_id):
                              databases=DATABASES, 
                              error="Base de données non trouvée")
     
-    # Mettre à jour la configuration de base de données
-    CURRENT_DATABASE_CONFIG = {
-        **DATABASE_BASE_CONFIG,
-        'database': selected_db['database']
-    }
-    CURRENT_DATABASE_NAME = selected_db['name']
-    CURRENT_DATABASE_URL_ODOO = selected_db.get('url_odoo', '')
-    CURRENT_DATABASE_URL_TACHE_ODOO = selected_db.get('url_tache_odoo', '')
-    CURRENT_XMLRPC_LOGIN = selected_db.get('xmlrpc_login', '')
-    CURRENT_XMLRPC_PASSWORD = selected_db.get('xmlrpc_password', '')
-    CURRENT_XMLRPC_URL = selected_db.get('xmlrpc_url', '')
+    # Mémoriser la base dans la session de l'utilisateur (sans planning choisi)
+    session['database_id'] = database_id
+    session.pop('planning_id', None)
+    bind_request_context(database_id, None)
     
+    conn = None
     try:
-        # Tester la connexion à la base
+        # Créer le pool de connexions de cette base (s'il n'existe pas) et le tester
+        get_db_pool()
         conn = get_db_connection()
         if not conn:
             raise Exception("Impossible de se connecter à la base de données")
-        conn.close()
+        
+        # Écouter les modifications de tâches faites par les autres processus
+        start_planning_listener()
         
         # Rediriger vers la sélection de planning
         return redirect(url_for('planning_selection'))
@@ -1297,6 +2843,8 @@ def select_database(database_id):
         return render_template('database_selection.html', 
                              databases=DATABASES, 
                              error=f"Erreur lors de la connexion à {selected_db['name']}: {str(e)}")
+    finally:
+        release_db_connection(conn)
 
 @app.route('/planning_selection')
 def planning_selection():
@@ -1305,221 +2853,80 @@ def planning_selection():
         plannings = load_plannings_from_db()
         return render_template('planning_selection.html', 
                              plannings=plannings,
-                             current_database=CURRENT_DATABASE_NAME,
-                             current_database_url_odoo=CURRENT_DATABASE_URL_ODOO)
+                             current_database=DATABASE.name,
+                             current_database_url_odoo=DATABASE.url_odoo)
     except Exception as e:
         return render_template('planning_selection.html', 
                              plannings=[], 
-                             current_database=CURRENT_DATABASE_NAME,
-                             current_database_url_odoo=CURRENT_DATABASE_URL_ODOO,
+                             current_database=DATABASE.name,
+                             current_database_url_odoo=DATABASE.url_odoo,
                              error=str(e))
 
-def load_planning_end_date(planning_id):
-    """Récupère (et met à jour la variable globale) la date de fin du planning depuis la base"""
-    global CURRENT_PLANNING_END_DATE
-    CURRENT_PLANNING_END_DATE = None
-    try:
-        conn = get_db_connection()
-        if conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(
-                    """
-                    SELECT date_fin_planning
-                    FROM is_gestion_tache_planning
-                    WHERE id = %s
-                    """,
-                    (planning_id,)
-                )
-                row = cursor.fetchone()
-                if row and row.get('date_fin_planning'):
-                    # S'assurer d'avoir un objet date
-                    dfp = row['date_fin_planning']
-                    if isinstance(dfp, datetime):
-                        dfp = dfp.date()
-                    CURRENT_PLANNING_END_DATE = dfp
-            conn.close()
-    except Exception:
-        CURRENT_PLANNING_END_DATE = None
-    return CURRENT_PLANNING_END_DATE
-
 @app.route('/select_planning/<int:planning_id>')
 def select_planning(planning_id):
-    """Sélectionne un planning et redirige vers 'Gestion de tâches'"""
-    global CURRENT_PLANNING_ID, OPERATORS, AFFAIRES, TASKS, CURRENT_PLANNING_END_DATE, NUM_SLOTS, START_DATE
+    """Sélectionne un planning et redirige vers 'Gestion de tâches'.
+    Le planning est partagé avec les autres sessions qui l'affichent : il n'est chargé depuis la
+    base que s'il n'est pas déjà dans PLANNING_CACHE"""
 
     try:
-        # Sauvegarder l'ID du planning
-        CURRENT_PLANNING_ID = planning_id
-
-        # Récupérer la date de fin du planning
-        load_planning_end_date(planning_id)
-
-        # Calculer NUM_SLOTS en fonction de la date du jour et de la date fin planning (2 slots/jour), min 60
-        today = date.today()
-        if CURRENT_PLANNING_END_DATE:
-            days_inclusive = (CURRENT_PLANNING_END_DATE - today).days + 1
-            required_slots = max(0, days_inclusive) * 2
-            NUM_SLOTS = max(required_slots, 60)
-        else:
-            NUM_SLOTS = max(60, NUM_SLOTS)
-        
-        # Charger les données filtrées par planning
-        AFFAIRES = load_affaires_from_db(planning_id)
-        TASKS = load_tasks_from_db(planning_id)
-        OPERATORS = load_operators_from_db(planning_id)
-        
-        # Calculer la date de début du planning basée sur la première tâche
-        START_DATE = calculate_planning_start_date(TASKS)
-        
-        # Recalculer NUM_SLOTS en fonction de la nouvelle date de début
-        calculate_num_slots()
-        
-        # Charger les fermetures (met à jour VACATION_DATES et les absences opérateurs)
-        load_fermetures_from_db(planning_id)
+        # Mémoriser le planning dans la session de l'utilisateur
+        session['planning_id'] = planning_id
+        bind_request_context(DATABASE.id, planning_id)
+        get_planning_context()
         
         # Rediriger vers le planning
         return redirect(url_for('planning'))
         
     except Exception as e:
+        session.pop('planning_id', None)
         return render_template('planning_selection.html', 
                              plannings=load_plannings_from_db(),
-                             current_database=CURRENT_DATABASE_NAME,
+                             current_database=DATABASE.name,
                              error=f"Erreur lors du chargement du planning: {str(e)}")
 
 @app.route('/planning')
+@with_planning_snapshot
 def planning():
     """Page principale 'Gestion de tâches'"""
     # Récupérer le nom du planning sélectionné
     current_planning_name = "Planning non sélectionné"
-    if CURRENT_PLANNING_ID:
+    if PLANNING.planning_id:
         try:
-            conn = get_db_connection()
-            if conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    cursor.execute("SELECT name FROM is_gestion_tache_planning WHERE id = %s", (CURRENT_PLANNING_ID,))
-                    result = cursor.fetchone()
-                    if result:
-                        current_planning_name = result['name']
-                conn.close()
+            meta = get_planning_meta()
+            if meta:
+                current_planning_name = meta['name']
         except Exception:
             pass  # En cas d'erreur, garder le nom par défaut
     
-    # Générer les en-têtes de colonnes (NUM_SLOTS demi-journées)
-    time_slots = []
-    months = []
-    weeks = []
-    days = []
-    start_date = datetime.combine(START_DATE, datetime.min.time()).replace(hour=8, minute=0, second=0, microsecond=0)
-    
-    current_month = None
-    current_week = None
-    current_day = None
-    
-    # Conversion des jours en français (une seule fois)
-    day_names_fr = {
-        'Monday': 'Lundi', 'Tuesday': 'Mardi', 'Wednesday': 'Mercredi',
-        'Thursday': 'Jeudi', 'Friday': 'Vendredi', 'Saturday': 'Samedi', 'Sunday': 'Dimanche'
-    }
-    
-    for i in range(NUM_SLOTS):
-        day_offset = i // 2
-        is_morning = i % 2 == 0
-        
-        current_date = start_date + timedelta(days=day_offset)
-        time_label = "AM" if is_morning else "PM"
-        
-        # Pour les mois
-        month_year = current_date.strftime("%m/%Y")
-        if month_year != current_month:
-            current_month = month_year
-            months.append({
-                "name": month_year,
-                "start_slot": i,
-                "span": 0  # Sera calculé plus tard
-            })
-        if months:
-            months[-1]["span"] += 1
-        
-        # Pour les semaines (vrais numéros de semaines ISO avec année)
-        week_number = current_date.isocalendar()[1]  # Numéro de semaine ISO
-        week_year = current_date.isocalendar()[0]    # Année ISO (peut différer de l'année civile)
-        week_key = f"{week_year}-W{week_number:02d}"
-        if week_key != current_week:
-            current_week = week_key
-            weeks.append({
-                "name": f"S{week_number:02d}/{week_year}",
-                "start_slot": i,
-                "span": 0
-            })
-        if weeks:
-            weeks[-1]["span"] += 1
-            
-        # Pour les jours
-        day_key = current_date.strftime("%d/%m")
-        if is_morning:  # Nouveau jour
-            day_name_en = current_date.strftime("%A")  # Nom complet en anglais
-            day_name_fr = day_names_fr.get(day_name_en, day_name_en)
-            days.append({
-                "date": day_key,
-                "start_slot": i,
-                "day_name": day_name_fr  # Nom du jour en français
-            })
-        
-        # Utilisation du dictionnaire de conversion déclaré en début de boucle
-        day_name_en = current_date.strftime("%A")  # Nom complet en anglais
-        day_name_fr = day_names_fr.get(day_name_en, day_name_en)
-        
-        time_slots.append({
-            "slot": i,
-            "date": current_date.strftime("%d/%m"),
-            "period": time_label,
-            "day_name": day_name_fr,  # Nom du jour en français
-            "is_vacation": is_vacation_slot(i)  # Ajouter l'info de congé
-        })
-    
-    # Convertir les tâches pour l'affichage (compatibilité avec le template)
-    display_tasks = []
-    
-    for i, task in enumerate(TASKS):
-        # Vérifier si l'affaire existe
-        affair = get_affair_by_id(task['affaire_id'])
-        if not affair:
-            # Utiliser l'affaire par défaut ou sauter cette tâche
-            continue
-        
-        display_task = task.copy()
-        display_task["start_slot"] = get_task_start_slot(task)
-        display_task["duration"] = get_task_span_slots(task)
-        display_tasks.append(display_task)
-
-    # Utiliser tous les opérateurs au lieu de filtrer par ceux qui ont des tâches
-    # filtered_operators = [op for op in OPERATORS if op['id'] in operators_with_tasks]
-    
-    # Pré-calculer les informations d'absence pour tous les opérateurs et slots
-    operator_absences = {}
-    for operator in OPERATORS:
-        operator_absences[operator["id"]] = {}
-        for i in range(NUM_SLOTS):
-            operator_absences[operator["id"]][i] = is_absence_slot(operator["id"], i)
+    # En-têtes de colonnes (num_slots demi-journées) pré-calculés par le calendrier des slots ;
+    # seules les fermetures globales (qui peuvent changer sans changer l'horizon) sont ajoutées ici.
+    # Les lignes ne contiennent ni slots ni tâches : le navigateur charge la fenêtre visible
+    # via /api/viewport
+    calendar = get_slot_calendar()
+    time_slots = [
+        {**slot_info, "is_vacation": is_vacation_slot(slot_info["slot"])}
+        for slot_info in calendar.time_slots
+    ]
     
     return render_template('index.html', 
-                         operators=OPERATORS,  # Utiliser tous les opérateurs
+                         operators=PLANNING.store.operators,  # Utiliser tous les opérateurs
                          time_slots=time_slots,
-                         months=months,
-                         weeks=weeks,
-                         days=days,
-                         tasks=display_tasks, 
-                         affairs=AFFAIRES,
-                         operator_absences=operator_absences,
+                         months=calendar.months,
+                         weeks=calendar.weeks,
+                         days=calendar.days,
+                         affairs=PLANNING.store.affairs,
                          slot_width=SLOT_WIDTH,
                          row_height=ROW_HEIGHT,
                          header_height=HEADER_HEIGHT,
-                         num_slots=NUM_SLOTS,
-                         start_date=START_DATE,
+                         num_slots=PLANNING.num_slots,
+                         planning_version=PLANNING.store.version,
+                         planning_token=PLANNING.store.token,
+                         planning_id=PLANNING.planning_id,
+                         start_date=PLANNING.start_date,
                          day_duration_hours=DAY_DURATION_HOURS,
                          current_planning_name=current_planning_name,
-                         current_database_url_odoo=CURRENT_DATABASE_URL_ODOO,
-                         current_database_url_tache_odoo=CURRENT_DATABASE_URL_TACHE_ODOO)
+                         current_database_url_odoo=DATABASE.url_odoo,
+                         current_database_url_tache_odoo=DATABASE.url_tache_odoo)
 
 @app.route('/change_database')
 def change_database():
@@ -1531,359 +2938,664 @@ def change_planning():
     """Retourne à la sélection de planning"""
     return redirect(url_for('planning_selection'))
 
-@app.route('/move_task', methods=['POST'])
-def move_task():
+# === COMMANDES DE MODIFICATION ===
+# Chaque commande modifie le planning en mémoire sans rien enregistrer (les tâches modifiées sont
+# suivies par le store) et retourne un dict {"success": ..., "error"/...} ; les routes, et
+# /apply_commands pour une suite de commandes, enregistrent ensuite en une fois avec
+# persist_task_changes()
+
+def plan_task_move(task, operator_id, start_slot):
+    """Calcule, sans rien modifier, le dépôt de la tâche sur l'opérateur à partir de start_slot :
+    (slot de début recalé, span, plan_push des tâches à pousser vers la droite ou None si la
+    place manque). Partagé par move_task_command et l'aperçu /preview_move"""
+    # Recaler automatiquement sur le premier slot ouvert si la nouvelle position tombe
+    # sur un jour fermé (week-end/fermeture) ou une absence de l'opérateur cible
+    start_slot = next_open_start_slot(operator_id, start_slot, direction=1)
+    span_slots = compute_span_slots(start_slot, get_task_duration_slots(task), operator_id)
+    return start_slot, span_slots, plan_push(operator_id, start_slot, span_slots, task["id"])
+
+def plan_leaves_collision(operator_id, start_slot, span_slots, task_id, push_plan):
+    """Vrai si, une fois push_plan appliqué, une autre tâche de l'opérateur chevauche encore
+    [start_slot, start_slot + span_slots) : move_task_command résout alors toutes les collisions
+    de la ligne (resolve_all_collisions_on_operator), ce que plan_task_move ne calcule pas"""
+    planned = {task["id"] for task, _new_start_slot in push_plan}
+    end_slot = start_slot + span_slots
+    if any(task["id"] not in planned
+           for task in get_all_colliding_tasks(operator_id, start_slot, span_slots, task_id)):
+        return True
+    return any(new_start_slot < end_slot and new_start_slot + get_task_span_slots(task, new_start_slot) > start_slot
+               for task, new_start_slot in push_plan)
+
+def move_task_command(data):
+    """Déplace une tâche (task_id) sur l'opérateur operator_id à partir du slot start_slot, en
+    poussant vers la droite les tâches en collision"""
+    task_id = data.get('task_id')
+    new_operator_id_raw = data.get('operator_id')
+    new_start_slot_raw = data.get('start_slot')
+    
+    if not task_id:
+        return {"success": False, "error": "ID de tâche manquant"}
+    
+    if new_operator_id_raw is None:
+        return {"success": False, "error": "ID d'opérateur manquant"}
+    
+    if new_start_slot_raw is None:
+        return {"success": False, "error": "Slot de début manquant"}
+    
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"success": False, "error": "Données JSON manquantes"})
+        new_operator_id = int(new_operator_id_raw)
+        new_start_slot = int(new_start_slot_raw)
+    except (ValueError, TypeError):
+        return {"success": False, "error": "Paramètres invalides"}
+    
+    # Trouver la tâche
+    task = PLANNING.store.get_task(task_id)
+    if not task:
+        return {"success": False, "error": "Tâche non trouvée"}
+    
+    old_operator_id = task["operator_id"]
+    duration_slots = get_task_duration_slots(task)
+    new_start_slot, span_slots, push_plan = plan_task_move(task, new_operator_id, new_start_slot)
+
+    if push_plan is None:
+        # Si impossible de pousser toutes les tâches vers la droite, ne pas déplacer la tâche
+        return {"success": False, "error": "Impossible de placer la tâche : pas assez d'espace"}
+
+    # Pousser toutes les tâches en collision vers la droite
+    apply_slot_plan(push_plan)
+
+    # Mettre à jour la tâche uniquement si le déplacement des collisions a réussi (durée réelle conservée)
+    PLANNING.store.set_task_operator(task, new_operator_id)
+    update_task_from_slots(task, new_start_slot, duration_slots)
+
+    # Résoudre les éventuelles collisions résiduelles sur le nouvel opérateur seulement si nécessaire
+    if old_operator_id != new_operator_id:
+        # Vérifier s'il y a réellement des collisions avant de résoudre
+        collision = check_collision(new_operator_id, new_start_slot, span_slots, task_id)
+        if collision:
+            resolve_all_collisions_on_operator(new_operator_id, anchor_task_id=task_id)
+    
+    return {"success": True}
+
+def keyboard_move_command(data):
+    """Déplacement au clavier d'une tâche (task_id) d'un slot ('left', 'right', avec poussée) ou
+    d'un opérateur ('up', 'down')"""
+    task_id = data.get('task_id')
+    direction = data.get('direction')  # 'left', 'right', 'up', 'down'
+    
+    if direction in ['left', 'right']:
+        # Si le déplacement est bloqué (blocked), rien n'est modifié
+        return handle_keyboard_push(task_id, direction)
+    
+    elif direction in ['up', 'down']:
+        # Déplacement vertical avec gestion des opérateurs dans l'ordre de la base de données
+        task = PLANNING.store.get_task(task_id)
+        if not task:
+            return {"success": False, "error": "Tâche non trouvée"}
         
-        task_id = data.get('task_id')
-        new_operator_id_raw = data.get('operator_id')
-        new_start_slot_raw = data.get('start_slot')
+        current_operator_id = task["operator_id"]
         
-        if not task_id:
-            return jsonify({"success": False, "error": "ID de tâche manquant"})
+        # Utiliser les opérateurs dans l'ordre de la requête SQL (ordre alphabétique par nom)
+        # Ce sont les mêmes opérateurs affichés dans l'interface
+        operator_ids_in_order = [op['id'] for op in PLANNING.store.operators]  # Garde l'ordre de la requête SQL
         
-        if new_operator_id_raw is None:
-            return jsonify({"success": False, "error": "ID d'opérateur manquant"})
+        # Trouver la position actuelle dans la liste
+        try:
+            current_index = operator_ids_in_order.index(current_operator_id)
+        except ValueError:
+            return {"success": False, "error": "Opérateur actuel introuvable"}
         
-        if new_start_slot_raw is None:
-            return jsonify({"success": False, "error": "Slot de début manquant"})
+        new_operator_id = current_operator_id
+        if direction == 'up' and current_index > 0:
+            new_operator_id = operator_ids_in_order[current_index - 1]
+        elif direction == 'down' and current_index < len(operator_ids_in_order) - 1:
+            new_operator_id = operator_ids_in_order[current_index + 1]
         
+        if new_operator_id != current_operator_id:
+            start_slot = get_task_start_slot(task)
+            duration_slots = get_task_duration_slots(task)
+
+            # Recaler sur le premier slot ouvert du nouvel opérateur (fermeture/absence)
+            start_slot = next_open_start_slot(new_operator_id, start_slot, direction=1)
+            span_slots = compute_span_slots(start_slot, duration_slots, new_operator_id)
+
+            # Vérifier d'abord si le déplacement est possible en utilisant la même logique robuste que pour les autres déplacements
+            pushed_tasks = push_tasks(new_operator_id, start_slot, span_slots, task_id)
+            
+            if pushed_tasks is None:
+                # Le déplacement n'est pas possible, garder l'opérateur actuel
+                return {"success": False, "error": "Impossible de déplacer la tâche vers cet opérateur : pas assez d'espace"}
+
+            # Le déplacement est possible, effectuer le changement d'opérateur
+            PLANNING.store.set_task_operator(task, new_operator_id)
+            update_task_from_slots(task, start_slot, duration_slots)
+        
+        return {"success": True, "new_operator_id": task["operator_id"]}
+    
+    return {"success": False, "error": "Direction invalide"}
+
+def resize_task_command(data):
+    """Redimensionne une tâche (task_id) au span visuel `duration` (ou à son span actuel + `delta`,
+    au moins 1 slot) et résout les collisions créées"""
+    task_id = data.get('task_id')
+    new_duration_raw = data.get('duration')
+    delta_raw = data.get('delta')
+    
+    if not task_id:
+        return {"success": False, "error": "ID de tâche manquant"}
+    
+    if new_duration_raw is None and delta_raw is None:
+        return {"success": False, "error": "Durée manquante"}
+    
+    # Trouver la tâche
+    task = PLANNING.store.get_task(task_id)
+    if not task:
+        return {"success": False, "error": "Tâche non trouvée"}
+
+    start_slot = get_task_start_slot(task)
+    try:
+        if new_duration_raw is not None:
+            dragged_span_slots = int(new_duration_raw)
+        else:
+            # Redimensionnement relatif (clavier) : jamais en dessous d'un slot
+            dragged_span_slots = max(1, get_task_span_slots(task, start_slot) + int(delta_raw))
+    except (ValueError, TypeError):
+        return {"success": False, "error": "Durée invalide"}
+
+    if dragged_span_slots <= 0:
+        return {"success": False, "error": "La durée doit être positive"}
+
+    # `dragged_span_slots` est le span visuel demandé (fermetures potentiellement incluses) ;
+    # la durée réelle (travaillée) ne compte que les slots ouverts dans cette plage
+    new_duration_slots = count_open_slots(start_slot, dragged_span_slots, task["operator_id"])
+    if new_duration_slots <= 0:
+        new_duration_slots = 1
+    update_task_from_slots(task, start_slot, new_duration_slots)
+
+    # Résoudre toutes les collisions créées par le redimensionnement seulement si nécessaire
+    span_slots = get_task_span_slots(task, start_slot)
+    collision = check_collision(task["operator_id"], start_slot, span_slots, task_id)
+    if collision:
+        resolve_all_collisions_on_operator(task["operator_id"], anchor_task_id=task_id)
+    
+    return {"success": True}
+
+def resize_and_move_task_command(data):
+    """Modifie à la fois la position (operator_id, start_slot) et le span visuel (duration)
+    d'une tâche (redimensionnement par la gauche)"""
+    task_id = data.get('task_id')
+    operator_id = data.get('operator_id')
+    new_start_slot = data.get('start_slot')
+    new_duration_raw = data.get('duration')
+    
+    # Validation des paramètres
+    if not task_id:
+        return {"success": False, "error": "ID de tâche manquant"}
+    
+    if operator_id is None:
+        return {"success": False, "error": "ID opérateur manquant"}
+    
+    if new_start_slot is None:
+        return {"success": False, "error": "Slot de départ manquant"}
+    
+    if new_duration_raw is None:
+        return {"success": False, "error": "Durée manquante"}
+    
+    try:
+        new_start_slot = int(new_start_slot)
+        dragged_span_slots = int(new_duration_raw)
+        operator_id = int(operator_id)
+    except (ValueError, TypeError):
+        return {"success": False, "error": "Paramètres numériques invalides"}
+
+    if new_start_slot < 0:
+        return {"success": False, "error": "Le slot de départ doit être positif"}
+
+    if dragged_span_slots <= 0:
+        return {"success": False, "error": "La durée doit être positive"}
+
+    # Trouver la tâche
+    task = PLANNING.store.get_task(task_id)
+    if not task:
+        return {"success": False, "error": "Tâche non trouvée"}
+
+    # Ancien opérateur, dont les collisions sont aussi à résoudre s'il change
+    old_operator_id = task["operator_id"]
+
+    # Recaler automatiquement sur le premier slot ouvert si la nouvelle position tombe
+    # sur un jour fermé (week-end/fermeture) ou une absence de l'opérateur cible
+    new_start_slot = next_open_start_slot(operator_id, new_start_slot, direction=1)
+
+    # `dragged_span_slots` est le span visuel demandé (fermetures potentiellement incluses) ;
+    # la durée réelle (travaillée) ne compte que les slots ouverts dans cette plage
+    new_duration_slots = count_open_slots(new_start_slot, dragged_span_slots, operator_id)
+    if new_duration_slots <= 0:
+        new_duration_slots = 1
+
+    # Mettre à jour la tâche avec les nouvelles position et durée
+    PLANNING.store.set_task_operator(task, operator_id)
+    update_task_from_slots(task, new_start_slot, new_duration_slots)
+
+    # Résoudre toutes les collisions créées par le déplacement/redimensionnement
+    span_slots = get_task_span_slots(task, new_start_slot)
+    collision = check_collision(operator_id, new_start_slot, span_slots, task_id)
+    if collision:
+        resolve_all_collisions_on_operator(operator_id, anchor_task_id=task_id)
+    
+    # Résoudre aussi les collisions sur l'ancien opérateur si différent
+    if old_operator_id != operator_id:
+        resolve_all_collisions_on_operator(old_operator_id)
+    
+    return {"success": True}
+
+# Commandes acceptées par /apply_commands (champ "type")
+TASK_COMMANDS = {
+    'move': move_task_command,
+    'keyboard_move': keyboard_move_command,
+    'resize': resize_task_command,
+    'resize_and_move': resize_and_move_task_command,
+}
+MAX_COMMANDS_PER_BATCH = 200
+
+def run_task_command(command, data):
+    """Exécute une commande puis enregistre en base les tâches modifiées (poussées comprises) ;
+    en cas d'échec, les modifications sont annulées en mémoire. Retourne la réponse JSON"""
+    result = command(data)
+    if not result["success"]:
+        PLANNING.store.rollback_changes()
+        return jsonify(result)
+    changed_tasks = persist_task_changes()
+    if changed_tasks is None:
+        return jsonify({"success": False, "error": "Erreur lors de la mise à jour en base de données"})
+    result["changes"] = build_task_changes(changed_tasks)
+    result["token"] = PLANNING.store.token
+    result["version"] = PLANNING.store.version
+    return jsonify(result)
+
+@app.route('/move_task', methods=['POST'])
+@with_write_lock
+def move_task():
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"success": False, "error": "Données JSON manquantes"})
+        return run_task_command(move_task_command, data)
+    
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Erreur serveur: {str(e)}"})
+
+@app.route('/preview_move')
+@with_planning_snapshot
+def preview_move():
+    """Aperçu d'un glisser-déposer en cours (appelé pendant le dragover) : position qu'aurait la
+    tâche déposée et tâches qui seraient poussées, calculées sur le dernier instantané publié,
+    sans verrou ni écriture.
+    Seul le plan de poussée (plan_task_move) est calculé : si le dépôt sur un autre opérateur
+    laisse une collision, le vrai déplacement résout en plus toutes les collisions de la ligne
+    et la réponse porte approximate=true"""
+    task = PLANNING.store.get_task(request.args.get('task_id'))
+    operator_id = request.args.get('operator_id', type=int)
+    start_slot = request.args.get('start_slot', type=int)
+    if not task:
+        return jsonify({"success": False, "error": "Tâche non trouvée"})
+    if operator_id is None or start_slot is None:
+        return jsonify({"success": False, "error": "Paramètres invalides"})
+
+    start_slot, span_slots, push_plan = plan_task_move(task, operator_id, start_slot)
+    approximate = (push_plan is not None and task["operator_id"] != operator_id
+                   and plan_leaves_collision(operator_id, start_slot, span_slots, task["id"], push_plan))
+    pushed = []
+    for pushed_task, new_start_slot in push_plan or ():
+        if new_start_slot != get_task_start_slot(pushed_task):
+            pushed.append({
+                "id": pushed_task["id"],
+                "operator_id": operator_id,
+                "start_slot": new_start_slot,
+                "duration": get_task_span_slots(pushed_task, new_start_slot),
+            })
+    return jsonify({
+        "success": True,
+        "blocked": push_plan is None,
+        "approximate": approximate,
+        "operator_id": operator_id,
+        "start_slot": start_slot,
+        "duration": span_slots,
+        "pushed": pushed,
+        "token": PLANNING.store.token,
+        "version": PLANNING.store.version,
+    })
+
+@app.route('/move_tasks', methods=['POST'])
+@with_write_lock
+def move_tasks():
+    """Déplacement groupé : les tâches choisies (task_ids, ou toutes celles d'une affaire
+    affaire_id / d'un OF production_id) sont décalées de `offset` slots et/ou placées sur
+    l'opérateur `operator_id`, avec une seule résolution des collisions et un seul
+    enregistrement en base"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"success": False, "error": "Données JSON manquantes"})
+
         try:
-            new_operator_id = int(new_operator_id_raw)
-            new_start_slot = int(new_start_slot_raw)
+            offset = int(data.get('offset') or 0)
+            operator_id = data.get('operator_id')
+            operator_id = int(operator_id) if operator_id is not None else None
+            task_ids = data.get('task_ids')
+            affaire_id = data.get('affaire_id')
+            affaire_id = int(affaire_id) if affaire_id is not None else None
+            production_id = data.get('production_id')
+            production_id = int(production_id) if production_id is not None else None
         except (ValueError, TypeError):
             return jsonify({"success": False, "error": "Paramètres invalides"})
-        
-        # Trouver la tâche
-        task = next((t for t in TASKS if t["id"] == task_id), None)
-        if not task:
-            return jsonify({"success": False, "error": "Tâche non trouvée"})
-        
-        # Sauvegarder l'ancienne position pour pouvoir revenir en arrière si nécessaire
-        old_operator_id = task["operator_id"]
-        old_start_slot = get_task_start_slot(task)
-        duration_slots = get_task_duration_slots(task)
-
-        # Recaler automatiquement sur le premier slot ouvert si la nouvelle position tombe
-        # sur un jour fermé (week-end/fermeture) ou une absence de l'opérateur cible
-        new_start_slot = next_open_start_slot(new_operator_id, new_start_slot, direction=1)
-        span_slots = compute_span_slots(new_start_slot, duration_slots, new_operator_id)
-
-        # Utiliser la nouvelle fonction qui pousse toutes les tâches en collision vers la droite
-        push_success = push_all_colliding_tasks_right(new_operator_id, new_start_slot, span_slots, task_id)
-
-        if not push_success:
-            # Si impossible de pousser toutes les tâches vers la droite, ne pas déplacer la tâche
-            return jsonify({"success": False, "error": "Impossible de placer la tâche : pas assez d'espace"})
-
-        # Mettre à jour la tâche uniquement si le déplacement des collisions a réussi (durée réelle conservée)
-        task["operator_id"] = new_operator_id
-        update_task_from_slots(task, new_start_slot, duration_slots)
-
-        # Résoudre les éventuelles collisions résiduelles sur le nouvel opérateur seulement si nécessaire
-        if old_operator_id != new_operator_id:
-            # Vérifier s'il y a réellement des collisions avant de résoudre
-            collision = check_collision(new_operator_id, new_start_slot, span_slots, task_id)
-            if collision:
-                resolve_all_collisions_on_operator(new_operator_id)
-        
-        # Mise à jour de la base de données PostgreSQL pour TOUTES les tâches de l'opérateur impacté
-        tasks_to_update = [
-            {
-                'id': t['id'],
-                'operator_id': t['operator_id'],
-                'start_date': t['start_date'],
-                'duration_hours': t['duration_hours']
-            }
-            for t in TASKS if t['operator_id'] == new_operator_id
-        ]
-        db_success = update_multiple_tasks_in_database(tasks_to_update) if tasks_to_update else True
-        if not db_success:
-            # En cas d'échec de la base de données, annuler la tâche principale au minimum
-            task["operator_id"] = old_operator_id
-            update_task_from_slots(task, old_start_slot, duration_slots)
+
+        if offset == 0 and operator_id is None:
+            return jsonify({"success": False, "error": "Décalage ou opérateur manquant"})
+
+        if operator_id is not None and not PLANNING.store.get_operator(operator_id):
+            return jsonify({"success": False, "error": "Opérateur non trouvé"})
+
+        # Sélection des tâches
+        if task_ids:
+            tasks = [PLANNING.store.get_task(str(task_id)) for task_id in task_ids]
+            if not all(tasks):
+                return jsonify({"success": False, "error": "Tâche non trouvée"})
+        elif affaire_id is not None or production_id is not None:
+            tasks = [task for task in PLANNING.store.tasks
+                     if (affaire_id is None or task["affaire_id"] == affaire_id)
+                     and (production_id is None or task["production_id"] == production_id)]
+        else:
+            return jsonify({"success": False, "error": "Sélection de tâches manquante"})
+
+        if not tasks:
+            return jsonify({"success": False, "error": "Aucune tâche sélectionnée"})
+        tasks = list({task["id"]: task for task in tasks}.values())  # Ids en double ignorés
+
+        # Les modifications en mémoire sont annulées par persist_task_changes en cas d'échec
+        moved_tasks = move_task_group(tasks, offset, operator_id)
+        if moved_tasks is None:
+            return jsonify({"success": False, "error": "Impossible de placer les tâches : pas assez d'espace"})
+
+        # Une seule mise à jour en base (une transaction) pour le groupe et les tâches poussées
+        changed_tasks = persist_task_changes()
+        if changed_tasks is None:
             return jsonify({"success": False, "error": "Erreur lors de la mise à jour en base de données"})
-        
-        return jsonify({"success": True})
-    
+
+        return jsonify({"success": True, "moved": len(tasks), "changes": build_task_changes(changed_tasks),
+                        "token": PLANNING.store.token, "version": PLANNING.store.version})
+
     except Exception as e:
         return jsonify({"success": False, "error": f"Erreur serveur: {str(e)}"})
 
 @app.route('/keyboard_move_task', methods=['POST'])
+@with_write_lock
 def keyboard_move_task():
     """Endpoint spécifique pour les déplacements au clavier avec poussée"""
     try:
         data = request.get_json()
-        task_id = data.get('task_id')
-        direction = data.get('direction')  # 'left', 'right', 'up', 'down'
-        
-        if direction in ['left', 'right']:
-            result = handle_keyboard_push(task_id, direction)
-            if result["success"]:
-                # Si le déplacement est bloqué, ne rien enregistrer
-                if result.get('blocked'):
-                    return jsonify(result)
-
-                # Persistons toutes les tâches de l'opérateur affecté (poussées comprises)
-                task = next((t for t in TASKS if t["id"] == task_id), None)
-                if task:
-                    operator_id = task["operator_id"]
-                    # Préparer un bulk update pour toutes les tâches de cet opérateur
-                    tasks_to_update = [
-                        {
-                            'id': t['id'],
-                            'operator_id': t['operator_id'],
-                            'start_date': t['start_date'],
-                            'duration_hours': t['duration_hours']
-                        }
-                        for t in TASKS if t['operator_id'] == operator_id
-                    ]
-                    if tasks_to_update:
-                        db_success = update_multiple_tasks_in_database(tasks_to_update)
-                        if not db_success:
-                            return jsonify({"success": False, "error": "Erreur lors de la mise à jour en base de données"})
-            return jsonify(result)
-        
-        elif direction in ['up', 'down']:
-            # Déplacement vertical avec gestion des opérateurs dans l'ordre de la base de données
-            task = next((t for t in TASKS if t["id"] == task_id), None)
-            if not task:
-                return jsonify({"success": False, "error": "Tâche non trouvée"})
-            
-            current_operator_id = task["operator_id"]
-            
-            # Utiliser les opérateurs dans l'ordre de la requête SQL (ordre alphabétique par nom)
-            # Ce sont les mêmes opérateurs affichés dans l'interface
-            operator_ids_in_order = [op['id'] for op in OPERATORS]  # Garde l'ordre de la requête SQL
-            
-            # Trouver la position actuelle dans la liste
-            try:
-                current_index = operator_ids_in_order.index(current_operator_id)
-            except ValueError:
-                return jsonify({"success": False, "error": "Opérateur actuel introuvable"})
-            
-            new_operator_id = current_operator_id
-            if direction == 'up' and current_index > 0:
-                new_operator_id = operator_ids_in_order[current_index - 1]
-            elif direction == 'down' and current_index < len(operator_ids_in_order) - 1:
-                new_operator_id = operator_ids_in_order[current_index + 1]
-            
-            if new_operator_id != current_operator_id:
-                # Sauvegarder l'ancienne position au cas où le déplacement échoue
-                old_operator_id = task["operator_id"]
-                start_slot = get_task_start_slot(task)
-                duration_slots = get_task_duration_slots(task)
-
-                # Recaler sur le premier slot ouvert du nouvel opérateur (fermeture/absence)
-                start_slot = next_open_start_slot(new_operator_id, start_slot, direction=1)
-                span_slots = compute_span_slots(start_slot, duration_slots, new_operator_id)
-
-                # Vérifier d'abord si le déplacement est possible en utilisant la même logique robuste que pour les autres déplacements
-                push_success = push_all_colliding_tasks_right(new_operator_id, start_slot, span_slots, task_id)
-                
-                if push_success:
-                    # Le déplacement est possible, effectuer le changement d'opérateur
-                    task["operator_id"] = new_operator_id
-                    update_task_from_slots(task, start_slot, duration_slots)
-
-                    # Persistons toutes les tâches du NOUVEL opérateur (poussées comprises)
-                    tasks_to_update = [
-                        {
-                            'id': t['id'],
-                            'operator_id': t['operator_id'],
-                            'start_date': t['start_date'],
-                            'duration_hours': t['duration_hours']
-                        }
-                        for t in TASKS if t['operator_id'] == new_operator_id
-                    ]
-                    db_success = update_multiple_tasks_in_database(tasks_to_update) if tasks_to_update else True
-                    if not db_success:
-                        # En cas d'échec de la base de données, annuler les modifications en mémoire
-                        task["operator_id"] = old_operator_id
-                        return jsonify({"success": False, "error": "Erreur lors de la mise à jour en base de données"})
-                else:
-                    # Le déplacement n'est pas possible, garder l'opérateur actuel
-                    return jsonify({"success": False, "error": "Impossible de déplacer la tâche vers cet opérateur : pas assez d'espace"})
-            
-            return jsonify({"success": True, "new_operator_id": task["operator_id"]})
-        
-        return jsonify({"success": False, "error": "Direction invalide"})
+        return run_task_command(keyboard_move_command, data)
         
     except Exception as e:
         return jsonify({"success": False, "error": f"Erreur serveur: {str(e)}"})
 
 @app.route('/resize_task', methods=['POST'])
+@with_write_lock
 def resize_task():
     try:
         data = request.get_json()
         if not data:
             return jsonify({"success": False, "error": "Données JSON manquantes"})
-        
-        task_id = data.get('task_id')
-        new_duration_raw = data.get('duration')
-        
-        if not task_id:
-            return jsonify({"success": False, "error": "ID de tâche manquant"})
-        
-        if new_duration_raw is None:
-            return jsonify({"success": False, "error": "Durée manquante"})
-        
-        try:
-            dragged_span_slots = int(new_duration_raw)
-        except (ValueError, TypeError):
-            return jsonify({"success": False, "error": "Durée invalide"})
-
-        if dragged_span_slots <= 0:
-            return jsonify({"success": False, "error": "La durée doit être positive"})
-
-        # Trouver la tâche
-        task = next((t for t in TASKS if t["id"] == task_id), None)
-        if not task:
-            return jsonify({"success": False, "error": "Tâche non trouvée"})
-
-        # Sauvegarder l'ancienne durée pour comparaison
-        old_duration_slots = get_task_duration_slots(task)
-
-        # `dragged_span_slots` est le span visuel demandé (fermetures potentiellement incluses) ;
-        # la durée réelle (travaillée) ne compte que les slots ouverts dans cette plage
-        start_slot = get_task_start_slot(task)
-        new_duration_slots = count_open_slots(start_slot, dragged_span_slots, task["operator_id"])
-        if new_duration_slots <= 0:
-            new_duration_slots = 1
-        update_task_from_slots(task, start_slot, new_duration_slots)
-
-        # Résoudre toutes les collisions créées par le redimensionnement seulement si nécessaire
-        span_slots = get_task_span_slots(task, start_slot)
-        collision = check_collision(task["operator_id"], start_slot, span_slots, task_id)
-        if collision:
-            resolve_all_collisions_on_operator(task["operator_id"])
-        
-        # Mise à jour de la base de données PostgreSQL pour toutes les tâches de l'opérateur (si des poussées ont eu lieu)
-        operator_id = task["operator_id"]
-        tasks_to_update = [
-            {
-                'id': t['id'],
-                'operator_id': t['operator_id'],
-                'start_date': t['start_date'],
-                'duration_hours': t['duration_hours']
-            }
-            for t in TASKS if t['operator_id'] == operator_id
-        ]
-        db_success = update_multiple_tasks_in_database(tasks_to_update) if tasks_to_update else True
-        if not db_success:
-            # En cas d'échec de la base de données, annuler les modifications en mémoire
-            update_task_from_slots(task, start_slot, old_duration_slots)
-            return jsonify({"success": False, "error": "Erreur lors de la mise à jour en base de données"})
-        
-        return jsonify({"success": True})
+        return run_task_command(resize_task_command, data)
     
     except Exception as e:
         return jsonify({"success": False, "error": f"Erreur serveur: {str(e)}"})
 
 @app.route('/resize_and_move_task', methods=['POST'])
+@with_write_lock
 def resize_and_move_task():
     """Endpoint combiné pour modifier à la fois la position et la durée d'une tâche (left resize)"""
     try:
         data = request.get_json()
         if not data:
             return jsonify({"success": False, "error": "Données JSON manquantes"})
-        
-        task_id = data.get('task_id')
-        operator_id = data.get('operator_id')
-        new_start_slot = data.get('start_slot')
-        new_duration_raw = data.get('duration')
-        
-        # Validation des paramètres
-        if not task_id:
-            return jsonify({"success": False, "error": "ID de tâche manquant"})
-        
-        if operator_id is None:
-            return jsonify({"success": False, "error": "ID opérateur manquant"})
-        
-        if new_start_slot is None:
-            return jsonify({"success": False, "error": "Slot de départ manquant"})
-        
-        if new_duration_raw is None:
-            return jsonify({"success": False, "error": "Durée manquante"})
-        
-        try:
-            new_start_slot = int(new_start_slot)
-            dragged_span_slots = int(new_duration_raw)
-            operator_id = int(operator_id)
-        except (ValueError, TypeError):
-            return jsonify({"success": False, "error": "Paramètres numériques invalides"})
+        return run_task_command(resize_and_move_task_command, data)
+    
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
 
-        if new_start_slot < 0:
-            return jsonify({"success": False, "error": "Le slot de départ doit être positif"})
+@app.route('/apply_commands', methods=['POST'])
+@with_write_lock
+def apply_commands():
+    """Applique dans l'ordre une suite de commandes ({"type": "move" | "keyboard_move" | "resize"
+    | "resize_and_move", ...paramètres de la route correspondante}), par exemple une rafale de
+    touches du clavier : tout ou rien, un seul enregistrement en base et une seule nouvelle
+    version. Retourne le résultat de chaque commande et l'ensemble des tâches modifiées"""
+    try:
+        data = request.get_json()
+        commands = data.get('commands') if data else None
+        if not commands or not isinstance(commands, list):
+            return jsonify({"success": False, "error": "Commandes manquantes"})
+        if len(commands) > MAX_COMMANDS_PER_BATCH:
+            return jsonify({"success": False, "error": f"Trop de commandes (maximum {MAX_COMMANDS_PER_BATCH})"})
+
+        results = []
+        for position, command_data in enumerate(commands):
+            command = TASK_COMMANDS.get(command_data.get('type')) if isinstance(command_data, dict) else None
+            result = command(command_data) if command else {"success": False, "error": "Commande invalide"}
+            if not result["success"]:
+                # Annuler en mémoire les commandes déjà appliquées
+                PLANNING.store.rollback_changes()
+                return jsonify({"success": False, "error": result["error"], "failed_command": position})
+            results.append(result)
+
+        changed_tasks = persist_task_changes()
+        if changed_tasks is None:
+            return jsonify({"success": False, "error": "Erreur lors de la mise à jour en base de données"})
 
-        if dragged_span_slots <= 0:
-            return jsonify({"success": False, "error": "La durée doit être positive"})
+        return jsonify({"success": True, "results": results, "changes": build_task_changes(changed_tasks),
+                        "token": PLANNING.store.token, "version": PLANNING.store.version})
 
-        # Trouver la tâche
-        task = next((t for t in TASKS if t["id"] == task_id), None)
-        if not task:
-            return jsonify({"success": False, "error": "Tâche non trouvée"})
+    except Exception as e:
+        PLANNING.store.rollback_changes()
+        return jsonify({"success": False, "error": f"Erreur serveur: {str(e)}"})
 
-        # Sauvegarder les anciennes valeurs pour comparaison
-        old_start_slot = get_task_start_slot(task)
-        old_duration_slots = get_task_duration_slots(task)
-        old_operator_id = task["operator_id"]
+def _is_filled(value):
+    """Vrai si une valeur texte issue d'Odoo est renseignée (ni vide, ni 'None', ni 'False')"""
+    return bool(value) and value != 'None' and value != 'False' and str(value).strip() != ''
+
+def build_display_task(task, affair):
+    """Données d'affichage d'une tâche pour le navigateur (sérialisables en JSON) :
+    position en slots, affaire résolue et dates déjà formatées"""
+    end_date = task["end_date"]
+    is_date_prevue = task["is_date_prevue"]
+    derniere_date_prevue = task["is_derniere_date_prevue"]
+    start_slot = get_task_start_slot(task)
+    return {
+        "id": task["id"],
+        "operator_id": task["operator_id"],
+        "affaire_id": task["affaire_id"],
+        "start_slot": start_slot,
+        "duration": get_task_span_slots(task, start_slot),
+        "name": task["name"],
+        "operation_name": task["operation_name"],
+        "product_qty": task["product_qty"],
+        "is_employe_ids_txt": task["is_employe_ids_txt"],
+        "is_composants_non_disponibles": task["is_composants_non_disponibles"],
+        "production_name": task["production_name"],
+        "is_derniere_date_prevue": str(derniere_date_prevue) if derniere_date_prevue else None,
+        "derniere_date_prevue_label": derniere_date_prevue.strftime('%d/%m/%y') if derniere_date_prevue else '',
+        "is_date_prevue": str(is_date_prevue) if is_date_prevue else None,
+        "date_prevue_of": is_date_prevue.strftime('%Y-%m-%d') if is_date_prevue else '',
+        "end_date": end_date.strftime('%Y-%m-%d %H:%M:%S') if end_date else '',
+        "affair_name": affair["name"],
+        "background_color": task["color"] or affair["color"],
+        # Utiliser is_date_prevue de l'OF pour la comparaison
+        "is_late": bool(end_date and is_date_prevue and end_date.date() > is_date_prevue),
+        "missing_components": _is_filled(task["is_composants_non_disponibles"]),
+    }
 
-        # Recaler automatiquement sur le premier slot ouvert si la nouvelle position tombe
-        # sur un jour fermé (week-end/fermeture) ou une absence de l'opérateur cible
-        new_start_slot = next_open_start_slot(operator_id, new_start_slot, direction=1)
+def get_closure_runs(operator_id, slot_start, slot_end):
+    """Plages de slots fermés de l'opérateur dans [slot_start, slot_end), en run-length :
+    [slot de début, nombre de slots, classes CSS] (week-end / congé / absence)"""
+    calendar = get_slot_calendar()
+    index = get_closure_index(operator_id)
+    vacation_slot_flags = PLANNING.vacation_slot_flags
+    runs = []
+    for slot in range(slot_start, slot_end):
+        if not index.closed[slot]:
+            continue
+        classes = " ".join(name for name, flag in (
+            ("weekend-slot", calendar.weekend[slot]),
+            ("vacation-slot", vacation_slot_flags[slot]),
+            ("absence-slot", index.absent[slot]),
+        ) if flag)
+        last = runs[-1] if runs else None
+        if last and last[0] + last[1] == slot and last[2] == classes:
+            last[1] += 1
+        else:
+            runs.append([slot, 1, classes])
+    return runs
+
+@app.route('/api/viewport')
+@with_planning_snapshot
+def get_viewport():
+    """Fenêtre visible du planning : tâches et fermetures des opérateurs
+    [operator_start, operator_end) (rang d'affichage) sur les slots [slot_start, slot_end).
+    Si focus_task_id est fourni, cette tâche (et sa ligne) est toujours incluse."""
+    store = PLANNING.store
+    num_operators = len(store.operators)
+    slot_start = max(0, request.args.get('slot_start', 0, type=int))
+    slot_end = min(PLANNING.num_slots, request.args.get('slot_end', PLANNING.num_slots, type=int))
+    operator_start = max(0, request.args.get('operator_start', 0, type=int))
+    operator_end = min(num_operators, request.args.get('operator_end', num_operators, type=int))
+    focus_task = store.get_task(request.args.get('focus_task_id'))
+
+    # Les index de fermeture sont reconstruits ici si l'horizon a changé
+    get_closure_index(None)
+
+    operators = store.operators[operator_start:operator_end]
+    if focus_task and not any(op["id"] == focus_task["operator_id"] for op in operators):
+        focus_operator = store.get_operator(focus_task["operator_id"])
+        if focus_operator:
+            operators = operators + [focus_operator]
+
+    rows = []
+    for operator in operators:
+        row_tasks = []
+        if slot_end > slot_start:
+            row_tasks = store.get_row_index(operator["id"]).overlapping(slot_start, slot_end - slot_start)
+        if focus_task and focus_task["operator_id"] == operator["id"] and focus_task not in row_tasks:
+            row_tasks = row_tasks + [focus_task]
+        display_tasks = []
+        for task in row_tasks:
+            # Vérifier si l'affaire existe, sinon sauter cette tâche
+            affair = store.get_affair(task['affaire_id'])
+            if affair:
+                display_tasks.append(build_display_task(task, affair))
+        rows.append({
+            "operator_id": operator["id"],
+            "tasks": display_tasks,
+            "closures": get_closure_runs(operator["id"], slot_start, slot_end) if slot_end > slot_start else [],
+        })
 
-        # `dragged_span_slots` est le span visuel demandé (fermetures potentiellement incluses) ;
-        # la durée réelle (travaillée) ne compte que les slots ouverts dans cette plage
-        new_duration_slots = count_open_slots(new_start_slot, dragged_span_slots, operator_id)
-        if new_duration_slots <= 0:
-            new_duration_slots = 1
+    return jsonify({
+        "slot_start": slot_start,
+        "slot_end": slot_end,
+        "operator_start": operator_start,
+        "operator_end": operator_end,
+        "num_slots": PLANNING.num_slots,
+        "token": store.token,
+        "version": store.version,
+        "rules_key": get_planning_rules_key(),
+        "rows": rows,
+    })
 
-        # Mettre à jour la tâche avec les nouvelles position et durée
-        task["operator_id"] = operator_id
-        update_task_from_slots(task, new_start_slot, new_duration_slots)
+def get_planning_rules_key():
+    """Identifiant des règles de placement (horizon et fermetures) : le navigateur recharge
+    /api/planning_rules quand il change"""
+    get_slot_epoch()
+    return f"{PLANNING.start_date.isoformat()}-{PLANNING.num_slots}-{PLANNING.slot_epoch}"
+
+def get_slot_runs(flags):
+    """Plages [slot de début, nombre de slots] des slots marqués d'un bitmap"""
+    runs = []
+    for slot, flag in enumerate(flags):
+        if not flag:
+            continue
+        if runs and runs[-1][0] + runs[-1][1] == slot:
+            runs[-1][1] += 1
+        else:
+            runs.append([slot, 1])
+    return runs
+
+@app.route('/api/planning_rules')
+@with_planning_snapshot
+def get_planning_rules():
+    """Règles de placement pour le moteur de déplacement optimiste du navigateur (script.js),
+    qui reproduit next_open_start_slot, compute_span_slots et plan_push : horizon, slots fermés
+    communs (week-ends, fermetures globales) et absences de chaque opérateur, en plages"""
+    key = get_planning_rules_key()
+    default_index = get_closure_index(None)
+    absences = {}
+    for operator in PLANNING.store.operators:
+        runs = get_slot_runs(get_closure_index(operator["id"]).absent)
+        if runs:
+            absences[str(operator["id"])] = runs
+    return jsonify({
+        "key": key,
+        "num_slots": PLANNING.num_slots,
+        "start_weekday": PLANNING.start_date.weekday(),  # Week-ends hors horizon
+        "closed": get_slot_runs(default_index.closed),
+        "absences": absences,
+    })
 
-        # Résoudre toutes les collisions créées par le déplacement/redimensionnement
-        span_slots = get_task_span_slots(task, new_start_slot)
-        collision = check_collision(operator_id, new_start_slot, span_slots, task_id)
-        if collision:
-            resolve_all_collisions_on_operator(operator_id)
-        
-        # Résoudre aussi les collisions sur l'ancien opérateur si différent
-        if old_operator_id != operator_id:
-            resolve_all_collisions_on_operator(old_operator_id)
-        
-        # Mise à jour de la base de données PostgreSQL pour toutes les tâches du NOUVEL opérateur
-        tasks_to_update = [
-            {
-                'id': t['id'],
-                'operator_id': t['operator_id'],
-                'start_date': t['start_date'],
-                'duration_hours': t['duration_hours']
-            }
-            for t in TASKS if t['operator_id'] == operator_id
-        ]
-        db_success = update_multiple_tasks_in_database(tasks_to_update) if tasks_to_update else True
-        if not db_success:
-            # En cas d'échec de la base de données, annuler les modifications en mémoire
-            task["operator_id"] = old_operator_id
-            update_task_from_slots(task, old_start_slot, old_duration_slots)
-            return jsonify({"success": False, "error": "Erreur lors de la mise à jour en base de données"})
-        
-        return jsonify({"success": True})
-    
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
+def get_planning_etag():
+    """ETag de l'état courant du planning (planning sélectionné + historique et version des tâches)"""
+    return f"{PLANNING.store.token}-{DATABASE.id}-{PLANNING.planning_id}-{PLANNING.store.version}"
 
 @app.route('/get_planning_data')
+@with_planning_snapshot
 def get_planning_data():
+    """Données du planning. Avec ?since=N&token=T, retourne seulement les tâches créées,
+    modifiées ou supprimées depuis la version N de l'historique T (full=true si N est trop
+    ancienne ou T n'est pas le token du store : tout recharger).
+    Répond 304 si le planning n'a pas changé depuis l'ETag envoyé par le client."""
+    etag = get_planning_etag()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    since = request.args.get('since', type=int)
+    if since is not None:
+        changes = PLANNING.store.changes_since(since, request.args.get('token'))
+        if changes is None:
+            response = jsonify({"token": PLANNING.store.token, "version": PLANNING.store.version,
+                                "full": True})
+        else:
+            changed_tasks, deleted_task_ids = changes
+            display_tasks = []
+            for task in changed_tasks:
+                # Une tâche sans affaire n'est pas affichée : la signaler comme supprimée
+                affair = PLANNING.store.get_affair(task['affaire_id'])
+                if affair:
+                    display_tasks.append(build_display_task(task, affair))
+                else:
+                    deleted_task_ids.append(task["id"])
+            response = jsonify({
+                "token": PLANNING.store.token,
+                "version": PLANNING.store.version,
+                "full": False,
+                "tasks": display_tasks,
+                "deleted": deleted_task_ids
+            })
+        response.set_etag(etag)
+        return response
+
     # Convertir les tâches pour l'affichage (même logique que dans index())
     display_tasks = []
-    for task in TASKS:
-        display_task = task.copy()
+    for task in PLANNING.store.tasks:
+        display_task = task.to_dict()
         start_slot = get_task_start_slot(task)
         duration_slots = get_task_span_slots(task, start_slot)
         display_task["start_slot"] = start_slot
@@ -1898,17 +3610,83 @@ def get_planning_data():
     # # Garder seulement les opérateurs qui ont des tâches, dans l'ordre de la requête SQL
     # filtered_operators = [op for op in OPERATORS if op['id'] in operators_with_tasks]
     
-    return jsonify({
+    response = jsonify({
+        "token": PLANNING.store.token,
+        "version": PLANNING.store.version,
         "tasks": display_tasks,
-        "operators": OPERATORS,  # Utiliser tous les opérateurs
-        "affairs": AFFAIRES
+        "operators": PLANNING.store.operators,  # Utiliser tous les opérateurs
+        "affairs": PLANNING.store.affairs
+    })
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/planning/<int:planning_id>/events')
+def planning_events(planning_id):
+    """Flux SSE (text/event-stream) des modifications du planning : un événement 'changes' par
+    validation (déplacements de ce processus ou notifications PostgreSQL des autres).
+    Les paramètres since et token (ou l'en-tête Last-Event-ID "token:version" à la
+    reconnexion) donnent la version déjà affichée : les modifications manquées sont envoyées
+    dès la connexion (rechargement complet si le token n'est plus celui du store)"""
+    if planning_id != PLANNING.planning_id:
+        return jsonify({"success": False, "error": "Planning non chargé"}), 404
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id:
+        token, _, since = last_event_id.rpartition(':')
+    else:
+        token, since = request.args.get('token'), request.args.get('since')
+    try:
+        since = int(since) if since is not None else None
+    except ValueError:
+        since = None
+    
+    # Le flux garde une référence sur le planning : il n'est pas évincé du cache tant qu'un
+    # navigateur l'écoute
+    planning = get_planning_context()
+    retain_planning_context(planning)
+    subscriber = queue.Queue(maxsize=PLANNING_EVENT_QUEUE_SIZE)
+    with planning.write_lock:
+        # Abonnement et rattrapage sous le même verrou : aucune modification ne peut être manquée
+        with planning.subscribers_lock:
+            planning.subscribers.add(subscriber)
+        catch_up = None
+        store = PLANNING.store
+        if since is not None and (token != store.token or since != store.version):
+            delta = store.changes_since(since, token)
+            if delta is None:
+                catch_up = build_planning_event(store.token, store.version, full=True)
+            else:
+                changed, deleted = delta
+                catch_up = build_planning_event(store.token, store.version, changed, deleted)
+        event_id = get_planning_event_id(store.token, store.version)
+    
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            if catch_up:
+                yield format_sse_event(event_id, catch_up)
+            while True:
+                try:
+                    next_event_id, data = subscriber.get(timeout=PLANNING_EVENT_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse_event(next_event_id, data)
+        finally:
+            with planning.subscribers_lock:
+                planning.subscribers.discard(subscriber)
+            release_planning_context(planning)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Pas de mise en tampon par nginx
     })
 
 @app.route('/debug_tasks')
+@with_planning_snapshot
 def debug_tasks():
     """Endpoint de debug pour vérifier l'état des tâches"""
     debug_info = []
-    for task in TASKS:
+    for task in PLANNING.store.tasks:
         debug_info.append({
             "name": task["name"],
             "operator_id": task["operator_id"],
@@ -1921,12 +3699,13 @@ def debug_tasks():
     return jsonify(debug_info)
 
 @app.route('/debug_html')
+@with_planning_snapshot
 def debug_html():
     """Endpoint de debug pour vérifier le rendu HTML des tâches"""
     # Convertir les tâches pour l'affichage (même logique que dans index())
     display_tasks = []
-    for task in TASKS:
-        display_task = task.copy()
+    for task in PLANNING.store.tasks:
+        display_task = task.to_dict()
         display_task["start_slot"] = get_task_start_slot(task)
         display_task["duration"] = get_task_span_slots(task)
         # Ajouter des informations de debug
@@ -1936,101 +3715,215 @@ def debug_html():
     
     return jsonify(display_tasks)
 
-@app.route('/api/reload-data', methods=['POST'])
-def reload_data():
-    """Recharge à la fois les opérateurs, les affaires et les tâches depuis la base de données"""
-    global OPERATORS, AFFAIRES, TASKS, START_DATE, NUM_SLOTS
+# === RECHARGEMENTS EN ARRIÈRE-PLAN ===
+
+class ReloadJob:
+    """Rechargement d'un planning exécuté par RELOAD_JOBS_EXECUTOR : état et avancement
+    consultables par /api/jobs/<id> (status : pending, running, done, failed)"""
+
+    def __init__(self, database_id, planning_id):
+        self.id = uuid.uuid4().hex
+        self.database_id = database_id
+        self.planning_id = planning_id
+        self.status = 'pending'
+        self.progress = 0  # Pourcentage
+        self.step = "En attente"
+        self.result = None
+        self.error = None
+        self.finished_at = None  # time.monotonic() de fin (purge)
+
+    def update(self, progress, step):
+        self.progress = progress
+        self.step = step
+        logger.info("Rechargement %s (planning %s) : %s", self.id, self.planning_id, step)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "step": self.step,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+# Pool borné des rechargements : un rechargement long (recalculs Odoo) n'occupe pas de worker HTTP
+RELOAD_JOBS_EXECUTOR = ThreadPoolExecutor(max_workers=RELOAD_JOB_WORKERS, thread_name_prefix='reload-job')
+RELOAD_JOBS = {}  # id -> ReloadJob (en cours, ou terminés depuis moins de RELOAD_JOB_RETENTION_SECONDS)
+RELOAD_JOBS_LOCK = threading.Lock()
+
+
+def submit_reload_job():
+    """Soumet le rechargement du planning de la session ; un rechargement déjà en attente ou en
+    cours pour ce planning est réutilisé"""
+    database_id = getattr(REQUEST_CONTEXT, 'database_id', None)
+    planning_id = getattr(REQUEST_CONTEXT, 'planning_id', None)
+    now = time.monotonic()
+    with RELOAD_JOBS_LOCK:
+        for job_id, job in list(RELOAD_JOBS.items()):
+            if job.finished_at is not None and now - job.finished_at > RELOAD_JOB_RETENTION_SECONDS:
+                del RELOAD_JOBS[job_id]
+            elif (job.finished_at is None and job.database_id == database_id
+                  and job.planning_id == planning_id):
+                return job
+        job = ReloadJob(database_id, planning_id)
+        RELOAD_JOBS[job.id] = job
+    RELOAD_JOBS_EXECUTOR.submit(run_reload_job, job)
+    return job
+
+def run_reload_job(job):
+    """Exécute un rechargement dans un thread du pool, lié au planning du job"""
+    job.status = 'running'
+    try:
+        bind_request_context(job.database_id, job.planning_id)
+        job.result = reload_planning(job)
+        job.update(100, "Terminé")
+        job.status = 'done'
+    except Exception as e:
+        logger.exception("Rechargement %s (planning %s) en échec", job.id, job.planning_id)
+        job.error = f"Erreur lors du rechargement: {str(e)}"
+        job.status = 'failed'
+    finally:
+        job.finished_at = time.monotonic()
+        unbind_request_context()
+
+def run_odoo_reload_actions():
+    """Si maj_of_auto est coché, appelle action_maj_date_of puis action_chargement_taches via
+    XML-RPC (en un seul appel, sinon un appel par action si le module Odoo n'est pas à jour).
+    Seule l'absence de la méthode combinée fait rappeler les actions une par une : après une
+    autre erreur (délai dépassé, transport...), Odoo a pu les exécuter et l'erreur est signalée.
+    Retourne le complément du message de rechargement"""
+    maj_of_msg = ""
     try:
-        # Recharger la date de fin du planning (peut avoir été modifiée dans Odoo)
-        if CURRENT_PLANNING_ID:
-            load_planning_end_date(CURRENT_PLANNING_ID)
+        meta = get_planning_meta()
+        if meta and meta.get('maj_of_auto'):
+            combined_method = 'action_maj_date_of_et_chargement_taches'
+            try:
+                results = execute_odoo_xmlrpc(
+                    'is.gestion.tache.planning',
+                    combined_method,
+                    [[PLANNING.planning_id]]
+                ) or {}
+                result = True if results.get('maj_date_of') else None
+                result_chargement = True if results.get('chargement_taches') else None
+            except xmlrpc.client.Fault as e:
+                if not is_odoo_missing_method_fault(e, combined_method):
+                    raise
+                result = call_odoo_xmlrpc(
+                    'is.gestion.tache.planning',
+                    'action_maj_date_of',
+                    [[PLANNING.planning_id]]
+                )
+                result_chargement = call_odoo_xmlrpc(
+                    'is.gestion.tache.planning',
+                    'action_chargement_taches',
+                    [[PLANNING.planning_id]]
+                )
+            if result is not None:
+                maj_of_msg = " | Maj date OF effectuée"
+            else:
+                maj_of_msg = " | Maj date OF échouée"
+
+            if result_chargement is not None:
+                maj_of_msg += " | Charger les tâches effectuée"
+            else:
+                maj_of_msg += " | Charger les tâches échouée"
+    except Exception as e:
+        logger.exception("Actions Odoo du rechargement en erreur : %s", e)
+        maj_of_msg = f" | Maj date OF erreur: {e}"
+    return maj_of_msg
+
+def reload_planning(job):
+    """Recharge à la fois les opérateurs, les affaires et les tâches du planning lié au thread.
+    Les appels Odoo se font hors verrou : le planning reste consultable et modifiable pendant ce
+    temps. La lecture en base et la substitution du nouvel état se font ensuite d'un coup sous
+    write_lock (une modification enregistrée entre les deux serait sinon perdue en mémoire)"""
+    planning = get_planning_context()
+
+    # Recharger les métadonnées du planning (la date de fin peut avoir été modifiée dans Odoo)
+    job.update(5, "Lecture du planning")
+    load_planning_meta(planning.planning_id)
+
+    # ÉTAPE 1 : Maj date OF et chargement des tâches dans Odoo
+    job.update(10, "Mise à jour des OF et des tâches dans Odoo")
+    maj_of_msg = run_odoo_reload_actions()
+
+    job.update(70, "Chargement du planning")
+    with planning.write_lock:
+        try:
+            # ÉTAPE 2 : Recharger métadonnées, opérateurs, affaires, tâches et fermetures en une
+            # requête, sous le verrou comme refresh_notified_tasks
+            meta, new_operators, new_affaires, new_tasks, fermetures = load_planning_from_db(planning.planning_id)
+
+            # Mettre à jour le planning en mémoire seulement si tout s'est bien passé
+            job.update(90, "Mise à jour du planning")
+            set_planning_meta(meta)
+            planning.store = PlanningStore(operators=new_operators, affairs=new_affaires, tasks=new_tasks,
+                                           version=planning.store.version, token=planning.store.token)
+            publish_planning_changes(planning.store.version, full=True)
+
+            # Recalculer la date de début du planning basée sur les nouvelles tâches
+            planning.start_date = calculate_planning_start_date(planning.store.tasks)
+
+            # Recalculer num_slots
+            calculate_num_slots()
 
-        # ÉTAPE 1 : Si maj_of_auto est coché, appeler action_maj_date_of puis action_chargement_taches via XML-RPC
-        maj_of_msg = ""
-        if CURRENT_PLANNING_ID:
+            # Fermetures après avoir défini les opérateurs
             try:
-                conn = get_db_connection()
-                if conn:
-                    with conn.cursor() as cursor:
-                        cursor.execute("SELECT maj_of_auto FROM is_gestion_tache_planning WHERE id = %s", (CURRENT_PLANNING_ID,))
-                        row = cursor.fetchone()
-                        if row and row[0]:
-                            result = call_odoo_xmlrpc(
-                                'is.gestion.tache.planning',
-                                'action_maj_date_of',
-                                [[CURRENT_PLANNING_ID]]
-                            )
-                            if result is not None:
-                                maj_of_msg = " | Maj date OF effectuée"
-                            else:
-                                maj_of_msg = " | Maj date OF échouée"
-
-                            result_chargement = call_odoo_xmlrpc(
-                                'is.gestion.tache.planning',
-                                'action_chargement_taches',
-                                [[CURRENT_PLANNING_ID]]
-                            )
-                            if result_chargement is not None:
-                                maj_of_msg += " | Charger les tâches effectuée"
-                            else:
-                                maj_of_msg += " | Charger les tâches échouée"
-                    conn.close()
-            except Exception as e:
-                maj_of_msg = f" | Maj date OF erreur: {e}"
-        
-        # ÉTAPE 2 : Recharger les opérateurs
-        new_operators = load_operators_from_db(CURRENT_PLANNING_ID)
-        operators_count = len(new_operators)
-        
-        # Recharger les affaires (filtrées par planning si applicable)
-        new_affaires = load_affaires_from_db(CURRENT_PLANNING_ID)
-        affaires_count = len(new_affaires)
-        
-        # Recharger les tâches (filtrées par planning si applicable)
-        new_tasks = load_tasks_from_db(CURRENT_PLANNING_ID)
-        tasks_count = len(new_tasks)
-        
-        # Mettre à jour les variables globales seulement si tout s'est bien passé
-        OPERATORS = new_operators
-        AFFAIRES = new_affaires
-        TASKS = new_tasks
-        
-        # Recalculer la date de début du planning basée sur les nouvelles tâches
-        START_DATE = calculate_planning_start_date(TASKS)
-        
-        # Recalculer NUM_SLOTS
-        calculate_num_slots()
-        
-        # Recharger les fermetures après avoir défini OPERATORS
-        load_fermetures_from_db(CURRENT_PLANNING_ID)
-        
-        # Message avec statut des fermetures
-        #fermetures_msg = "fermetures mises à jour" if maj_fermetures_success else "fermetures (erreur)"
-        message = f"{operators_count} opérateurs, {affaires_count} affaires, {tasks_count} tâches rechargés{maj_of_msg}"
-        
+                set_fermetures(fermetures)
+            finally:
+                build_closure_indexes()
+        finally:
+            publish_planning_snapshot()
+
+    message = f"{len(new_operators)} opérateurs, {len(new_affaires)} affaires, {len(new_tasks)} tâches rechargés{maj_of_msg}"
+    return {
+        "message": message,
+        "operators_count": len(new_operators),
+        "affairs_count": len(new_affaires),
+        "tasks_count": len(new_tasks),
+    }
+
+@app.route('/api/reload-data', methods=['POST'])
+def reload_data():
+    """Lance le rechargement du planning de la session en arrière-plan ; l'avancement se suit
+    avec /api/jobs/<id>"""
+    if not session.get('planning_id'):
         return jsonify({
-            "success": True, 
-            "message": message,
-            "operators": OPERATORS,
-            "affairs": AFFAIRES,
-            "tasks_count": tasks_count
-        })
-    except Exception as e:
+            "success": False,
+            "message": "Aucun planning sélectionné"
+        }), 400
+    job = submit_reload_job()
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status_url": url_for('get_job', job_id=job.id),
+        "job": job.to_dict()
+    }), 202
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """État et avancement d'un rechargement (connu du seul processus qui l'exécute)"""
+    with RELOAD_JOBS_LOCK:
+        job = RELOAD_JOBS.get(job_id)
+    if job is None or job.database_id != session.get('database_id'):
         return jsonify({
-            "success": False, 
-            "message": f"Erreur lors du rechargement: {str(e)}"
-        }), 500
+            "success": False,
+            "message": "Rechargement inconnu"
+        }), 404
+    return jsonify({"success": True, "job": job.to_dict()})
 
 @app.route('/api/reload-affairs', methods=['POST'])
+@with_write_lock
 def reload_affairs():
     """Recharge les affaires depuis la base de données"""
-    global AFFAIRES
     try:
-        AFFAIRES = load_affaires_from_db(CURRENT_PLANNING_ID)
+        PLANNING.store.set_affairs(load_affaires_from_db(PLANNING.planning_id))
         return jsonify({
             "success": True, 
-            "message": f"{len(AFFAIRES)} affaires rechargées",
-            "affairs": AFFAIRES
+            "message": f"{len(PLANNING.store.affairs)} affaires rechargées",
+            "affairs": PLANNING.store.affairs
         })
     except Exception as e:
         return jsonify({
@@ -2039,17 +3932,17 @@ def reload_affairs():
         }), 500
 
 @app.route('/api/reload-operators', methods=['POST'])
+@with_write_lock
 def reload_operators():
     """Recharge les opérateurs depuis la base de données"""
-    global OPERATORS
     try:
-        OPERATORS = load_operators_from_db(CURRENT_PLANNING_ID)
+        PLANNING.store.set_operators(load_operators_from_db(PLANNING.planning_id))
         # Recharger les fermetures dépendantes des opérateurs
-        load_fermetures_from_db(CURRENT_PLANNING_ID)
+        load_fermetures_from_db(PLANNING.planning_id)
         return jsonify({
             "success": True, 
-            "message": f"{len(OPERATORS)} opérateurs rechargés",
-            "operators": OPERATORS
+            "message": f"{len(PLANNING.store.operators)} opérateurs rechargés",
+            "operators": PLANNING.store.operators
         })
     except Exception as e:
         return jsonify({
@@ -2058,26 +3951,27 @@ def reload_operators():
         }), 500
 
 @app.route('/api/reload-tasks', methods=['POST'])
+@with_write_lock
 def reload_tasks():
     """Recharge les tâches depuis la base de données"""
-    global TASKS, START_DATE, NUM_SLOTS
     try:
-        # Recharger la date de fin du planning (peut avoir été modifiée dans Odoo)
-        if CURRENT_PLANNING_ID:
-            load_planning_end_date(CURRENT_PLANNING_ID)
+        # Recharger les métadonnées du planning (la date de fin peut avoir été modifiée dans Odoo)
+        if PLANNING.planning_id:
+            load_planning_meta(PLANNING.planning_id)
 
-        TASKS = load_tasks_from_db(CURRENT_PLANNING_ID)
+        PLANNING.store.set_tasks(load_tasks_from_db(PLANNING.planning_id))
         
         # Recalculer la date de début du planning basée sur les nouvelles tâches
-        START_DATE = calculate_planning_start_date(TASKS)
+        PLANNING.start_date = calculate_planning_start_date(PLANNING.store.tasks)
         
-        # Recalculer NUM_SLOTS
+        # Recalculer num_slots
         calculate_num_slots()
+        publish_planning_changes(PLANNING.store.version, full=True)
         
         return jsonify({
             "success": True, 
-            "message": f"{len(TASKS)} tâches rechargées",
-            "tasks_count": len(TASKS)
+            "message": f"{len(PLANNING.store.tasks)} tâches rechargées",
+            "tasks_count": len(PLANNING.store.tasks)
         })
     except Exception as e:
         return jsonify({
@@ -2086,14 +3980,16 @@ def reload_tasks():
         }), 500
 
 @app.route('/api/affairs')
+@with_planning_snapshot
 def get_affairs():
     """Retourne la liste des affaires"""
-    return jsonify({"affairs": AFFAIRES})
+    return jsonify({"affairs": PLANNING.store.affairs})
 
 @app.route('/api/operators')
+@with_planning_snapshot
 def get_operators():
     """Retourne la liste des opérateurs"""
-    return jsonify({"operators": OPERATORS})
+    return jsonify({"operators": PLANNING.store.operators})
 
 @app.route('/test_timezone_conversion')
 def test_timezone_conversion():
@@ -2113,7 +4009,7 @@ def test_timezone_conversion():
     
     results = []
     for naive_date in test_cases:
-        # Conversion Paris → UTC (comme dans update_task_in_database)
+        # Conversion Paris → UTC (comme dans update_multiple_tasks_in_database)
         paris_date = paris_tz.normalize(paris_tz.localize(naive_date))
         utc_date = paris_date.astimezone(utc_tz)
         
@@ -2121,6 +4017,7 @@ def test_timezone_conversion():
             "naive_paris": naive_date.strftime("%Y-%m-%d %H:%M:%S"),
             "paris_with_tz": paris_date.strftime("%Y-%m-%d %H:%M:%S %Z"),
             "utc": utc_date.strftime("%Y-%m-%d %H:%M:%S %Z"),
+            "utc_stockage": paris_to_utc(naive_date).strftime("%Y-%m-%d %H:%M:%S"),  # Écriture en base
             "offset": paris_date.strftime("%z")
         })
     
@@ -10,3 +10,23 @@ DATABASE_CONFIG = {
     # Si un mot de passe est nécessaire, décommentez la ligne suivante :
     # 'password': 'votre_mot_de_passe'
 }
+
+# Pools de connexions PostgreSQL (un pool par base de DATABASES) - optionnel
+# Les trois valeurs doivent être définies ensemble, sinon les valeurs par défaut sont utilisées
+DB_POOL_MINCONN = 1               # Connexions ouvertes à la création du pool
+DB_POOL_MAXCONN = 10              # Connexions simultanées maximum par base
+DB_POOL_CHECK_IDLE_SECONDS = 30   # Au-delà de cette inactivité, la connexion est testée (SELECT 1) avant réutilisation
+DB_POOL_WAIT_SECONDS = 5          # Attente maximale d'une connexion libre quand le pool est épuisé
+
+# Plannings gardés en mémoire (partagés par les sessions) - optionnel
+# Au-delà, les plannings les moins récemment utilisés sont déchargés
+PLANNING_CACHE_MAX_PLANNINGS = 8       # Nombre maximum de plannings chargés
+PLANNING_CACHE_MAX_TASKS = 200000      # Nombre maximum de tâches chargées (tous plannings confondus)
+
+# Rechargements de planning (/api/reload-data) exécutés en arrière-plan en parallèle - optionnel
+RELOAD_JOB_WORKERS = 2
+
+# Clé de signature du cookie de session (base et planning choisis par chaque navigateur)
+# Doit être identique pour tous les processus (workers gunicorn) : générer avec
+# python -c "import secrets; print(secrets.token_hex(32))"
+SECRET_KEY = 'remplacer-par-une-cle-aleatoire'
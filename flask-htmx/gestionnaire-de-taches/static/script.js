@@ -7,12 +7,40 @@ let selectedTask = null;
 let tooltipTimeout = null;
 let recentlyResizedTasks = new Set(); // Protection contre l'écrasement après redimensionnement
 
+// Virtualisation : seules les tâches et fermetures de la fenêtre visible (plus une marge) sont dans le DOM
+const VIEWPORT_MARGIN_SLOTS = 30; // Créneaux chargés de part et d'autre de la zone visible
+const VIEWPORT_MARGIN_ROWS = 5;   // Lignes d'opérateurs chargées au-dessus et en dessous
+let loadedViewport = null;        // Fenêtre actuellement rendue (slots x rangs d'opérateurs)
+let viewportRequestId = 0;        // Permet d'ignorer les réponses périmées
+let viewportTimer = null;
+let dropIndicator = null;
+
+// Aperçu des tâches poussées pendant un glisser-déposer (/preview_move)
+const PUSH_PREVIEW_DELAY = 30; // ms sans changement de créneau visé avant de demander l'aperçu
+let pushPreviewKey = null;     // Tâche et créneau visés par l'aperçu affiché ou demandé
+let pushPreviewTimer = null;
+
+// Version des tâches affichées et ETag de la dernière réponse delta de /get_planning_data.
+// planningToken identifie l'historique de versions du serveur : deux versions ne sont
+// comparables que si elles ont le même token
+let planningVersion = window.planningConfig ? window.planningConfig.version : 0;
+let planningToken = window.planningConfig ? window.planningConfig.token : null;
+let planningEtag = null;
+let planningEvents = null; // EventSource des modifications faites par les autres utilisateurs
+
+// Règles de placement de /api/planning_rules pour le déplacement optimiste
+let planningRules = null;      // {key, numSlots, startWeekday, closed, closedByOperator}
+let planningRulesKey = null;   // Clé des règles à jour (reçue avec chaque fenêtre)
+let optimisticMoveInFlight = false;
+
 // Initialisation
 document.addEventListener('DOMContentLoaded', function() {
     console.log('DOM chargé, initialisation...');
     setupEventListeners();
     setupScrollSync();
     setupDragAndDrop();
+    setupViewport();
+    setupPlanningEvents();
     
     // Initialiser le double-clic sur les tâches
     console.log('Initialisation du double-clic sur les tâches...');
@@ -52,6 +80,7 @@ function setupScrollSync() {
             timeHeaderSlotsInner.style.transform = `translateX(-${scrollLeft}px)`;
         }
         
+        scheduleViewportUpdate();
         setTimeout(() => { isScrolling = false; }, 10);
     });
     
@@ -76,28 +105,33 @@ function setupScrollSync() {
                 }
             });
             
+            scheduleViewportUpdate();
             setTimeout(() => { isScrolling = false; }, 10);
         });
     });
 }
 
 function setupDragAndDrop() {
-    // Ajouter les événements de drag aux slots
-    document.querySelectorAll('.time-slot').forEach(slot => {
-        slot.addEventListener('dragover', handleDragOver);
-        slot.addEventListener('dragenter', handleDragEnter);
-        slot.addEventListener('dragleave', handleDragLeave);
-        slot.addEventListener('drop', handleDrop);
-    });
+    // Événements de drag délégués au conteneur des lignes : il n'y a plus un élément par créneau,
+    // le créneau visé est calculé à partir de la position de la souris
+    const operatorsContainer = document.querySelector('.operators-container');
+    if (operatorsContainer) {
+        operatorsContainer.addEventListener('dragover', handleDragOver);
+        operatorsContainer.addEventListener('dragenter', handleDragEnter);
+        operatorsContainer.addEventListener('dragleave', handleDragLeave);
+        operatorsContainer.addEventListener('drop', handleDrop);
+    }
     
-    document.querySelectorAll('.task').forEach(task => {
-        task.addEventListener('dragend', function() {
-            this.classList.remove('dragging');
-            this.style.opacity = '';
-            // Retirer la classe du body pour indiquer que le drag est terminé
-            document.body.classList.remove('dragging-active');
-            draggedTask = null;
-        });
+    // Les tâches sont créées au fil du défilement : fin de drag déléguée au document
+    document.addEventListener('dragend', function(e) {
+        const task = e.target.closest ? e.target.closest('.task') : null;
+        if (!task) return;
+        task.classList.remove('dragging');
+        task.style.opacity = '';
+        hideDropIndicator();
+        // Retirer la classe du body pour indiquer que le drag est terminé
+        document.body.classList.remove('dragging-active');
+        draggedTask = null;
     });
 }
 
@@ -140,50 +174,133 @@ function handleDragStart(e) {
     }, 0);
 }
 
+// Créneau et opérateur sous la souris pendant un drag (null hors de la grille)
+function getDropTarget(e) {
+    const wrapper = e.target.closest ? e.target.closest('.time-slots-wrapper') : null;
+    if (!wrapper) return null;
+    const operatorRow = wrapper.closest('.operator-row');
+    const rect = wrapper.getBoundingClientRect();
+    const slot = Math.floor((e.clientX - rect.left) / getSlotWidth());
+    return {
+        wrapper: wrapper,
+        operatorId: parseInt(operatorRow.dataset.operatorId),
+        slot: Math.max(0, Math.min(getNumSlots() - 1, slot))
+    };
+}
+
+function showDropIndicator(target) {
+    if (!dropIndicator) {
+        dropIndicator = document.createElement('div');
+        dropIndicator.className = 'drop-indicator';
+    }
+    if (dropIndicator.parentNode !== target.wrapper) {
+        target.wrapper.appendChild(dropIndicator);
+    }
+    dropIndicator.style.left = `calc(${target.slot} * var(--slot-width))`;
+}
+
+function hideDropIndicator() {
+    if (dropIndicator && dropIndicator.parentNode) {
+        dropIndicator.parentNode.removeChild(dropIndicator);
+    }
+    hidePushPreview();
+}
+
+// Demande l'aperçu des tâches poussées quand le créneau visé change (une fois le pointeur
+// arrêté PUSH_PREVIEW_DELAY ms) : rien n'est modifié côté serveur
+function schedulePushPreview(target) {
+    if (!draggedTask) return;
+    const taskId = draggedTask.dataset.taskId;
+    const key = `${taskId}:${target.operatorId}:${target.slot}`;
+    if (key === pushPreviewKey) return;
+    pushPreviewKey = key;
+    clearPushPreviewElements();
+    if (pushPreviewTimer) {
+        clearTimeout(pushPreviewTimer);
+    }
+    pushPreviewTimer = setTimeout(() => {
+        pushPreviewTimer = null;
+        const params = new URLSearchParams({ task_id: taskId, operator_id: target.operatorId, start_slot: target.slot });
+        fetch(`/preview_move?${params}`)
+        .then(response => response.json())
+        .then(data => {
+            // Ignorer un aperçu arrivé après un changement de créneau ou la fin du drag
+            if (key !== pushPreviewKey || !data.success) return;
+            showPushPreview(data);
+        })
+        .catch(error => {
+            // L'aperçu est facultatif : le dépôt reste possible
+        });
+    }, PUSH_PREVIEW_DELAY);
+}
+
+// Affiche les positions qu'auraient les tâches poussées (ou signale un dépôt impossible)
+function showPushPreview(data) {
+    clearPushPreviewElements();
+    if (dropIndicator) {
+        dropIndicator.classList.toggle('drop-blocked', data.blocked);
+    }
+    data.pushed.forEach(change => {
+        const operatorRow = document.querySelector(`.operator-row[data-operator-id="${change.operator_id}"]`);
+        if (!operatorRow) return;
+        const ghost = document.createElement('div');
+        ghost.className = 'push-preview';
+        ghost.style.left = `calc(${change.start_slot} * var(--slot-width))`;
+        ghost.style.width = `calc(${change.duration} * var(--slot-width) - 2px)`;
+        operatorRow.querySelector('.time-slots-wrapper').appendChild(ghost);
+    });
+}
+
+function clearPushPreviewElements() {
+    document.querySelectorAll('.push-preview').forEach(ghost => ghost.remove());
+    if (dropIndicator) {
+        dropIndicator.classList.remove('drop-blocked');
+    }
+}
+
+function hidePushPreview() {
+    pushPreviewKey = null;
+    if (pushPreviewTimer) {
+        clearTimeout(pushPreviewTimer);
+        pushPreviewTimer = null;
+    }
+    clearPushPreviewElements();
+}
+
 function handleDragOver(e) {
+    // Toujours permettre le drop, même sur un créneau occupé
+    const target = getDropTarget(e);
+    if (!target) return;
     e.preventDefault();
     e.dataTransfer.dropEffect = 'move';
-    
-    // Toujours permettre le drop, même sur un slot occupé
-    const timeSlot = e.target.closest('.time-slot');
-    if (timeSlot) {
-        timeSlot.classList.add('drag-over');
-    }
+    showDropIndicator(target);
+    schedulePushPreview(target);
 }
 
 function handleDragEnter(e) {
-    e.preventDefault();
-    // Toujours permettre l'entrée sur n'importe quel slot
-    const timeSlot = e.target.closest('.time-slot');
-    if (timeSlot) {
-        timeSlot.classList.add('drag-over');
+    if (getDropTarget(e)) {
+        e.preventDefault();
     }
 }
 
 function handleDragLeave(e) {
-    const timeSlot = e.target.closest('.time-slot');
-    if (timeSlot && !timeSlot.contains(e.relatedTarget)) {
-        timeSlot.classList.remove('drag-over');
+    // Masquer l'indicateur seulement quand on quitte la grille
+    if (!e.relatedTarget || !e.currentTarget.contains(e.relatedTarget)) {
+        hideDropIndicator();
     }
 }
 
 function handleDrop(e) {
     e.preventDefault();
     
-    const timeSlot = e.target.closest('.time-slot');
-    if (!timeSlot || !draggedTask) return;
-    
-    // Nettoyer les classes de feedback visuel
-    document.querySelectorAll('.time-slot').forEach(slot => {
-        slot.classList.remove('drag-over');
-    });
+    const target = getDropTarget(e);
+    hideDropIndicator();
+    if (!target || !draggedTask) return;
     
-    const newOperatorId = parseInt(timeSlot.dataset.operatorId);
-    const newStartSlot = parseInt(timeSlot.dataset.slot);
     const taskId = draggedTask.dataset.taskId;
     
     // Envoyer la requête de déplacement
-    moveTask(taskId, newOperatorId, newStartSlot);
+    moveTask(taskId, target.operatorId, target.slot);
     
     // Nettoyer
     if (draggedTask) {
@@ -330,12 +447,12 @@ function handleKeyDown(e) {
         case '+':
         case '=':
             e.preventDefault();
-            resizeTask(taskId, duration + 1);
+            queueKeyboardCommand({ type: 'resize', task_id: taskId, delta: 1 });
             return;
         case '-':
             e.preventDefault();
             if (duration > 1) {
-                resizeTask(taskId, duration - 1);
+                queueKeyboardCommand({ type: 'resize', task_id: taskId, delta: -1 });
             }
             return;
         case 'Delete':
@@ -348,17 +465,39 @@ function handleKeyDown(e) {
     }
 }
 
-// Nouvelle fonction simplifiée pour les déplacements clavier
+// Commandes clavier en attente : une rafale de touches (touche maintenue, frappes rapides) part
+// en une seule requête /apply_commands, appliquée d'un bloc par le serveur ; les touches frappées
+// pendant une requête partent avec la suivante
+const KEYBOARD_COALESCE_DELAY = 60; // ms d'attente des touches suivantes avant envoi
+const MAX_COMMANDS_PER_BATCH = 200; // Limite du serveur
+let pendingKeyboardCommands = [];
+let keyboardCommandsInFlight = false;
+let keyboardFlushTimer = null;
+
 function keyboardMoveTask(taskId, direction) {
-    fetch('/keyboard_move_task', {
+    queueKeyboardCommand({ type: 'keyboard_move', task_id: taskId, direction: direction });
+}
+
+function queueKeyboardCommand(command) {
+    pendingKeyboardCommands.push(command);
+    if (!keyboardCommandsInFlight && !keyboardFlushTimer) {
+        keyboardFlushTimer = setTimeout(flushKeyboardCommands, KEYBOARD_COALESCE_DELAY);
+    }
+}
+
+function flushKeyboardCommands() {
+    keyboardFlushTimer = null;
+    if (keyboardCommandsInFlight || pendingKeyboardCommands.length === 0) return;
+    
+    const commands = pendingKeyboardCommands.splice(0, MAX_COMMANDS_PER_BATCH);
+    const taskId = commands[commands.length - 1].task_id;
+    keyboardCommandsInFlight = true;
+    fetch('/apply_commands', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
-        body: JSON.stringify({
-            task_id: taskId,
-            direction: direction
-        })
+        body: JSON.stringify({ commands: commands })
     })
     .then(response => {
         if (!response.ok) {
@@ -368,22 +507,37 @@ function keyboardMoveTask(taskId, direction) {
     })
     .then(data => {
         if (data.success) {
-            // Utiliser refreshPlanning AVEC scroll automatique pour tous les déplacements clavier
             // Le scroll suit la tâche pour qu'elle reste toujours visible
-            refreshPlanning(taskId, true);
+            refreshPlanning(taskId, true, data);
         } else {
-            // Afficher le message d'erreur spécifique du serveur
+            // Afficher le message d'erreur spécifique du serveur (aucune commande de la rafale n'est appliquée)
             const errorMessage = data.error || 'Erreur lors du déplacement de la tâche';
             showNotification(errorMessage, 'error');
         }
     })
     .catch(error => {
         showNotification('Erreur de communication avec le serveur', 'error');
+    })
+    .finally(() => {
+        keyboardCommandsInFlight = false;
+        flushKeyboardCommands();
     });
 }
 
 // Fonctions HTMX/AJAX
 function moveTask(taskId, newOperatorId, newStartSlot) {
+    // Déplacement affiché tout de suite si son résultat est prévisible (un seul à la fois) ;
+    // la réponse du serveur fait foi
+    let previousPositions = null;
+    if (!optimisticMoveInFlight) {
+        const taskElement = document.querySelector(`.operators-container .task[data-task-id="${taskId}"]`);
+        const changes = taskElement ? planOptimisticMove(taskElement, newOperatorId, newStartSlot) : null;
+        if (changes) {
+            previousPositions = applyOptimisticChanges(changes);
+            optimisticMoveInFlight = true;
+        }
+    }
+    
     fetch('/move_task', {
         method: 'POST',
         headers: {
@@ -398,14 +552,30 @@ function moveTask(taskId, newOperatorId, newStartSlot) {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
+            // Remettre en place les tâches que le serveur n'a finalement pas déplacées ; les autres
+            // reçoivent les positions du serveur
+            if (previousPositions) {
+                rollbackOptimisticChanges(previousPositions, new Set(data.changes.map(change => String(change.id))));
+            }
             // Rafraîchir complètement le planning pour voir toutes les tâches poussées AVEC scroll automatique
-            refreshPlanning(taskId, true); // true = avec scroll automatique pour drag & drop
+            refreshPlanning(taskId, true, data); // true = avec scroll automatique pour drag & drop
         } else {
+            if (previousPositions) {
+                rollbackOptimisticChanges(previousPositions);
+            }
             showNotification('Erreur lors du déplacement de la tâche', 'error');
         }
     })
     .catch(error => {
+        if (previousPositions) {
+            rollbackOptimisticChanges(previousPositions);
+        }
         showNotification('Erreur de communication avec le serveur', 'error');
+    })
+    .finally(() => {
+        if (previousPositions) {
+            optimisticMoveInFlight = false;
+        }
     });
 }
 
@@ -529,7 +699,7 @@ function resizeTask(taskId, newDuration, newStartSlot = null, operatorId = null)
             
             // Rafraîchir pour récupérer les données mises à jour AVEC scroll automatique
             setTimeout(() => {
-                refreshPlanning(taskId, true); // true = avec scroll automatique pour redimensionnement
+                refreshPlanning(taskId, true, data); // true = avec scroll automatique pour redimensionnement
             }, 50);
         } else {
             showNotification('Erreur lors du redimensionnement de la tâche', 'error');
@@ -554,18 +724,25 @@ function resizeTask(taskId, newDuration, newStartSlot = null, operatorId = null)
     });
 }
 
-function refreshPlanning(taskIdToKeepFocused = null, autoScroll = true) {
-    // Au lieu de recharger toute la page, on met à jour les données via AJAX
-    fetch('/get_planning_data')
-    .then(response => response.json())
-    .then(data => {
-        updateTaskPositions(data.tasks, data.affairs, taskIdToKeepFocused);
-        
+function refreshPlanning(taskIdToKeepFocused = null, autoScroll = true, operationResult = null) {
+    // Au lieu de recharger toute la page, on applique directement les tâches déplacées renvoyées
+    // par l'opération, sinon on récupère les tâches modifiées depuis la version affichée ;
+    // si la tâche à suivre est hors de la fenêtre chargée, on recharge la fenêtre
+    // (le serveur inclut toujours la tâche à suivre)
+    const changesApplied = operationResult !== null && applyTaskChanges(operationResult);
+    (changesApplied ? Promise.resolve() : fetchPlanningChanges())
+    .then(() => {
+        if (taskIdToKeepFocused && !document.querySelector(`.task[data-task-id="${taskIdToKeepFocused}"]`)) {
+            return updateViewport(true, taskIdToKeepFocused);
+        }
+        return null;
+    })
+    .then(() => {
         // Restaurer le focus sur la tâche qui était sélectionnée
         if (taskIdToKeepFocused) {
             // Utiliser un délai plus long et une approche plus robuste
             const restoreFocus = () => {
-                const taskToFocus = document.querySelector(`[data-task-id="${taskIdToKeepFocused}"]`);
+                const taskToFocus = document.querySelector(`.task[data-task-id="${taskIdToKeepFocused}"]`);
                 if (taskToFocus) {
                     // S'assurer que la tâche reste sélectionnée et focalisée
                     if (!taskToFocus.classList.contains('selected')) {
@@ -611,57 +788,609 @@ function refreshPlanning(taskIdToKeepFocused = null, autoScroll = true) {
     });
 }
 
-function updateTaskPositions(tasks, affairs, targetTaskId = null) {
-    // Mettre à jour les positions de toutes les tâches
-    tasks.forEach(taskData => {
-        const taskElement = document.querySelector(`[data-task-id="${taskData.id}"]`);
-        if (taskElement) {
-            // Mettre à jour les données
-            taskElement.dataset.operatorId = taskData.operator_id;
-            taskElement.dataset.startSlot = taskData.start_slot;
-            taskElement.dataset.duration = taskData.duration;
-            taskElement.dataset.affairId = taskData.affaire_id;
-            
-            // Ne pas écraser la position/taille si la tâche est en cours de redimensionnement
-            // ou a été récemment redimensionnée
-            if (!taskElement.classList.contains('resizing') && !recentlyResizedTasks.has(taskData.id)) {
-                // Optimisation : ne mettre à jour que si les valeurs ont réellement changé
-                const currentLeft = taskElement.style.left;
-                const currentWidth = taskElement.style.width;
-                const newLeft = `calc(${taskData.start_slot} * var(--slot-width))`;
-                const newWidth = `calc(${taskData.duration} * var(--slot-width) - 2px)`;
-                
-                // Mettre à jour seulement si nécessaire pour éviter les re-layouts inutiles
-                if (currentLeft !== newLeft) {
-                    taskElement.style.left = newLeft;
-                }
-                if (currentWidth !== newWidth) {
-                    taskElement.style.width = newWidth;
-                }
+// Applique les modifications depuis planningVersion (delta), ou recharge la fenêtre si le
+// serveur ne peut pas fournir de delta (version trop ancienne, données rechargées)
+function fetchPlanningChanges() {
+    const headers = {};
+    if (planningEtag) {
+        headers['If-None-Match'] = planningEtag;
+    }
+    return fetch(`/get_planning_data?since=${planningVersion}&token=${planningToken}`, { headers: headers })
+    .then(response => {
+        if (response.status === 304) {
+            return null; // Rien n'a changé
+        }
+        if (!response.ok) {
+            throw new Error(`Erreur HTTP: ${response.status}`);
+        }
+        planningEtag = response.headers.get('ETag');
+        return response.json();
+    })
+    .then(data => {
+        if (!data) return null;
+        if (data.full) {
+            return updateViewport(true);
+        }
+        applyPlanningChanges(data);
+        return data;
+    });
+}
+
+// Applique les positions renvoyées par /move_task, /keyboard_move_task, /resize_task...
+// (tâche modifiée et tâches poussées) ou reçues par le flux SSE. Retourne false si le résultat
+// ne suffit pas : autre historique de versions (token), autre modification intercalée
+// (version non consécutive) ou tâche à créer dans la fenêtre.
+function applyTaskChanges(data) {
+    if (!data.changes || data.token !== planningToken) return false;
+    if (data.version <= planningVersion) return true; // Déjà affiché
+    if (data.version !== planningVersion + 1) return false;
+    
+    const updates = [];
+    for (const change of data.changes) {
+        const operatorRow = document.querySelector(`.operator-row[data-operator-id="${change.operator_id}"]`);
+        const taskElement = document.querySelector(`.operators-container .task[data-task-id="${change.id}"]`);
+        const visible = isInLoadedViewport(operatorRow, change);
+        if (visible && !taskElement) return false;
+        updates.push([change, operatorRow, taskElement, visible]);
+    }
+    
+    (data.deleted || []).forEach(taskId => {
+        const taskElement = document.querySelector(`.operators-container .task[data-task-id="${taskId}"]`);
+        if (taskElement && !isTaskBusy(taskElement)) {
+            if (taskElement === selectedTask) {
+                selectedTask = null;
             }
-            
-            // Vérifier si la tâche a changé d'opérateur
-            const currentOperatorRow = taskElement.closest('.operator-row');
-            const targetOperatorRow = document.querySelector(`.operator-row[data-operator-id="${taskData.operator_id}"]`);
-            
-            // Ne déplacer dans le DOM QUE si l'opérateur a réellement changé
-            if (currentOperatorRow && targetOperatorRow && 
-                currentOperatorRow.dataset.operatorId !== taskData.operator_id.toString()) {
-                
-                // Vérification supplémentaire : s'assurer que c'est un vrai changement d'opérateur
-                const currentOperatorId = parseInt(currentOperatorRow.dataset.operatorId);
-                const targetOperatorId = taskData.operator_id;
-                
-                if (currentOperatorId !== targetOperatorId) {
-                    // Déplacer la tâche vers le bon opérateur SEULEMENT si nécessaire
-                    const targetContainer = targetOperatorRow.querySelector('.time-slots-container');
-                    if (targetContainer && !targetContainer.contains(taskElement)) {
-                        targetContainer.appendChild(taskElement);
-                    }
+            taskElement.remove();
+        }
+    });
+    updates.forEach(([change, operatorRow, taskElement, visible]) => {
+        if (!taskElement || isTaskBusy(taskElement)) return;
+        if (!visible) {
+            if (taskElement === selectedTask) {
+                selectedTask = null;
+            }
+            taskElement.remove();
+            return;
+        }
+        placeTaskElement(taskElement, operatorRow, change);
+    });
+    planningVersion = data.version;
+    return true;
+}
+
+// Place une tâche sur sa ligne à la position {operator_id, start_slot, duration (span)}
+function placeTaskElement(taskElement, operatorRow, change) {
+    taskElement.dataset.operatorId = change.operator_id;
+    taskElement.dataset.startSlot = change.start_slot;
+    taskElement.dataset.duration = change.duration;
+    taskElement.style.left = `calc(${change.start_slot} * var(--slot-width))`;
+    taskElement.style.width = `calc(${change.duration} * var(--slot-width) - 2px)`;
+    const wrapper = operatorRow.querySelector('.time-slots-wrapper');
+    if (taskElement.parentNode !== wrapper) {
+        wrapper.appendChild(taskElement);
+    }
+}
+
+// === DÉPLACEMENT OPTIMISTE ===
+// Réplique dans le navigateur des règles de placement du serveur (next_open_start_slot,
+// compute_span_slots, plan_push) : la tâche déposée et les tâches qu'elle pousse sont
+// déplacées sans attendre la réponse, puis recalées sur les positions renvoyées par le serveur,
+// ou remises en place s'il refuse le déplacement. Seules les tâches de la fenêtre chargée sont
+// connues du navigateur : au-delà, c'est la réponse du serveur qui complète.
+
+// Charge les règles de placement si elles ont changé (horizon, fermetures, absences)
+function loadPlanningRules(key) {
+    if (planningRulesKey === key) return;
+    planningRulesKey = key;
+    fetch('/api/planning_rules')
+    .then(response => {
+        if (!response.ok) {
+            throw new Error(`Erreur HTTP: ${response.status}`);
+        }
+        return response.json();
+    })
+    .then(data => {
+        const closed = new Uint8Array(data.num_slots);
+        data.closed.forEach(([startSlot, length]) => closed.fill(1, startSlot, startSlot + length));
+        const closedByOperator = new Map();
+        Object.entries(data.absences).forEach(([operatorId, runs]) => {
+            const operatorClosed = closed.slice();
+            runs.forEach(([startSlot, length]) => operatorClosed.fill(1, startSlot, startSlot + length));
+            closedByOperator.set(operatorId, operatorClosed);
+        });
+        planningRules = {
+            key: data.key,
+            numSlots: data.num_slots,
+            startWeekday: data.start_weekday,
+            closed: closed,
+            closedByOperator: closedByOperator
+        };
+    })
+    .catch(error => {
+        // Sans règles, les déplacements attendent simplement la réponse du serveur
+        planningRulesKey = null;
+    });
+}
+
+// Bitmap des slots fermés de l'opérateur (week-ends, fermetures globales et absences)
+function getClosedSlots(operatorId) {
+    return planningRules.closedByOperator.get(String(operatorId)) || planningRules.closed;
+}
+
+// Slot fermé ; hors horizon, seuls les week-ends sont connus (comme is_closed_slot à partir des dates)
+function isClosedSlot(closed, slot) {
+    if (slot >= 0 && slot < closed.length) return closed[slot] === 1;
+    const weekday = ((planningRules.startWeekday + Math.floor(slot / 2)) % 7 + 7) % 7;
+    return weekday >= 5;
+}
+
+// Premier slot ouvert >= slot (numSlots s'il n'y en a plus), comme next_open_start_slot
+function nextOpenStartSlot(closed, slot) {
+    if (slot < 0 || slot >= closed.length) return slot;
+    while (slot < closed.length && closed[slot]) {
+        slot++;
+    }
+    return slot;
+}
+
+// Slots occupés à l'écran par realDuration slots de travail à partir de startSlot, comme
+// compute_span_slots
+function computeSpanSlots(closed, startSlot, realDuration) {
+    let remaining = realDuration;
+    let slot = startSlot;
+    while (remaining > 0) {
+        if (!isClosedSlot(closed, slot)) {
+            remaining--;
+        }
+        slot++;
+    }
+    return slot - startSlot;
+}
+
+// Slots de travail (ouverts) dans [startSlot, startSlot + span), comme count_open_slots
+function countOpenSlots(closed, startSlot, span) {
+    let count = 0;
+    for (let slot = startSlot; slot < startSlot + span; slot++) {
+        if (!isClosedSlot(closed, slot)) {
+            count++;
+        }
+    }
+    return count;
+}
+
+// Tâches de la ligne présentes dans le DOM, par début croissant
+function getRowTasks(operatorRow, closed) {
+    return Array.from(operatorRow.querySelectorAll('.time-slots-wrapper .task'), element => {
+        const startSlot = parseInt(element.dataset.startSlot);
+        const span = parseInt(element.dataset.duration);
+        return {
+            id: element.dataset.taskId,
+            element: element,
+            startSlot: startSlot,
+            span: span,
+            realDuration: countOpenSlots(closed, startSlot, span)
+        };
+    }).sort((a, b) => a.startSlot - b.startSlot);
+}
+
+// Décalage vers la droite des tâches qui gênent [startSlot, startSlot + span), comme plan_push :
+// [{task, startSlot, span}], ou null si une tâche sortirait du planning
+function planPushRight(rowTasks, closed, startSlot, span, excludeTaskId) {
+    const plan = [];
+    let frontier = startSlot + span;
+    for (const task of rowTasks) {
+        if (task.id === excludeTaskId) continue;
+        if (task.startSlot + task.span <= startSlot) continue; // Entièrement avant le bloc
+        if (task.startSlot >= frontier) break; // Cette tâche et les suivantes sont déjà après
+        const newStartSlot = nextOpenStartSlot(closed, frontier);
+        const newSpan = computeSpanSlots(closed, newStartSlot, task.realDuration);
+        if (newStartSlot + newSpan > closed.length) return null;
+        plan.push({ task: task, startSlot: newStartSlot, span: newSpan });
+        frontier = newStartSlot + newSpan;
+    }
+    return plan;
+}
+
+// Positions prévues pour le dépôt d'une tâche (tâche déposée et tâches poussées), comme
+// move_task, ou null si le résultat n'est pas prévisible (règles pas encore chargées) ou si le
+// déplacement serait refusé
+function planOptimisticMove(taskElement, operatorId, startSlot) {
+    if (!planningRules || planningRules.key !== planningRulesKey) return null;
+    const operatorRow = document.querySelector(`.operator-row[data-operator-id="${operatorId}"]`);
+    if (!operatorRow) return null;
+    
+    // Durée réelle conservée : slots ouverts de la position actuelle
+    const realDuration = countOpenSlots(getClosedSlots(taskElement.dataset.operatorId),
+        parseInt(taskElement.dataset.startSlot), parseInt(taskElement.dataset.duration));
+    const closed = getClosedSlots(operatorId);
+    const newStartSlot = nextOpenStartSlot(closed, startSlot);
+    const span = computeSpanSlots(closed, newStartSlot, realDuration);
+    const plan = planPushRight(getRowTasks(operatorRow, closed), closed, newStartSlot, span, taskElement.dataset.taskId);
+    if (plan === null) return null;
+    
+    const changes = [{ element: taskElement, operatorRow: operatorRow, operator_id: operatorId, start_slot: newStartSlot, duration: span }];
+    plan.forEach(step => changes.push({
+        element: step.task.element,
+        operatorRow: operatorRow,
+        operator_id: operatorId,
+        start_slot: step.startSlot,
+        duration: step.span
+    }));
+    return changes;
+}
+
+// Applique des positions prévues et retourne les positions précédentes (annulation)
+function applyOptimisticChanges(changes) {
+    return changes.map(change => {
+        const taskElement = change.element;
+        const previous = {
+            element: taskElement,
+            operatorRow: taskElement.closest('.operator-row'),
+            operator_id: taskElement.dataset.operatorId,
+            start_slot: parseInt(taskElement.dataset.startSlot),
+            duration: parseInt(taskElement.dataset.duration)
+        };
+        placeTaskElement(taskElement, change.operatorRow, change);
+        return previous;
+    });
+}
+
+// Remet les tâches à leurs positions précédentes, sauf celles de keepTaskIds (positions
+// renvoyées par le serveur) et celles retirées du DOM entre-temps
+function rollbackOptimisticChanges(previousPositions, keepTaskIds = new Set()) {
+    previousPositions.forEach(previous => {
+        const taskElement = previous.element;
+        if (keepTaskIds.has(taskElement.dataset.taskId) || !taskElement.isConnected || !previous.operatorRow) return;
+        placeTaskElement(taskElement, previous.operatorRow, previous);
+    });
+}
+
+// Abonnement au flux SSE du planning : les modifications des autres utilisateurs (et des
+// autres processus serveur) sont appliquées dès leur enregistrement. À la reconnexion,
+// EventSource renvoie Last-Event-ID et le serveur envoie les modifications manquées.
+function setupPlanningEvents() {
+    const planningId = window.planningConfig ? window.planningConfig.planningId : null;
+    if (!planningId || !window.EventSource) return;
+    
+    planningEvents = new EventSource(`/api/planning/${planningId}/events?since=${planningVersion}&token=${planningToken}`);
+    planningEvents.addEventListener('changes', event => {
+        const data = JSON.parse(event.data);
+        if (data.full) {
+            if (data.token !== planningToken || data.version > planningVersion) {
+                updateViewport(true);
+            }
+            return;
+        }
+        if (!applyTaskChanges(data)) {
+            fetchPlanningChanges().catch(() => updateViewport(true));
+        }
+    });
+}
+
+// Vrai si la tâche tombe dans la fenêtre rendue (ligne et créneaux chargés)
+function isInLoadedViewport(operatorRow, taskData) {
+    if (!loadedViewport || !operatorRow) return false;
+    const operatorIndex = parseInt(operatorRow.dataset.operatorIndex);
+    return operatorIndex >= loadedViewport.operatorStart && operatorIndex < loadedViewport.operatorEnd &&
+        taskData.start_slot < loadedViewport.slotEnd &&
+        taskData.start_slot + taskData.duration > loadedViewport.slotStart;
+}
+
+function applyPlanningChanges(data) {
+    data.deleted.forEach(taskId => {
+        const taskElement = document.querySelector(`.operators-container .task[data-task-id="${taskId}"]`);
+        if (taskElement && !isTaskBusy(taskElement)) {
+            taskElement.remove();
+        }
+    });
+    
+    const createdTasks = [];
+    data.tasks.forEach(taskData => {
+        const operatorRow = document.querySelector(`.operator-row[data-operator-id="${taskData.operator_id}"]`);
+        let taskElement = document.querySelector(`.operators-container .task[data-task-id="${taskData.id}"]`);
+        if (taskElement && isTaskBusy(taskElement)) return;
+        
+        // Tâche sortie de la fenêtre rendue : la retirer du DOM
+        if (!isInLoadedViewport(operatorRow, taskData)) {
+            if (taskElement) {
+                if (taskElement === selectedTask) {
+                    selectedTask = null;
                 }
+                taskElement.remove();
             }
+            return;
+        }
+        
+        if (taskElement) {
+            updateTaskElement(taskElement, taskData);
+        } else {
+            taskElement = createTaskElement(taskData);
+            createdTasks.push(taskElement);
+        }
+        const wrapper = operatorRow.querySelector('.time-slots-wrapper');
+        if (taskElement.parentNode !== wrapper) {
+            wrapper.appendChild(taskElement);
         }
     });
+    
+    if (createdTasks.length > 0) {
+        setupTaskDoubleClick(createdTasks);
+    }
+    setPlanningVersion(data);
+}
+
+// Version affichée après un rendu : celle de la réponse si elle vient d'un autre historique
+// (token), sinon la plus récente des deux
+function setPlanningVersion(data) {
+    if (data.token !== planningToken) {
+        planningToken = data.token;
+        planningVersion = data.version;
+    } else {
+        planningVersion = Math.max(planningVersion, data.version);
+    }
+}
+
+// === VIRTUALISATION DE LA GRILLE ===
+
+function setupViewport() {
+    const operatorsContainer = document.querySelector('.operators-container');
+    if (operatorsContainer) {
+        operatorsContainer.addEventListener('scroll', scheduleViewportUpdate);
+    }
+    window.addEventListener('resize', scheduleViewportUpdate);
+    
+    updateViewport(true).catch(error => {
+        showNotification('Erreur lors du chargement du planning', 'error');
+    });
+}
+
+function scheduleViewportUpdate() {
+    if (viewportTimer) {
+        clearTimeout(viewportTimer);
+    }
+    viewportTimer = setTimeout(() => {
+        viewportTimer = null;
+        updateViewport(false).catch(error => {
+            showNotification('Erreur lors du chargement du planning', 'error');
+        });
+    }, 50);
+}
+
+// Plage visible : créneaux [slotStart, slotEnd) x rangs d'opérateurs [operatorStart, operatorEnd)
+function getVisibleRange() {
+    const rows = document.querySelectorAll('.operator-row');
+    const slotsContainer = document.querySelector('.time-slots-container');
+    const operatorsContainer = document.querySelector('.operators-container');
+    if (rows.length === 0 || !slotsContainer || !operatorsContainer) return null;
+    
+    const slotWidth = getSlotWidth();
+    const scrollLeft = slotsContainer.scrollLeft;
+    const rowHeight = rows[0].offsetHeight || 1;
+    const scrollTop = operatorsContainer.scrollTop;
+    
+    return {
+        slotStart: Math.max(0, Math.floor(scrollLeft / slotWidth)),
+        slotEnd: Math.min(getNumSlots(), Math.ceil((scrollLeft + slotsContainer.clientWidth) / slotWidth)),
+        operatorStart: Math.max(0, Math.floor(scrollTop / rowHeight)),
+        operatorEnd: Math.min(rows.length, Math.ceil((scrollTop + operatorsContainer.clientHeight) / rowHeight))
+    };
+}
+
+// Charge (si nécessaire) la fenêtre visible depuis /api/viewport puis la rend.
+// force=true recharge même si la fenêtre est déjà chargée (après une modification)
+function updateViewport(force = false, focusTaskId = null) {
+    const visible = getVisibleRange();
+    if (!visible) return Promise.resolve(null);
+    
+    if (!force && loadedViewport &&
+        visible.slotStart >= loadedViewport.slotStart && visible.slotEnd <= loadedViewport.slotEnd &&
+        visible.operatorStart >= loadedViewport.operatorStart && visible.operatorEnd <= loadedViewport.operatorEnd) {
+        return Promise.resolve(null);
+    }
+    
+    // Ne pas remplacer les tâches pendant un drag & drop ou un redimensionnement
+    if (draggedTask || resizeMode) {
+        scheduleViewportUpdate();
+        return Promise.resolve(null);
+    }
+    
+    const params = new URLSearchParams({
+        slot_start: Math.max(0, visible.slotStart - VIEWPORT_MARGIN_SLOTS),
+        slot_end: visible.slotEnd + VIEWPORT_MARGIN_SLOTS,
+        operator_start: Math.max(0, visible.operatorStart - VIEWPORT_MARGIN_ROWS),
+        operator_end: visible.operatorEnd + VIEWPORT_MARGIN_ROWS
+    });
+    if (focusTaskId) {
+        params.set('focus_task_id', focusTaskId);
+    }
+    
+    const requestId = ++viewportRequestId;
+    return fetch(`/api/viewport?${params}`)
+    .then(response => {
+        if (!response.ok) {
+            throw new Error(`Erreur HTTP: ${response.status}`);
+        }
+        return response.json();
+    })
+    .then(data => {
+        // Une requête plus récente a été lancée entre-temps : elle rendra la fenêtre
+        if (requestId !== viewportRequestId) return data;
+        renderViewport(data);
+        return data;
+    });
+}
+
+// Tâche en cours de manipulation : ni déplacée ni supprimée par un rendu de fenêtre
+function isTaskBusy(taskElement) {
+    return taskElement === draggedTask || taskElement.classList.contains('resizing');
+}
+
+function renderViewport(data) {
+    setPlanningVersion(data);
+    loadPlanningRules(data.rules_key);
+    loadedViewport = {
+        slotStart: data.slot_start,
+        slotEnd: data.slot_end,
+        operatorStart: data.operator_start,
+        operatorEnd: data.operator_end
+    };
+    
+    const rowsById = new Map();
+    const renderedTaskIds = new Set();
+    data.rows.forEach(row => {
+        rowsById.set(String(row.operator_id), row);
+        row.tasks.forEach(taskData => renderedTaskIds.add(String(taskData.id)));
+    });
+    
+    const existingTasks = new Map();
+    document.querySelectorAll('.operators-container .task').forEach(taskElement => {
+        existingTasks.set(taskElement.dataset.taskId, taskElement);
+    });
+    
+    const createdTasks = [];
+    document.querySelectorAll('.operator-row').forEach(operatorRow => {
+        const wrapper = operatorRow.querySelector('.time-slots-wrapper');
+        const rowData = rowsById.get(operatorRow.dataset.operatorId);
+        
+        // Retirer les fermetures et les tâches qui ne font plus partie de la fenêtre
+        wrapper.querySelectorAll('.closure-band').forEach(band => band.remove());
+        wrapper.querySelectorAll('.task').forEach(taskElement => {
+            if (!renderedTaskIds.has(taskElement.dataset.taskId) && !isTaskBusy(taskElement)) {
+                if (taskElement === selectedTask) {
+                    selectedTask = null;
+                }
+                taskElement.remove();
+            }
+        });
+        if (!rowData) return;
+        
+        const fragment = document.createDocumentFragment();
+        rowData.closures.forEach(([startSlot, length, classes]) => {
+            const band = document.createElement('div');
+            band.className = `closure-band ${classes}`;
+            band.style.left = `calc(${startSlot} * var(--slot-width))`;
+            band.style.width = `calc(${length} * var(--slot-width))`;
+            fragment.appendChild(band);
+        });
+        wrapper.insertBefore(fragment, wrapper.firstChild);
+        
+        rowData.tasks.forEach(taskData => {
+            let taskElement = existingTasks.get(String(taskData.id));
+            if (taskElement) {
+                if (isTaskBusy(taskElement)) return;
+                updateTaskElement(taskElement, taskData);
+            } else {
+                taskElement = createTaskElement(taskData);
+                createdTasks.push(taskElement);
+            }
+            // Ajouter la tâche à sa ligne (déplacement dans le DOM seulement si l'opérateur a changé)
+            if (taskElement.parentNode !== wrapper) {
+                wrapper.appendChild(taskElement);
+            }
+        });
+    });
+    
+    if (createdTasks.length > 0) {
+        setupTaskDoubleClick(createdTasks);
+    }
+}
+
+function createTaskElement(taskData) {
+    const taskElement = document.createElement('div');
+    taskElement.draggable = true;
+    taskElement.tabIndex = 0;
+    taskElement.addEventListener('dragstart', handleDragStart);
+    taskElement.addEventListener('mouseenter', showTooltip);
+    taskElement.addEventListener('mouseleave', hideTooltip);
+    taskElement.addEventListener('keydown', handleKeyDown);
+    
+    const content = document.createElement('div');
+    content.className = 'task-content';
+    taskElement.appendChild(content);
+    
+    // Poignée de redimensionnement
+    const resizeHandle = document.createElement('div');
+    resizeHandle.className = 'resize-handle resize-right';
+    resizeHandle.addEventListener('mousedown', e => startResize(e, 'right'));
+    resizeHandle.addEventListener('click', e => e.stopPropagation());
+    taskElement.appendChild(resizeHandle);
+    
+    updateTaskElement(taskElement, taskData);
+    return taskElement;
+}
+
+// Valeur d'attribut data-* identique au rendu Jinja (None pour les valeurs absentes)
+function toDataValue(value) {
+    return value === null || value === undefined ? 'None' : String(value);
+}
+
+function updateTaskElement(taskElement, taskData) {
+    const dataset = taskElement.dataset;
+    dataset.taskId = taskData.id;
+    dataset.operatorId = taskData.operator_id;
+    dataset.startSlot = taskData.start_slot;
+    dataset.duration = taskData.duration;
+    dataset.affairId = taskData.affaire_id;
+    dataset.title = toDataValue(taskData.name);
+    dataset.operationName = toDataValue(taskData.operation_name);
+    dataset.productQty = toDataValue(taskData.product_qty);
+    dataset.derniereDatePrevue = toDataValue(taskData.is_derniere_date_prevue);
+    dataset.datePrevueOf = taskData.date_prevue_of;
+    dataset.endDate = taskData.end_date;
+    dataset.employeIdsTxt = toDataValue(taskData.is_employe_ids_txt);
+    dataset.composantsNonDisponibles = toDataValue(taskData.is_composants_non_disponibles);
+    dataset.datePrevue = toDataValue(taskData.is_date_prevue);
+    dataset.affairName = toDataValue(taskData.affair_name);
+    
+    taskElement.classList.add('task');
+    taskElement.classList.toggle('task-missing-components', taskData.missing_components);
+    taskElement.classList.toggle('task-late', taskData.is_late);
+    taskElement.style.backgroundColor = taskData.background_color;
+    
+    // Ne pas écraser la position/taille si la tâche a été récemment redimensionnée
+    if (!recentlyResizedTasks.has(String(taskData.id))) {
+        // Mettre à jour seulement si nécessaire pour éviter les re-layouts inutiles
+        const newLeft = `calc(${taskData.start_slot} * var(--slot-width))`;
+        const newWidth = `calc(${taskData.duration} * var(--slot-width) - 2px)`;
+        if (taskElement.style.left !== newLeft) {
+            taskElement.style.left = newLeft;
+        }
+        if (taskElement.style.width !== newWidth) {
+            taskElement.style.width = newWidth;
+        }
+    }
+    
+    // Contenu textuel (reconstruit seulement s'il a changé)
+    let quantity = '';
+    if (taskData.product_qty) {
+        quantity = `Qt : ${Math.round(taskData.product_qty)}`;
+        if (taskData.is_derniere_date_prevue) {
+            quantity += ` - Date prévue : ${taskData.derniere_date_prevue_label}`;
+        }
+    }
+    let affair = `Affaire : ${taskData.affair_name}`;
+    if (taskData.production_name) {
+        affair += ` - OF : ${taskData.production_name}`;
+    }
+    const lines = [
+        ['task-title', taskData.name],
+        ['task-quantity', quantity],
+        ['task-operation', taskData.operation_name || ''],
+        ['task-affair', affair]
+    ];
+    const contentKey = JSON.stringify(lines);
+    if (dataset.contentKey !== contentKey) {
+        dataset.contentKey = contentKey;
+        const content = taskElement.querySelector('.task-content');
+        content.replaceChildren();
+        lines.forEach(([className, text]) => {
+            if (className !== 'task-title' && className !== 'task-affair' && !text) return;
+            const line = document.createElement('div');
+            line.className = className;
+            line.textContent = text;
+            content.appendChild(line);
+        });
+    }
 }
 
 // Notifications
@@ -737,6 +1466,10 @@ function getSlotWidth() {
     return parseFloat(getComputedStyle(document.documentElement).getPropertyValue('--slot-width'));
 }
 
+function getNumSlots() {
+    return parseInt(getComputedStyle(document.documentElement).getPropertyValue('--num-slots')) || 60;
+}
+
 function snapToSlot(position) {
     const slotWidth = getSlotWidth();
     return Math.round(position / slotWidth) * slotWidth;
@@ -956,7 +1689,12 @@ async function reloadAllData() {
             }
         });
         
-        const result = await response.json();
+        let result = await response.json();
+        
+        // Rechargement exécuté en arrière-plan : suivre son avancement jusqu'à la fin
+        if (result.success && result.job_id) {
+            result = await waitForReloadJob(result.status_url, btn, status);
+        }
         
         if (result.success) {
             // Succès
@@ -992,6 +1730,28 @@ async function reloadAllData() {
     }, 2000);
 }
 
+// Interroge /api/jobs/<id> jusqu'à la fin du rechargement en affichant l'étape en cours ;
+// retourne {success, message} comme les autres endpoints de rechargement
+async function waitForReloadJob(statusUrl, btn, status) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(statusUrl);
+        const result = await response.json();
+        if (!result.success) {
+            return result;
+        }
+        const job = result.job;
+        if (job.status === 'done') {
+            return { success: true, message: job.result.message };
+        }
+        if (job.status === 'failed') {
+            return { success: false, message: job.error };
+        }
+        btn.innerHTML = `⏳ Rechargement des données... ${job.progress}%`;
+        status.textContent = job.step;
+    }
+}
+
 async function reloadAffairs() {
     await reloadData('/api/reload-affairs', 'reload-affairs-btn', 'affaires');
 }
@@ -1064,13 +1824,14 @@ setupEventListeners = function() {
 };
 
 // Gestion du double-clic pour ouvrir les tâches dans Odoo
-function setupTaskDoubleClick() {
+// (appelée au chargement puis pour chaque lot de tâches créées par renderViewport)
+function setupTaskDoubleClick(taskElements = null) {
     console.log('setupTaskDoubleClick appelée');
     const urlTacheOdoo = window.taskOdooConfig ? window.taskOdooConfig.urlTemplate : '';
     console.log('URL template:', urlTacheOdoo);
     
     if (urlTacheOdoo) {
-        const tasks = document.querySelectorAll('.task');
+        const tasks = taskElements || document.querySelectorAll('.task');
         console.log('Nombre de tâches trouvées:', tasks.length);
         
         // Ajouter un gestionnaire de double-clic sur toutes les tâches
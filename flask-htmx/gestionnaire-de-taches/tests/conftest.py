@@ -0,0 +1,127 @@
+"""Fixtures des tests du moteur de planning : un planning en mémoire (sans PostgreSQL ni Odoo),
+servi par le client de test Flask."""
+import os
+import random
+import sys
+import types
+from datetime import date, datetime, timedelta
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+# config.py est propre à chaque installation (voir config.example.py) : configuration minimale
+# si elle est absente, aucune connexion n'est ouverte par les tests
+if 'config' not in sys.modules:
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        config = types.ModuleType('config')
+        config.DATABASE_CONFIG = {'host': 'localhost', 'database': 'test', 'user': 'test'}
+        config.DATABASE_BASE_CONFIG = {'host': 'localhost', 'user': 'test'}
+        config.DATABASES = [{'id': 'test', 'name': 'Test', 'database': 'test'}]
+        config.SECRET_KEY = 'test'
+        sys.modules['config'] = config
+
+import app as planning_app  # noqa: E402
+
+PLANNING_ID = 7
+START_DATE = date(2025, 3, 3)  # Lundi
+NUM_SLOTS = 120
+OPERATOR_IDS = (1, 2, 3)
+AFFAIR_IDS = (1, 2)
+
+
+def make_task(task_id, operator_id, affaire_id, start_date, duration_hours):
+    return planning_app.Task(
+        id=str(task_id), name=f"Tâche {task_id}", operator_id=operator_id, affaire_id=affaire_id,
+        start_date=start_date, duration_hours=duration_hours, production_id=affaire_id,
+    )
+
+
+@pytest.fixture
+def saved_tasks(monkeypatch):
+    """Enregistrements en base : liste des lots de tâches passés à
+    update_multiple_tasks_in_database (toujours réussis)"""
+    batches = []
+
+    def update_multiple_tasks_in_database(tasks_data):
+        batches.append(tasks_data)
+        return True
+
+    monkeypatch.setattr(planning_app, 'update_multiple_tasks_in_database', update_multiple_tasks_in_database)
+    return batches
+
+
+@pytest.fixture
+def planning(saved_tasks):
+    """Planning chargé dans PLANNING_CACHE : 3 opérateurs avec absences, des congés, et des
+    tâches sans chevauchement placées sur des slots ouverts. Le thread de test est lié au
+    planning comme une requête"""
+    rnd = random.Random(42)
+    planning = planning_app.PlanningContext(None, PLANNING_ID)
+    planning.loaded = True
+    planning.meta = {'id': PLANNING_ID, 'name': 'Test', 'type_donnees': 'operation', 'write_date': None,
+                     'maj_of_auto': False, 'date_fin_planning': None}
+    planning.meta_checked_at = float('inf')  # Pas de contrôle de write_date en base
+    planning.start_date = START_DATE
+    planning.num_slots = NUM_SLOTS
+    planning.vacation_dates = [datetime(2025, 3, 19, 8), datetime(2025, 3, 19, 14), datetime(2025, 4, 2, 14)]
+    operators = []
+    for operator_id in OPERATOR_IDS:
+        absence_day = START_DATE + timedelta(days=rnd.randint(1, 40))
+        operators.append({"id": operator_id, "name": f"Opérateur {operator_id}",
+                          "absences": [datetime(absence_day.year, absence_day.month, absence_day.day, 8)]})
+    affairs = [{"id": affaire_id, "name": f"Affaire {affaire_id}", "color": "#808080"} for affaire_id in AFFAIR_IDS]
+    planning.store = planning_app.PlanningStore(operators=operators, affairs=affairs)
+
+    planning_app.PLANNING_CACHE.clear()
+    planning_app.PLANNING_CACHE[planning.key] = planning
+    planning_app.bind_request_context(None, PLANNING_ID)
+    planning_app.build_closure_indexes()
+
+    # Tâches placées de gauche à droite, chacune sur le premier slot ouvert après la précédente
+    tasks = []
+    task_id = 1
+    for operator_id in OPERATOR_IDS:
+        slot = rnd.randint(0, 4)
+        while True:
+            duration_hours = planning_app.HALF_DAY_HOURS * rnd.randint(1, 5)
+            slot = planning_app.next_open_start_slot(operator_id, slot, direction=1)
+            span = planning_app.compute_span_slots(slot, planning_app.hours_to_slots(duration_hours), operator_id)
+            if slot + span > NUM_SLOTS - 20:
+                break
+            tasks.append(make_task(task_id, operator_id, rnd.choice(AFFAIR_IDS),
+                                   planning_app.slot_to_date(slot), duration_hours))
+            task_id += 1
+            slot += span + rnd.randint(0, 3)
+    planning.store.set_tasks(tasks)
+    planning_app.publish_planning_snapshot()
+
+    yield planning
+
+    planning_app.unbind_request_context()
+    planning_app.PLANNING_CACHE.clear()
+
+
+@pytest.fixture
+def client(planning):
+    """Client de test dont la session a choisi le planning"""
+    test_client = planning_app.app.test_client()
+    with test_client.session_transaction() as session:
+        session['database_id'] = None
+        session['planning_id'] = PLANNING_ID
+    planning_app.bind_request_context(None, PLANNING_ID)
+    return test_client
+
+
+@pytest.fixture
+def bind():
+    """Relie le thread de test au planning (chaque requête du client de test le délie en fin de
+    requête) : à appeler avant d'inspecter le planning après une requête"""
+    def bind_planning():
+        planning_app.bind_request_context(None, PLANNING_ID)
+        return planning_app.get_planning_context()
+    return bind_planning
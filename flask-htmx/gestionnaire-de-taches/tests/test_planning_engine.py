@@ -0,0 +1,243 @@
+"""Invariants du moteur de planning : poussées, résolution des collisions, déplacements groupés,
+annulation en mémoire quand l'enregistrement échoue, versions et instantanés."""
+import random
+
+import app as planning_app
+from conftest import NUM_SLOTS, OPERATOR_IDS
+
+
+def get_layout():
+    """Position de chaque tâche : id -> (opérateur, slot de début, span)"""
+    store = planning_app.get_planning_context().store
+    layout = {}
+    for task in store.tasks:
+        start_slot = planning_app.get_task_start_slot(task)
+        layout[task["id"]] = (task["operator_id"], start_slot, planning_app.get_task_span_slots(task, start_slot))
+    return layout
+
+
+def assert_valid_planning():
+    """Aucun chevauchement sur une ligne, tâches dans l'horizon et débutant sur un slot ouvert,
+    index des lignes à jour"""
+    store = planning_app.get_planning_context().store
+    for operator_id in OPERATOR_IDS:
+        row = sorted((start_slot, start_slot + span_slots, task_id)
+                     for task_id, (task_operator_id, start_slot, span_slots) in get_layout().items()
+                     if task_operator_id == operator_id)
+        for start_slot, end_slot, task_id in row:
+            assert 0 <= start_slot and end_slot <= NUM_SLOTS, task_id
+            assert planning_app.next_open_start_slot(operator_id, start_slot) == start_slot, task_id
+        for (_start, end_slot, task_id), (next_start, _end, next_id) in zip(row, row[1:]):
+            assert end_slot <= next_start, (task_id, next_id)
+        index = store.get_row_index(operator_id)
+        assert sorted(zip(index.starts, index.ends)) == [(start, end) for start, end, _id in row]
+
+
+def assert_snapshot_matches_store():
+    planning = planning_app.get_planning_context()
+    snapshot_layout = {task["id"]: (task["operator_id"], planning_app.get_task_start_slot(task))
+                       for task in planning.snapshot.store.tasks}
+    assert snapshot_layout == {task_id: position[:2] for task_id, position in get_layout().items()}
+    assert planning.snapshot.store.version == planning.store.version
+
+
+def operator_tasks(operator_id):
+    layout = get_layout()
+    return sorted((task_id for task_id, position in layout.items() if position[0] == operator_id),
+                  key=lambda task_id: layout[task_id][1])
+
+
+def random_command(rnd, task_ids):
+    task_id = rnd.choice(task_ids)
+    kind = rnd.choice(['move', 'keyboard', 'resize', 'resize_and_move'])
+    if kind == 'move':
+        return '/move_task', {'task_id': task_id, 'operator_id': rnd.choice(OPERATOR_IDS),
+                              'start_slot': rnd.randint(0, NUM_SLOTS - 10)}
+    if kind == 'keyboard':
+        return '/keyboard_move_task', {'task_id': task_id, 'direction': rnd.choice(['left', 'right', 'up', 'down'])}
+    if kind == 'resize':
+        return '/resize_task', {'task_id': task_id, 'duration': rnd.randint(1, 6)}
+    return '/resize_and_move_task', {'task_id': task_id, 'operator_id': rnd.choice(OPERATOR_IDS),
+                                     'start_slot': rnd.randint(0, NUM_SLOTS - 10), 'duration': rnd.randint(1, 6)}
+
+
+def test_initial_planning_is_valid(planning):
+    assert_valid_planning()
+
+
+def test_random_commands_keep_planning_valid(client, bind):
+    rnd = random.Random(1)
+    task_ids = sorted(get_layout())
+    for _ in range(150):
+        url, data = random_command(rnd, task_ids)
+        bind()
+        before = get_layout()
+        version = planning_app.get_planning_context().store.version
+        result = client.post(url, json=data).get_json()
+        bind()
+        assert_valid_planning()
+        assert_snapshot_matches_store()
+        after = get_layout()
+        if not result["success"]:
+            assert after == before, (url, data)
+            continue
+        # La réponse contient toutes les tâches déplacées (tâche cible et tâches poussées)
+        changed_ids = {task_id for task_id in after if after[task_id] != before[task_id]}
+        assert changed_ids <= {change["id"] for change in result["changes"]}, (url, data)
+        assert result["version"] == planning_app.get_planning_context().store.version
+        assert result["version"] == version + (1 if changed_ids else 0)
+
+
+def test_move_pushes_colliding_tasks_right(client, bind, saved_tasks):
+    first_id, second_id = operator_tasks(1)[:2]
+    layout = get_layout()
+    task_id = operator_tasks(2)[0]
+    result = client.post('/move_task', json={'task_id': task_id, 'operator_id': 1,
+                                             'start_slot': layout[first_id][1]}).get_json()
+    assert result["success"]
+    bind()
+    assert_valid_planning()
+    layout = get_layout()
+    _operator_id, start_slot, span_slots = layout[task_id]
+    assert layout[first_id][1] >= start_slot + span_slots
+    assert {first_id, task_id} <= {change["id"] for change in result["changes"]}
+    # Un seul enregistrement en base pour la tâche et les tâches poussées
+    assert len(saved_tasks) == 1
+    assert {task_data["id"] for task_data in saved_tasks[0]} == {change["id"] for change in result["changes"]}
+
+
+def test_plan_push_without_room_changes_nothing(planning):
+    before = get_layout()
+    assert planning_app.plan_push(1, 0, NUM_SLOTS) is None
+    assert planning_app.push_tasks(1, 0, NUM_SLOTS) is None
+    assert get_layout() == before
+
+
+def test_resolve_collisions_removes_overlaps(planning):
+    store = planning.store
+    task_ids = operator_tasks(1)[:4]
+    start_slot = get_layout()[task_ids[0]][1]
+    # Empiler les tâches au même slot, la dernière étant celle que l'utilisateur vient de placer
+    for task_id in task_ids:
+        task = store.get_task(task_id)
+        planning_app.update_task_from_slots(task, start_slot, planning_app.get_task_duration_slots(task))
+    planning_app.resolve_all_collisions_on_operator(1, anchor_task_id=task_ids[-1])
+    assert_valid_planning()
+    assert get_layout()[task_ids[-1]][1] == start_slot
+
+
+def test_move_tasks_moves_group_in_one_save(client, bind, saved_tasks):
+    bind()
+    layout = get_layout()
+    store = planning_app.get_planning_context().store
+    group_ids = [task["id"] for task in store.tasks if task["affaire_id"] == 1]
+    result = client.post('/move_tasks', json={'affaire_id': 1, 'offset': 3}).get_json()
+    assert result["success"]
+    assert result["moved"] == len(group_ids)
+    assert len(saved_tasks) == 1
+    bind()
+    assert_valid_planning()
+    after = get_layout()
+    for operator_id in OPERATOR_IDS:
+        # Ordre des tâches du groupe conservé sur chaque ligne
+        row_group = [task_id for task_id in group_ids if layout[task_id][0] == operator_id]
+        assert sorted(row_group, key=lambda task_id: layout[task_id][1]) == \
+            sorted(row_group, key=lambda task_id: after[task_id][1])
+        for task_id in row_group:
+            assert after[task_id][1] >= layout[task_id][1] + 3
+
+
+def test_move_tasks_counts_distinct_tasks(client):
+    task_ids = operator_tasks(1)[:2]
+    result = client.post('/move_tasks', json={'task_ids': task_ids + task_ids[:1], 'offset': 1}).get_json()
+    assert result["success"]
+    assert result["moved"] == 2
+
+
+def test_failed_database_write_rolls_back(client, bind, monkeypatch):
+    monkeypatch.setattr(planning_app, 'update_multiple_tasks_in_database', lambda tasks_data: False)
+    bind()
+    before = get_layout()
+    version = planning_app.get_planning_context().store.version
+    rnd = random.Random(2)
+    for _ in range(30):
+        url, data = random_command(rnd, sorted(before))
+        client.post(url, json=data)  # Réussite seulement si rien n'était à enregistrer
+        bind()
+        assert get_layout() == before
+        assert planning_app.get_planning_context().store.version == version
+        assert planning_app.get_planning_context().store.pending_changes == {}
+        assert_snapshot_matches_store()
+
+
+def test_exception_during_command_rolls_back(client, bind, monkeypatch):
+    def persist_task_changes():
+        raise RuntimeError("connexion perdue")
+
+    monkeypatch.setattr(planning_app, 'persist_task_changes', persist_task_changes)
+    bind()
+    before = get_layout()
+    first_id = operator_tasks(1)[0]
+    for url, data in (('/move_task', {'task_id': operator_tasks(2)[0], 'operator_id': 1,
+                                      'start_slot': before[first_id][1]}),
+                      ('/move_tasks', {'affaire_id': 1, 'offset': 2}),
+                      ('/apply_commands', {'commands': [{'type': 'resize', 'task_id': first_id, 'duration': 6}]})):
+        assert not client.post(url, json=data).get_json()["success"]
+        bind()
+        assert get_layout() == before
+        assert_snapshot_matches_store()
+
+
+def test_apply_commands_is_all_or_nothing(client, bind, saved_tasks):
+    bind()
+    before = get_layout()
+    task_id = operator_tasks(1)[0]
+    result = client.post('/apply_commands', json={'commands': [
+        {'type': 'keyboard_move', 'task_id': task_id, 'direction': 'right'},
+        {'type': 'move', 'task_id': 'inconnue', 'operator_id': 1, 'start_slot': 0},
+    ]}).get_json()
+    assert not result["success"]
+    assert result["failed_command"] == 1
+    bind()
+    assert get_layout() == before
+    assert saved_tasks == []
+
+
+def test_preview_matches_move(client, bind):
+    rnd = random.Random(3)
+    task_ids = sorted(get_layout())
+    for _ in range(40):
+        task_id = rnd.choice(task_ids)
+        operator_id = rnd.choice(OPERATOR_IDS)
+        start_slot = rnd.randint(0, NUM_SLOTS - 10)
+        preview = client.get('/preview_move', query_string={'task_id': task_id, 'operator_id': operator_id,
+                                                            'start_slot': start_slot}).get_json()
+        result = client.post('/move_task', json={'task_id': task_id, 'operator_id': operator_id,
+                                                 'start_slot': start_slot}).get_json()
+        assert result["success"] == (not preview["blocked"])
+        if not result["success"]:
+            continue
+        assert not preview["approximate"]
+        bind()
+        layout = get_layout()
+        assert layout[task_id] == (operator_id, preview["start_slot"], preview["duration"])
+        for pushed in preview["pushed"]:
+            assert layout[pushed["id"]] == (pushed["operator_id"], pushed["start_slot"], pushed["duration"])
+
+
+def test_changes_since_is_limited_to_the_store_history(client, bind):
+    bind()
+    store = planning_app.get_planning_context().store
+    version, token = store.version, store.token
+    task_id = operator_tasks(1)[0]
+    result = client.post('/keyboard_move_task', json={'task_id': task_id, 'direction': 'right'}).get_json()
+    assert result["success"] and result["token"] == token
+
+    changed, deleted = store.changes_since(version, token)
+    assert task_id in {task["id"] for task in changed} and deleted == []
+    assert store.changes_since(version, 'autre') is None
+    assert store.changes_since(store.base_version - 1, token) is None
+
+    delta = client.get('/get_planning_data', query_string={'since': version, 'token': token}).get_json()
+    assert not delta["full"] and task_id in {task["id"] for task in delta["tasks"]}
+    assert client.get('/get_planning_data', query_string={'since': version, 'token': 'autre'}).get_json()["full"]
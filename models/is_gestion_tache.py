@@ -719,6 +719,24 @@ class is_gestion_tache_planning(models.Model):
 
 
 
+    def action_maj_date_of_et_chargement_taches(self):
+        """Enchaîne action_maj_date_of et action_chargement_taches en un seul appel XML-RPC
+        (rechargement depuis l'application de planification).
+        Chaque action s'exécute dans un savepoint : l'échec de l'une n'annule pas l'autre.
+        Retourne {'maj_date_of': bool, 'chargement_taches': bool}"""
+        result = {}
+        for key, action in (('maj_date_of', self.action_maj_date_of),
+                            ('chargement_taches', self.action_chargement_taches)):
+            try:
+                with self.env.cr.savepoint():
+                    action()
+                result[key] = True
+            except Exception:
+                _logger.exception("Planning %s : %s en échec", self.ids, key)
+                result[key] = False
+        return result
+
+
     def action_maj_date_operation(self):
         """Ajuste heure_debut des opérations (is.ordre.travail.line) depuis les start_date des tâches,
         puis recalcule les opérations suivantes de chaque OT en conservant la logique actuelle (au plus tôt).
@@ -949,3 +967,61 @@ class is_gestion_tache(models.Model):
     product_qty      = fields.Float(string="Reste à produire")
     is_derniere_date_prevue = fields.Date("Dernière date prévue")
 
+    def init(self):
+        """Triggers de notification : chaque écriture dans is_gestion_tache émet un NOTIFY sur le
+        canal 'is_gestion_tache' avec l'id du planning et les ids des tâches modifiées, pour que
+        chaque processus de l'interface Flask recharge seulement ces tâches.
+        Au-delà de 500 tâches (chargement complet), task_ids est null : le planning est rechargé
+        en entier (la taille d'une notification est limitée à 8000 octets)"""
+        cr=self._cr
+        cr.execute("""
+            CREATE OR REPLACE FUNCTION is_gestion_tache_send_notify(p_planning_id integer, p_task_ids integer[])
+            RETURNS void AS $$
+            BEGIN
+                PERFORM pg_notify('is_gestion_tache', json_build_object(
+                    'planning_id', p_planning_id,
+                    'task_ids', CASE WHEN cardinality(p_task_ids) <= 500 THEN p_task_ids END
+                )::text);
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION is_gestion_tache_notify() RETURNS trigger AS $$
+            DECLARE
+                rec record;
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    FOR rec IN SELECT planning_id, array_agg(id) AS task_ids FROM new_rows
+                               WHERE planning_id IS NOT NULL GROUP BY planning_id LOOP
+                        PERFORM is_gestion_tache_send_notify(rec.planning_id, rec.task_ids);
+                    END LOOP;
+                ELSIF TG_OP = 'UPDATE' THEN
+                    FOR rec IN SELECT planning_id, array_agg(DISTINCT id) AS task_ids
+                               FROM (SELECT planning_id, id FROM new_rows
+                                     UNION ALL SELECT planning_id, id FROM old_rows) AS rows
+                               WHERE planning_id IS NOT NULL GROUP BY planning_id LOOP
+                        PERFORM is_gestion_tache_send_notify(rec.planning_id, rec.task_ids);
+                    END LOOP;
+                ELSE
+                    FOR rec IN SELECT planning_id, array_agg(id) AS task_ids FROM old_rows
+                               WHERE planning_id IS NOT NULL GROUP BY planning_id LOOP
+                        PERFORM is_gestion_tache_send_notify(rec.planning_id, rec.task_ids);
+                    END LOOP;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS is_gestion_tache_notify_insert ON is_gestion_tache;
+            DROP TRIGGER IF EXISTS is_gestion_tache_notify_update ON is_gestion_tache;
+            DROP TRIGGER IF EXISTS is_gestion_tache_notify_delete ON is_gestion_tache;
+            CREATE TRIGGER is_gestion_tache_notify_insert AFTER INSERT ON is_gestion_tache
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE PROCEDURE is_gestion_tache_notify();
+            CREATE TRIGGER is_gestion_tache_notify_update AFTER UPDATE ON is_gestion_tache
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE PROCEDURE is_gestion_tache_notify();
+            CREATE TRIGGER is_gestion_tache_notify_delete AFTER DELETE ON is_gestion_tache
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE PROCEDURE is_gestion_tache_notify();
+        """)
+